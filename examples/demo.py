@@ -33,7 +33,12 @@ class config:
     template_extension = '.html'
 
 
-httpd = wsgiref.simple_server.make_server('', 8000, Adapter({'debug': DebugApp(config())}))
-print("Serving on port 8000...")
+# Serve with multiple processes with: python -m handywsgi.server demo:application
+application = Adapter({'debug': DebugApp(config())})
 
-httpd.serve_forever()
+
+if __name__ == '__main__':
+    httpd = wsgiref.simple_server.make_server('', 8000, application)
+    print("Serving on port 8000...")
+
+    httpd.serve_forever()
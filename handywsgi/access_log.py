@@ -0,0 +1,211 @@
+""" Structured access log written off the request path.
+
+``Adapter`` puts one record per request on an in-memory queue and a background
+thread writes them as JSON lines in batches, so requests never wait for disk
+I/O. When the queue backs up records are sampled or dropped and counted, as are
+records lost because the file couldn't be opened or written.
+
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import weakref
+
+
+logger = logging.getLogger(__name__)
+
+# Tells the writer thread to flush and exit.
+_STOP = object()
+
+
+class AccessLog:
+    """ Write access records to a size-rotated file from a background thread.
+
+    Args:
+        filename (str): The log file. ``{pid}`` is replaced by the process id,
+            which gives every prefork worker its own file.
+        max_bytes (int): Rotate when the file would grow past this size.
+            Defaults to 100 MiB, 0 disables rotation. Processes forked after
+            the log was created only rotate a ``filename`` with ``{pid}``;
+            they can't coordinate rotating a file they share.
+        backups (int): Rotated files kept as ``filename.1`` to
+            ``filename.<backups>``. Defaults to 5.
+        max_queue (int): Records that may wait for the writer. Defaults to 10000.
+        batch_size (int): Records written per batch. Defaults to 500.
+        flush_interval (float): Seconds the writer waits to fill a batch.
+            Defaults to 1.0.
+        overflow (str): ``'drop'`` drops records while the queue is full.
+            ``'sample'`` also keeps only ``sample_rate`` of the records once the
+            queue is half full. Defaults to ``'drop'``.
+        sample_rate (float): See ``overflow``. Defaults to 0.1.
+
+    """
+
+    def __init__(self, filename, max_bytes=100 * 1024 * 1024, backups=5, max_queue=10000,
+                 batch_size=500, flush_interval=1.0, overflow='drop', sample_rate=0.1):
+        if overflow not in ('drop', 'sample'):
+            raise ValueError('overflow must be "drop" or "sample"')
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._written = 0
+        self._dropped = 0
+        self._sampled_out = 0
+        self._failed = 0
+        self._forked = False
+        after_fork = weakref.WeakMethod(self._after_fork)
+        os.register_at_fork(after_in_child=lambda: after_fork() and after_fork()())
+
+    def _after_fork(self):
+        self._forked = True
+
+    def _start(self):
+        """ Start the writer of this process. Call with ``_lock`` held. """
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.max_queue)
+        self._thread = threading.Thread(target=self._write, args=(self._queue,), name='handywsgi-access-log', daemon=True)
+        self._thread.start()
+
+    def log(self, **record):
+        """ Queue a record. Never blocks.
+
+        Keyword Arguments:
+            ...: The fields of the record, ``time`` is added.
+
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._closed:
+                    self._dropped += 1
+                    return
+                if self._pid != os.getpid():
+                    self._start()
+        records = self._queue
+        if self.overflow == 'sample' and records.qsize() * 2 >= self.max_queue:
+            if random.random() >= self.sample_rate:
+                with self._lock:
+                    self._sampled_out += 1
+                return
+        record['time'] = time.time()
+        try:
+            records.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    def _write(self, records):
+        filename = self.filename.format(pid=os.getpid())
+        rotate = bool(self.max_bytes)
+        if rotate and self._forked and '{pid}' not in self.filename:
+            logger.error('not rotating %s, it is shared by forked processes; put {pid} in its name', filename)
+            rotate = False
+        log_file = None
+        failing = False
+        try:
+            stopping = False
+            while not stopping:
+                try:
+                    record = records.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                batch = []
+                while True:
+                    if record is _STOP:
+                        stopping = True
+                        break
+                    batch.append(record)
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        record = records.get_nowait()
+                    except queue.Empty:
+                        break
+                if not batch:
+                    continue
+                data = b''.join(
+                        json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n' for record in batch
+                        )
+                try:
+                    if log_file is None:
+                        log_file = open(filename, 'ab')
+                    if rotate and log_file.tell() + len(data) > self.max_bytes and log_file.tell():
+                        log_file.close()
+                        log_file = None
+                        self._rotate(filename)
+                        log_file = open(filename, 'ab')
+                    log_file.write(data)
+                    log_file.flush()
+                except OSError:
+                    # Logged once per run of failures, the file is opened again for the next batch.
+                    if not failing:
+                        logger.exception('failed writing %d access log records to %s', len(batch), filename)
+                    failing = True
+                    with self._lock:
+                        self._failed += len(batch)
+                    continue
+                failing = False
+                with self._lock:
+                    self._written += len(batch)
+        finally:
+            if log_file is not None:
+                log_file.close()
+
+    def _rotate(self, filename):
+        """ Shift ``filename.N`` to ``filename.N+1`` and ``filename`` to ``filename.1``. """
+        if not self.backups:
+            os.remove(filename)
+            return
+        for index in range(self.backups - 1, 0, -1):
+            source = '{}.{}'.format(filename, index)
+            if os.path.exists(source):
+                os.replace(source, '{}.{}'.format(filename, index + 1))
+        os.replace(filename, filename + '.1')
+
+    def close(self, timeout=None):
+        """ Write the queued records and stop the writer.
+
+        Returns:
+            bool: True if everything was written within ``timeout`` seconds.
+
+        """
+        with self._lock:
+            self._closed = True
+            if self._pid != os.getpid():
+                return True
+            thread, self._pid = self._thread, None
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return False
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def collect(self):
+        """ Yield Prometheus lines for ``handywsgi.metrics.Metrics.register``. """
+        with self._lock:
+            written, dropped, sampled_out, failed = self._written, self._dropped, self._sampled_out, self._failed
+            depth = self._queue.qsize() if self._queue and self._pid == os.getpid() else 0
+        yield '# HELP handywsgi_access_log_queue_depth Access log records waiting for the writer.'
+        yield '# TYPE handywsgi_access_log_queue_depth gauge'
+        yield 'handywsgi_access_log_queue_depth {}'.format(depth)
+        yield '# HELP handywsgi_access_log_records_total Access log records by outcome.'
+        yield '# TYPE handywsgi_access_log_records_total counter'
+        yield 'handywsgi_access_log_records_total{{outcome="written"}} {}'.format(written)
+        yield 'handywsgi_access_log_records_total{{outcome="dropped"}} {}'.format(dropped)
+        yield 'handywsgi_access_log_records_total{{outcome="sampled_out"}} {}'.format(sampled_out)
+        yield 'handywsgi_access_log_records_total{{outcome="failed"}} {}'.format(failed)
@@ -1,22 +1,104 @@
 
+import functools
 import os
+import time
 
 from .context import Context
-from . import status
+from . import status, headers, caching, fast, metrics as metrics_, pool as pool_, tasks as tasks_
 
 
 class Adapter:
     """ A WSGI to app adapter.
 
     Attributes:
-        storage (dict):
+        storage (dict): App-lifetime objects shared by all requests, e.g. the
+            ``pools`` for ``Context.resource``.
+        metrics (handywsgi.metrics.Metrics): Request metrics or None if disabled.
+        profiler (handywsgi.profiler.Profiler): Request profiler or None if disabled.
+        memory (handywsgi.memory.MemoryProfiler): Memory sampler or None if disabled.
+        tracer (handywsgi.tracing.Tracer): Request tracer or None if disabled.
+        limiter (handywsgi.limits.ConcurrencyLimiter): Concurrency limiter or None if disabled.
+        rate_limiter (handywsgi.limits.RateLimiter): Rate limiter or None if disabled.
+        tasks (handywsgi.tasks.TaskQueue): Background task queue or None.
+        access_log (handywsgi.access_log.AccessLog): Access log or None if disabled.
+        coalescer (handywsgi.coalesce.Coalescer): Request coalescer or None if disabled.
+        batch (handywsgi.batch.BatchEndpoint): Batch endpoint or None if disabled.
+        cache_policy (handywsgi.caching.CachePolicy): Default caching policy or None.
+        offloader (handywsgi.offload.Offloader): Process pool shut down by
+            ``close`` or None.
+        fast_routes (dict): Fast-path routes keyed by ``PATH_INFO``.
+
+    Args:
+        apps (dict): Apps keyed by the first URI path segment.
+        default_app (callable): The app for ``/``. Defaults to an index of ``apps``.
+        metrics (handywsgi.metrics.Metrics): Enables metrics collection and
+            serves them at ``metrics.path``.
+        profiler (handywsgi.profiler.Profiler): Enables sampled profiling and
+            slow request logging.
+        memory (handywsgi.memory.MemoryProfiler): Enables ``tracemalloc``
+            sampling of requests.
+        tracer (handywsgi.tracing.Tracer): Enables request tracing.
+        limiter (handywsgi.limits.ConcurrencyLimiter): Caps the requests in
+            flight and sheds the excess with a ``503``.
+        rate_limiter (handywsgi.limits.RateLimiter): Limits the request rate
+            per client with ``429`` responses.
+        tasks (handywsgi.tasks.TaskQueue): Runs ``context.add_task`` tasks.
+            Without one they run in the server thread after the response.
+        access_log (handywsgi.access_log.AccessLog): Records every request.
+        coalescer (handywsgi.coalesce.Coalescer): Lets concurrent identical
+            ``GET``s share one response.
+        batch (handywsgi.batch.BatchEndpoint): Serves batches of sub-requests
+            at ``batch.path``.
+        cache_policy (handywsgi.caching.CachePolicy): Caching headers of apps
+            that set no ``cache_policy`` themselves (see ``handywsgi.caching``).
+        pools (dict): ``handywsgi.pool.Pool`` by name, added to ``storage``
+            for ``Context.resource``.
+        data_cache (handywsgi.cache.DataCache): Stored as ``storage['cache']``
+            for ``Context.cache``, so no pool may be named ``cache``.
+        fast_routes (dict): Responses or ``handler(environ)`` callables keyed
+            by the exact ``PATH_INFO`` they answer, ahead of everything else
+            (see ``handywsgi.fast``). They are not counted in metrics or the
+            access log.
+        offloader (handywsgi.offload.Offloader): The process pool of
+            offloaded handlers, for its metrics and ``close``.
 
     """
 
-    def __init__(self, apps, default_app=None):
+    def __init__(self, apps, default_app=None, metrics=None, profiler=None, memory=None,
+                 tracer=None, limiter=None, rate_limiter=None, tasks=None,
+                 access_log=None, coalescer=None, batch=None,
+                 cache_policy=None, pools=None, data_cache=None, fast_routes=None,
+                 offloader=None):
+        self.fast_routes = dict(fast_routes or {})
         self._apps = apps
         self._apps[''] = default_app or self._index
         self.storage = {}
+        pools = pools or {}
+        for name, resource_pool in pools.items():
+            resource_pool.name = resource_pool.name or name
+            self.storage[name] = resource_pool
+        if data_cache is not None:
+            if 'cache' in self.storage:
+                raise ValueError("a pool named 'cache' collides with data_cache, which is storage['cache']")
+            self.storage['cache'] = data_cache
+        self.metrics = metrics
+        self.profiler = profiler
+        self.memory = memory
+        self.tracer = tracer
+        self.limiter = limiter
+        self.rate_limiter = rate_limiter
+        self.tasks = tasks
+        self.access_log = access_log
+        self.coalescer = coalescer
+        self.batch = batch
+        self.cache_policy = cache_policy
+        self.offloader = offloader
+        if metrics:
+            for collector in (profiler, memory, limiter, rate_limiter, tasks, access_log, data_cache, offloader):
+                if collector:
+                    metrics.register(collector)
+            if pools:
+                metrics.register(pool_.PoolCollector(pools))
 
     def _index(self, context):
         """ Creates an index page based on apps in the ``Adapter`` instance. """
@@ -27,29 +109,248 @@ class Adapter:
                     ))
         context.response.output.write(''.join(page))
 
-    def __call__(self, environ, start_response):
-        """ WSGI entry point. """
-        context = Context(environ, start_response)
-        raw_uri_path = context.request.query.path
+    def _route(self, raw_uri_path):
+        """ Returns the app key for ``raw_uri_path`` or None if there is no match. """
         uri_path = raw_uri_path.strip('/').strip()
         if uri_path not in self._apps:
             uri_path = os.path.dirname(uri_path)
             if uri_path not in self._apps:
-                context.response.status = status.NotFound(uri_path or '/')
-        app = self._apps.get(uri_path, self._index)
-        self._run_app(app, context)
-        start_response(
-                context.response.status.status,
-                context.response.headers.items()
+                return None
+        return uri_path
+
+    @staticmethod
+    def _label(route):
+        """ Returns the metrics label for an app key from ``_route``. """
+        if route is None:
+            return 'not_found'
+        return route or '/'
+
+    def __call__(self, environ, start_response):
+        """ WSGI entry point. """
+        raw_uri_path = environ.get('PATH_INFO') or ''
+        if self.fast_routes:
+            route = self.fast_routes.get(raw_uri_path)
+            if route is not None:
+                return fast.serve(route, environ, start_response)
+        if self.metrics and raw_uri_path.strip('/') == self.metrics.path:
+            return self._serve_metrics(start_response)
+        if self.batch and raw_uri_path.strip('/') == self.batch.path:
+            started = time.perf_counter()
+            rejected = self._limit_rate(environ, start_response, started)
+            if rejected is not None:
+                return rejected
+            return self.batch(self, environ, start_response)
+        return self.handle(environ, start_response)
+
+    def handle(self, environ, start_response):
+        """ Serve a request through the rate limiter, the router and the app.
+
+        This is ``__call__`` without the fast routes, the metrics path and the
+        batch endpoint; ``handywsgi.batch`` runs every sub-request through it.
+
+        """
+        started = time.perf_counter()
+        rejected = self._limit_rate(environ, start_response, started)
+        if rejected is not None:
+            return rejected
+        route = self._route(environ.get('PATH_INFO') or '')
+        label = self._label(route)
+        routed = time.perf_counter()
+        if self.coalescer:
+            key = self.coalescer.key(environ, label)
+            if key is not None:
+                respond = functools.partial(self._respond, route=route, label=label, started=started, routed=routed)
+                body, code = self.coalescer.call(key, environ, start_response, respond)
+                if code is not None:
+                    elapsed = time.perf_counter() - started
+                    if self.metrics:
+                        self.metrics.observe(label, code, elapsed, {})
+                    if self.access_log:
+                        self._log_access(environ, label, code, sum(len(data) for data in body), elapsed)
+                return body
+        return self._respond(environ, start_response, route, label, started, routed)
+
+    def _limit_rate(self, environ, start_response, started):
+        """ Returns the ``429`` body if the client is over its rate, else None. """
+        if not self.rate_limiter:
+            return None
+        wait = self.rate_limiter.check(environ)
+        if not wait:
+            return None
+        elapsed = time.perf_counter() - started
+        if self.metrics:
+            self.metrics.observe('rate_limited', 429, elapsed, {})
+        if self.access_log:
+            self._log_access(environ, 'rate_limited', 429, None, elapsed)
+        return self.rate_limiter.reject(start_response, wait)
+
+    def _respond(self, environ, start_response, route, label, started, routed):
+        """ Run a routed request through the limiter, the app and the instrumentation. """
+        raw_uri_path = environ.get('PATH_INFO') or ''
+        if self.limiter and not self.limiter.acquire(label):
+            elapsed = time.perf_counter() - started
+            if self.metrics:
+                self.metrics.observe(label, 503, elapsed, {})
+            if self.access_log:
+                self._log_access(environ, label, 503, None, elapsed)
+            return self.limiter.reject(start_response)
+        sample = self.memory.start() if self.memory else None
+        context = None
+        try:
+            context = Context(environ, start_response, self.storage)
+            built = time.perf_counter()
+            trace = self.tracer.start() if self.tracer else None
+            if trace:
+                trace.add('routing', started, routed)
+                trace.add('context', routed, built)
+                context.trace = trace
+            if route is None:
+                context.response.status = status.NotFound(raw_uri_path.strip('/').strip() or '/')
+            app = self._apps.get(route, self._index)
+            self._run_app(app, context, label)
+            policy = caching.policy_for(app, environ.get('REQUEST_METHOD'), self.cache_policy)
+            if policy is not None:
+                policy.apply(context)
+            ran = time.perf_counter()
+            start_response(
+                    context.response.status.status,
+                    context.response.headers.items()
+                    )
+            body = context.response.body
+            if environ.get('REQUEST_METHOD') == 'HEAD':
+                if hasattr(body, 'close'):
+                    body.close()
+                body = b''
+            elif body is None:
+                body = context.response.output.read_bytes()
+            finished = time.perf_counter()
+            if trace:
+                trace.add('handler', built, ran)
+                trace.add('encode', ran, finished)
+                trace.finish(
+                        'request',
+                        started,
+                        finished,
+                        method=environ.get('REQUEST_METHOD'),
+                        path=raw_uri_path,
+                        status=context.response.status.status
+                        )
+            code = int(context.response.status.status.split(' ', 1)[0])
+            if self.access_log:
+                self._log_access(
+                        environ,
+                        label,
+                        code,
+                        len(body) if isinstance(body, bytes) else None,
+                        finished - started
+                        )
+            if self.metrics:
+                timings = context.timings
+                timings['routing'] = routed - started
+                timings['context'] = built - routed
+                timings['handler'] = ran - built - timings.get('render', 0.0)
+                timings['encode'] = finished - ran
+                self.metrics.observe(
+                        label,
+                        code,
+                        finished - started,
+                        timings
+                        )
+        except BaseException:
+            if context is not None:
+                # A streaming body the server will never see must still be closed.
+                body = context.response.body
+                if hasattr(body, 'close'):
+                    body.close()
+                if context.resources:
+                    context.release_resources(broken=True)
+            raise
+        finally:
+            if sample:
+                self.memory.stop(sample, label)
+            if self.limiter:
+                self.limiter.release(label)
+        if isinstance(body, bytes):
+            body = [body] if body else []
+        if context.tasks or context.resources:
+            return tasks_.after_response(body, functools.partial(self._finish, context))
+        return body
+
+    def _finish(self, context):
+        """ Return the resources and hand the tasks of a sent response to ``self.tasks``. """
+        if context.resources:
+            context.release_resources()
+        if not context.tasks:
+            return
+        if self.tasks is None:
+            tasks_.run_all(context.tasks)
+            return
+        for func, args, kwargs in context.tasks:
+            self.tasks.submit(func, *args, **kwargs)
+
+    def _log_access(self, environ, route, code, length, duration):
+        """ Queue an access log record. ``length`` is None for streamed bodies. """
+        self.access_log.log(
+                method=environ.get('REQUEST_METHOD'),
+                path=environ.get('PATH_INFO') or '/',
+                route=route,
+                status=code,
+                bytes=length,
+                duration=round(duration, 6),
+                client=environ.get('REMOTE_ADDR')
+                )
+
+    def close(self, timeout=None):
+        """ Wait up to ``timeout`` seconds for queued background tasks, log records and traces.
+
+        Idle pooled resources are closed afterwards, the offloader's pool
+        shut down and the profiler's stats dumped.
+
+        Returns:
+            bool: True if every task ran, every record and trace was written and the
+                offloader's pool stopped.
+
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        drained = True
+        closers = (
+                self.tasks and self.tasks.shutdown,
+                self.access_log and self.access_log.close,
+                self.tracer and self.tracer.close,
+                self.offloader and self.offloader.shutdown,
                 )
-        return [context.response.output.read_bytes()]
+        for closer in closers:
+            if closer:
+                remaining = None if deadline is None else max(0, deadline - time.monotonic())
+                drained = closer(remaining) and drained
+        if self.profiler:
+            self.profiler.dump()
+        for value in self.storage.values():
+            if isinstance(value, pool_.Pool):
+                value.close_idle()
+        return drained
+
+    def _serve_metrics(self, start_response):
+        """ Respond with the Prometheus exposition of ``self.metrics``. """
+        body = self.metrics.render().encode('utf-8')
+        start_response(status.OK.status, [
+                ('Content-Type', metrics_.CONTENT_TYPE),
+                ('Content-Length', str(len(body)))
+                ])
+        return [body]
 
-    def _run_app(self, app, context):
+    def _run_app(self, app, context, route):
         """ Run the selected app and handler errors. """
         try:
-            app(context)
+            if self.profiler:
+                self.profiler.run(route, context.request.environment, app, context)
+            else:
+                app(context)
         except status.HTTPStatus as stat:
-            context.response.status = stat.status
-            context.response.headers = stat.headers
+            context.response.status = stat
+            context.response.headers = headers.Headers(
+                    [headers.Header(key, value, unique=True) for key, value in dict(stat.headers).items()]
+                    )
             context.response.output.clear()
-            context.response.output.write(stat.message)
+            if stat.message:
+                context.response.output.write(stat.message)
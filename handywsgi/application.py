@@ -1,28 +1,118 @@
 
+import threading
 
-from . import status, templator, HTTP_REQUEST_METHODS
+from . import status, responses, HTTP_REQUEST_METHODS
+
+
+def _method_table(cls):
+    """ Returns ``cls``'s handler functions keyed by HTTP method. """
+    return {
+            method: getattr(cls, method) for method in HTTP_REQUEST_METHODS
+            if callable(getattr(cls, method, None))
+            }
 
 
 class Application:
-    """ Application class for use with adapter.Adapter. """
+    """ Application class for use with adapter.Adapter.
+
+    Handlers are methods named after the HTTP method (``GET``, ``POST``, ...).
+    The method table is built once per subclass, so handlers must be defined
+    on the class. ``HEAD`` is answered by ``GET`` without rendering and
+    ``OPTIONS`` with the ``Allow`` header unless the class defines them.
+
+    A handler that returns a ``responses.TypedResponse`` (e.g.
+    ``responses.JSON``) has it sent as is, skipping the template.
+
+    Attributes:
+        allowed_methods (str): The ``Allow`` header value of this class.
+        cache_policy (handywsgi.caching.CachePolicy): Caching headers of
+            ``GET`` and ``HEAD`` responses, applied by the ``Adapter``.
+        cache_policies (dict): ``CachePolicy`` by method, overriding
+            ``cache_policy``.
+
+    """
+
+    _methods = {}
+    allowed_methods = ''
+    cache_policy = None
+    cache_policies = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._methods = _method_table(cls)
+        implicit = set(cls._methods)
+        implicit.add('OPTIONS')
+        if 'GET' in implicit:
+            implicit.add('HEAD')
+        cls.allowed_methods = ', '.join(m for m in HTTP_REQUEST_METHODS if m in implicit)
 
     def __init__(self, config):
         self.config = config
-        self.templator = templator.Templator(
-                self.config.template_path,
-                self.config.template_extension or 'html'
-                )
-        self.context = None
-        self.content = None
+        self._templator = None
+        # One instance serves the requests of every server thread.
+        self._request_state = threading.local()
+
+    @property
+    def context(self):
+        """ The ``Context`` of the request handled by the current thread. """
+        return getattr(self._request_state, 'context', None)
+
+    @context.setter
+    def context(self, value):
+        self._request_state.context = value
+
+    @property
+    def content(self):
+        """ The content returned by the handler of the current thread's request. """
+        return getattr(self._request_state, 'content', None)
+
+    @content.setter
+    def content(self, value):
+        self._request_state.content = value
+
+    @property
+    def templator(self):
+        """ The ``templator.Templator`` for ``config.template_path``.
+
+        It is created on first use so apps that never render don't import genshi.
+
+        """
+        if self._templator is None:
+            from . import templator
+            self._templator = templator.Templator(
+                    self.config.template_path,
+                    self.config.template_extension or 'html'
+                    )
+        return self._templator
+
+    @templator.setter
+    def templator(self, value):
+        self._templator = value
 
     def __call__(self, context):
         self.context = context
+        self.content = None
         method = self.context.request.query.method
-        if method in HTTP_REQUEST_METHODS and hasattr(self, method):
-            content = getattr(self, method)(self.context)
+        handler = self._methods.get(method)
+        if handler is not None:
+            with self.context.span(method):
+                content = handler(self, self.context)
+            if isinstance(content, responses.TypedResponse):
+                content.send(self.context)
+                return
             if content:
                 self.content = content
             self.render(self.config.default_template)
+        elif method == 'HEAD' and 'GET' in self._methods:
+            # The adapter sends no body for HEAD, so don't render one.
+            with self.context.span('GET'):
+                content = self._methods['GET'](self, self.context)
+            if isinstance(content, responses.TypedResponse):
+                content.send(self.context)
+            elif content:
+                self.content = content
+        elif method == 'OPTIONS':
+            self.context.add_header('Allow', self.allowed_methods, unique=True)
         else:
             raise status.NoMethod(self)
 
@@ -30,15 +120,17 @@ class Application:
         """ Render a template with data and return it. """
         if not template_name:
             template_name = self.config.default_template
-        content = self.templator.render(template_name, **data)
+        with self.context.timed('render'):
+            content = self.templator.render(template_name, **data)
         return content
 
     def render(self, template_name=None):
         """ Render content and send it immediately. """
         if not template_name:
             template_name = self.config.default_template
-        template = self.templator.get_template(template_name)
-        page = template.render(app=self)
+        with self.context.timed('render'):
+            template = self.templator.load(template_name)
+            page = template.render(app=self)
         self.context.response.output.write(page)
 
     def dump(self, data):
@@ -0,0 +1,196 @@
+""" An endpoint that runs many sub-requests in one HTTP request.
+
+The client ``POST``s a JSON list of sub-requests to ``/batch``::
+
+    [{"method": "GET", "path": "/users/1"},
+     {"method": "POST", "path": "/cart", "body": {"item": 7}}]
+
+and gets one JSON list back, in the same order::
+
+    [{"status": 200, "headers": {...}, "json": {...}},
+      {"status": 201, "headers": {...}, "body": "added"}]
+
+JSON responses are embedded as ``json``, text as ``body`` and binary data as
+base64 in ``body`` with ``"encoding": "base64"``.
+
+Each sub-request runs in-process through ``Adapter.handle`` with its own
+``Context``: it is rate limited, coalesced, routed, instrumented and logged
+like a separate request, minus the round trip. A batch therefore takes one
+rate limiter token for itself and one per sub-request; sub-requests over the
+limit get a ``429`` item. Fast routes and the metrics path are not served in
+batches, and streamed responses (``responses.Stream``, ``sse.EventStream``)
+are closed unread and answered with a ``400`` item.
+
+A string ``body`` is sent as ``text/plain`` and any other JSON value as
+``application/json``, unless the sub-request sets a ``Content-Type`` header.
+
+"""
+
+import base64
+import concurrent.futures
+import io
+import json
+import logging
+import os
+import threading
+import urllib.parse
+
+from . import status
+
+
+logger = logging.getLogger(__name__)
+
+# Keys a sub-request may have.
+FIELDS = frozenset(('method', 'path', 'query', 'body', 'headers'))
+
+
+class BatchEndpoint:
+    """ Serve batches of sub-requests at ``path``.
+
+    Sub-requests inherit the headers of the batch request; their own
+    ``headers`` override them.
+
+    Args:
+        path (str): The URI path (without slashes). Defaults to ``'batch'``.
+        max_items (int): Largest accepted batch. Defaults to 50.
+        workers (int): Threads that run the sub-requests of a batch in
+            parallel. Defaults to None (one after the other).
+
+    """
+
+    def __init__(self, path='batch', max_items=50, workers=None):
+        self.path = path.strip('/')
+        self.max_items = max_items
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _pool(self):
+        """ Returns the thread pool of this process. """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = concurrent.futures.ThreadPoolExecutor(self.workers)
+                    self._pid = os.getpid()
+        return self._executor
+
+    def __call__(self, adapter, environ, start_response):
+        """ Respond to a batch request sent to ``adapter``. """
+        if environ.get('REQUEST_METHOD') != 'POST':
+            return _plain(start_response, status.NoMethod, [('Allow', 'POST')], 'batches must be POSTed')
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            items = json.loads(environ['wsgi.input'].read(length).decode('utf-8'))
+        except (ValueError, UnicodeDecodeError):
+            return _plain(start_response, status.BadRequest, message='batch body must be a JSON list')
+        if not isinstance(items, list) or not all(isinstance(item, dict) and item.keys() <= FIELDS for item in items):
+            return _plain(start_response, status.BadRequest, message='batch body must be a JSON list of sub-requests')
+        if len(items) > self.max_items:
+            return _plain(start_response, status.BadRequest, message='batch has more than {} sub-requests'.format(self.max_items))
+        environs = [self._environ(environ, item) for item in items]
+        if self.workers and len(environs) > 1:
+            results = list(self._pool().map(lambda sub_environ: self._run(adapter, sub_environ), environs))
+        else:
+            results = [self._run(adapter, sub_environ) for sub_environ in environs]
+        body = json.dumps(results, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        start_response(status.OK.status, [
+                ('Content-Type', 'application/json; charset=utf-8'),
+                ('Content-Length', str(len(body)))
+                ])
+        return [body]
+
+    @staticmethod
+    def _environ(environ, item):
+        """ Returns the WSGI environ of one sub-request. """
+        sub_environ = {
+                key: value for key, value in environ.items()
+                if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH', 'QUERY_STRING')
+                }
+        path = item.get('path') or '/'
+        path, _, query = path.partition('?')
+        query = item.get('query', query)
+        if isinstance(query, dict):
+            query = urllib.parse.urlencode(query, doseq=True)
+        body = item.get('body')
+        if body is None:
+            body = b''
+        elif isinstance(body, str):
+            body = body.encode('utf-8')
+            sub_environ['CONTENT_TYPE'] = 'text/plain; charset=utf-8'
+        else:
+            body = json.dumps(body, separators=(',', ':')).encode('utf-8')
+            sub_environ['CONTENT_TYPE'] = 'application/json'
+        for key, value in (item.get('headers') or {}).items():
+            key = key.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            sub_environ[key] = str(value)
+        sub_environ.update({
+                'REQUEST_METHOD': str(item.get('method') or 'GET').upper(),
+                'PATH_INFO': path,
+                'QUERY_STRING': query,
+                'CONTENT_LENGTH': str(len(body)),
+                'wsgi.input': io.BytesIO(body),
+                })
+        return sub_environ
+
+    def _run(self, adapter, environ):
+        """ Run one sub-request through ``adapter`` and return its result item. """
+        raw_uri_path = environ['PATH_INFO']
+        if raw_uri_path.strip('/') == self.path:
+            return {'status': 400, 'headers': {}, 'body': 'batches cannot be nested'}
+        response = []
+
+        def capture(status_line, headers, exc_info=None):
+            response[:] = [status_line, headers]
+
+        try:
+            body = adapter.handle(environ, capture)
+            try:
+                # A stream may never end and would hold the batch, and an
+                # event stream its slot, forever.
+                if not isinstance(body, list) or _is_event_stream(response[1]):
+                    return {'status': 400, 'headers': {}, 'body': 'streaming responses cannot be batched'}
+                data = b''.join(body)
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+        except Exception:
+            logger.exception('batch sub-request %s %s failed', environ['REQUEST_METHOD'], raw_uri_path)
+            return {'status': 500, 'headers': {}, 'body': status.InternalError.message}
+        status_line, headers = response
+        headers = dict(headers)
+        result = {'status': int(status_line.split(' ', 1)[0]), 'headers': headers}
+        content_type = headers.get('Content-Type', '')
+        try:
+            text = data.decode('utf-8')
+        except UnicodeDecodeError:
+            result['body'] = base64.b64encode(data).decode('ascii')
+            result['encoding'] = 'base64'
+            return result
+        if content_type.startswith('application/json') and text:
+            try:
+                result['json'] = json.loads(text)
+                return result
+            except ValueError:
+                pass
+        result['body'] = text
+        return result
+
+
+def _is_event_stream(headers):
+    return any(
+            key.lower() == 'content-type' and value.startswith('text/event-stream')
+            for key, value in headers
+            )
+
+
+def _plain(start_response, error, extra_headers=(), message=None):
+    """ Send a plain text error response of an ``status.HTTPStatus`` class. """
+    body = (message or error.message).encode('utf-8')
+    start_response(error.status, [
+            ('Content-Type', 'text/plain; charset=utf-8'),
+            ('Content-Length', str(len(body))),
+            ] + list(extra_headers))
+    return [body]
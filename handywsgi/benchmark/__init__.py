@@ -0,0 +1,89 @@
+""" Benchmarks for handywsgi.
+
+The benchmarks drive ``handywsgi.adapter.Adapter`` in-process with synthetic
+WSGI environs so they measure the framework and not a server.
+
+"""
+
+import io
+import math
+import sys
+import time
+
+
+def make_environ(path='/', method='GET', query='', body=b'', content_type=None, **extra):
+    """ Returns a minimal PEP-3333 environ for an in-process request.
+
+    Args:
+        path (str): ``PATH_INFO``.
+        method (str): ``REQUEST_METHOD``.
+        query (str): ``QUERY_STRING``.
+        body (bytes): The request body.
+        content_type (str): ``CONTENT_TYPE``. Defaults to
+            ``application/x-www-form-urlencoded`` when there is a body.
+
+    Keyword Arguments:
+        ...: Extra environ keys, e.g. ``HTTP_ACCEPT='text/html'``.
+
+    """
+    environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': False,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            }
+    if body:
+        environ['CONTENT_LENGTH'] = str(len(body))
+        environ['CONTENT_TYPE'] = content_type or 'application/x-www-form-urlencoded'
+    elif content_type:
+        environ['CONTENT_TYPE'] = content_type
+    environ.update(extra)
+    return environ
+
+
+def start_response(status, headers, exc_info=None):
+    """ A do-nothing WSGI ``start_response``. """
+    return lambda data: None
+
+
+def call(app, environ):
+    """ Run one request through ``app`` and return the joined body. """
+    result = app(environ, start_response)
+    try:
+        return b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+
+def time_requests(app, environ_factory, count):
+    """ Returns the seconds it took to run ``count`` requests through ``app``.
+
+    ``environ_factory`` is called once per request because ``wsgi.input`` can
+    only be read once.
+
+    """
+    environs = [environ_factory() for _ in range(count)]
+    started = time.perf_counter()
+    for environ in environs:
+        call(app, environ)
+    return time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    """ Returns the nearest-rank percentile of sorted ``values``. """
+    if not values:
+        return float('nan')
+    index = max(0, min(len(values) - 1, math.ceil(fraction * len(values)) - 1))
+    return values[index]
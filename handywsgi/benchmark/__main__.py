@@ -0,0 +1,7 @@
+
+import sys
+
+from .micro import main
+
+
+sys.exit(main())
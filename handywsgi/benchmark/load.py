@@ -0,0 +1,269 @@
+""" End-to-end HTTP load benchmark.
+
+Starts a sample ``Adapter`` app under a WSGI server in a child process and
+runs concurrent keep-alive clients against a mix of routes.
+
+Usage::
+
+    python -m handywsgi.benchmark.load [--server NAME] [--clients N]
+                                       [--duration SECONDS] [--mix ROUTE=WEIGHT,...]
+
+Routes:
+    static: A fixed page written by a plain function.
+    page: A page rendered by an ``Application`` template (needs genshi).
+    upload: A 64 KiB multipart ``POST``.
+
+"""
+
+import argparse
+import http.client
+import itertools
+import multiprocessing
+import socketserver
+import sys
+import threading
+import time
+import wsgiref.simple_server
+
+from handywsgi.adapter import Adapter
+
+from . import micro, percentile
+
+
+UPLOAD_HEADERS = {
+        'Content-Type': 'multipart/form-data; boundary={}'.format(micro.MULTIPART_BOUNDARY)
+        }
+UPLOAD_BODY = micro.MULTIPART_BODY.replace(b'x' * 16384, b'x' * 65536)
+STATIC_PAGE = '<html><body>{}</body></html>'.format('static ' * 256)
+
+
+def static(context):
+    context.response.output.write(STATIC_PAGE)
+
+
+def upload(context):
+    data = context.request.wsgi.post_data.getvalue('upload') or b''
+    context.response.output.write('received {} bytes'.format(len(data)))
+
+
+class _PageConfig:
+    default_template = 'load'
+    template_path = micro.TEMPLATE_PATH
+    template_extension = 'html'
+
+
+def make_page():
+    """ Returns the templated app or None if templating isn't available. """
+    try:
+        from handywsgi.application import Application
+    except ImportError:
+        return None
+
+    class Page(Application):
+
+        def GET(self, context):
+            return ['item {}'.format(i) for i in range(50)]
+
+    return Page(_PageConfig())
+
+
+def make_app():
+    """ Returns the sample ``Adapter`` used for the load test. """
+    apps = {'static': static, 'upload': upload}
+    page = make_page()
+    if page:
+        apps['page'] = page
+    return Adapter(apps)
+
+
+class _QuietHandler(wsgiref.simple_server.WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingWSGIServer(socketserver.ThreadingMixIn, wsgiref.simple_server.WSGIServer):
+
+    daemon_threads = True
+
+
+def serve_wsgiref(app, host, port, ready):
+    """ Serve with the single threaded ``wsgiref`` server. """
+    _serve(wsgiref.simple_server.WSGIServer, app, host, port, ready)
+
+
+def serve_threaded(app, host, port, ready):
+    """ Serve with ``wsgiref`` using a thread per connection. """
+    _serve(_ThreadingWSGIServer, app, host, port, ready)
+
+
+def serve_prefork(app, host, port, ready):
+    """ Serve with ``handywsgi.server`` using a worker per CPU. """
+    from handywsgi import server
+    prefork = server.PreforkServer(app, (host, port), threads=16, graceful_timeout=5.0)
+    ready.send(prefork.bind()[1])
+    prefork.run()
+
+
+def _serve(server_class, app, host, port, ready):
+    httpd = wsgiref.simple_server.make_server(
+            host, port, app,
+            server_class=server_class,
+            handler_class=_QuietHandler
+            )
+    ready.send(httpd.server_address[1])
+    httpd.serve_forever()
+
+
+# Server name to ``serve(app, host, port, ready)`` function. ``ready`` is a
+# ``multiprocessing`` connection the bound port must be sent to.
+SERVERS = {
+        'wsgiref': serve_wsgiref,
+        'threaded': serve_threaded,
+        'prefork': serve_prefork,
+        }
+
+
+def _run_server(name, host, port, ready):
+    SERVERS[name](make_app(), host, port, ready)
+
+
+def start_server(name, host='127.0.0.1', port=0):
+    """ Start the sample app under server ``name`` in a child process.
+
+    Returns:
+        tuple: The ``multiprocessing.Process`` and the bound port.
+
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_run_server, args=(name, host, port, sender), daemon=True)
+    process.start()
+    if not receiver.poll(30):
+        process.terminate()
+        raise RuntimeError('server {} did not start'.format(name))
+    return process, receiver.recv()
+
+
+def _client(host, port, routes, deadline, results, errors):
+    """ Issue requests from ``routes`` on one keep-alive connection until ``deadline``. """
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    for route in itertools.cycle(routes):
+        if time.monotonic() >= deadline:
+            break
+        started = time.perf_counter()
+        try:
+            if route == 'upload':
+                connection.request('POST', '/upload', body=UPLOAD_BODY, headers=UPLOAD_HEADERS)
+            else:
+                connection.request('GET', '/' + route)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors[route] = errors.get(route, 0) + 1
+            connection.close()
+            continue
+        if response.status >= 400:
+            errors[route] = errors.get(route, 0) + 1
+        else:
+            results.setdefault(route, []).append(time.perf_counter() - started)
+    connection.close()
+
+
+def run(host, port, clients, duration, mix):
+    """ Run the load test against a running server.
+
+    Args:
+        host (str): Server host.
+        port (int): Server port.
+        clients (int): Number of concurrent keep-alive clients.
+        duration (float): Seconds to run for.
+        mix (dict): Route name to relative weight.
+
+    Returns:
+        dict: ``{route: {'requests', 'errors', 'p50', 'p95', 'p99'}}`` plus an
+            ``'all'`` entry with ``'throughput'`` in requests per second.
+            ``requests`` counts successful requests; the percentiles of a route
+            without any are None.
+
+    """
+    routes = [route for route, weight in sorted(mix.items()) for _ in range(weight)]
+    deadline = time.monotonic() + duration
+    per_client = [({}, {}) for _ in range(clients)]
+    threads = []
+    for number, (results, errors) in enumerate(per_client):
+        # Stagger the starting route so clients don't move in lock step.
+        offset = number % len(routes)
+        thread = threading.Thread(
+                target=_client,
+                args=(host, port, routes[offset:] + routes[:offset], deadline, results, errors)
+                )
+        thread.start()
+        threads.append(thread)
+    started = time.monotonic()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    latencies = {}
+    errors = {}
+    for client_results, client_errors in per_client:
+        for route, values in client_results.items():
+            latencies.setdefault(route, []).extend(values)
+        for route, count in client_errors.items():
+            errors[route] = errors.get(route, 0) + count
+    latencies['all'] = list(itertools.chain.from_iterable(latencies.values()))
+    errors['all'] = sum(errors.values())
+    report = {}
+    # Routes whose requests all failed have no latencies but are reported.
+    for route in set(mix) | set(latencies) | set(errors):
+        values = sorted(latencies.get(route, ()))
+        report[route] = {
+                'requests': len(values),
+                'errors': errors.get(route, 0),
+                'p50': percentile(values, 0.50) if values else None,
+                'p95': percentile(values, 0.95) if values else None,
+                'p99': percentile(values, 0.99) if values else None,
+                }
+    report['all']['throughput'] = report['all']['requests'] / elapsed
+    return report
+
+
+def _parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        route, _, weight = item.partition('=')
+        mix[route.strip()] = int(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m handywsgi.benchmark.load', description=__doc__.split('\n')[0].strip())
+    parser.add_argument('--server', choices=sorted(SERVERS), default='threaded')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent keep-alive clients')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run for')
+    parser.add_argument('--mix', type=_parse_mix, default='static=5,page=3,upload=1',
+                        help='route weights, e.g. static=5,page=3,upload=1')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='defaults to a free port')
+    args = parser.parse_args(argv)
+    mix = args.mix
+    if 'page' in mix and make_page() is None:
+        print('skipping route page: genshi is not installed', file=sys.stderr)
+        del mix['page']
+    process, port = start_server(args.server, args.host, args.port)
+    try:
+        report = run(args.host, port, args.clients, args.duration, mix)
+    finally:
+        process.terminate()
+        process.join()
+    print('server={} clients={} duration={}s'.format(args.server, args.clients, args.duration))
+    print('throughput: {:,.1f} requests/s'.format(report['all']['throughput']))
+    print('{:<10} {:>10} {:>8} {:>10} {:>10} {:>10}'.format('route', 'requests', 'errors', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for route, stats in sorted(report.items()):
+        print('{:<10} {:>10} {:>8} {:>10} {:>10} {:>10}'.format(
+                route, stats['requests'], stats['errors'],
+                *('-' if stats[key] is None else '{:.2f}'.format(stats[key] * 1000) for key in ('p50', 'p95', 'p99'))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
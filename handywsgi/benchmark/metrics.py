@@ -0,0 +1,44 @@
+""" Measure the per-request overhead of ``handywsgi.metrics.Metrics``.
+
+Usage::
+
+    python -m handywsgi.benchmark.metrics [requests] [rounds]
+
+"""
+
+import sys
+
+from handywsgi.adapter import Adapter
+from handywsgi.metrics import Metrics
+
+from . import make_environ, time_requests
+
+
+def hello(context):
+    context.response.output.write('hello')
+
+
+def run(count=20000, rounds=5):
+    """ Returns the best of ``rounds`` timings in seconds per request, without and with metrics. """
+    plain = Adapter({'hello': hello})
+    measured = Adapter({'hello': hello}, metrics=Metrics())
+    environ = lambda: make_environ('/hello')
+    results = {'off': [], 'on': []}
+    for _ in range(rounds):
+        results['off'].append(time_requests(plain, environ, count) / count)
+        results['on'].append(time_requests(measured, environ, count) / count)
+    return min(results['off']), min(results['on'])
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 20000
+    rounds = int(argv[1]) if len(argv) > 1 else 5
+    off, on = run(count, rounds)
+    print('metrics off: {:8.2f} us/request'.format(off * 1e6))
+    print('metrics on:  {:8.2f} us/request'.format(on * 1e6))
+    print('overhead:    {:8.2f} us/request ({:+.1f}%)'.format((on - off) * 1e6, (on / off - 1) * 100))
+
+
+if __name__ == '__main__':
+    main()
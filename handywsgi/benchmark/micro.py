@@ -0,0 +1,245 @@
+""" Micro-benchmarks for the framework hot paths.
+
+Usage::
+
+    python -m handywsgi.benchmark [--count N] [--rounds N] [--only CASE ...]
+                                  [--save FILE] [--compare FILE] [--threshold 0.1]
+
+Every case reports operations per second (best of ``--rounds``) and the mean
+peak number of bytes allocated by one operation as measured by
+``tracemalloc``. ``--save`` writes the results as JSON and ``--compare`` exits
+with status 1 if any case got slower or allocates more than ``--threshold``
+relative to a saved baseline.
+
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from handywsgi import buffer, headers, status
+from handywsgi.adapter import Adapter
+from handywsgi.context.request import Request
+
+from . import make_environ, call
+
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), 'templates')
+FORM_BODY = '&'.join('field{0}=value{0}'.format(i) for i in range(20)).encode('ascii')
+MULTIPART_BOUNDARY = 'handywsgi-bench'
+MULTIPART_BODY = (
+        '--{0}\r\n'
+        'Content-Disposition: form-data; name="upload"; filename="data.bin"\r\n'
+        'Content-Type: application/octet-stream\r\n\r\n'
+        '{1}\r\n'
+        '--{0}--\r\n'
+        ).format(MULTIPART_BOUNDARY, 'x' * 16384).encode('ascii')
+
+
+def hello(context):
+    context.response.output.write('hello')
+
+
+def not_found(context):
+    raise status.NotFound(context.request.query.path)
+
+
+def forbidden(context):
+    raise status.Forbidden()
+
+
+APPS = {'hello': hello, 'missing': not_found, 'forbidden': forbidden}
+
+
+def case_routing():
+    adapter = Adapter(dict(APPS))
+    paths = ['/hello', '/hello/world', '/', '/nothing/here']
+
+    def run():
+        for path in paths:
+            adapter._route(path)
+    return run, None
+
+
+def case_request():
+    return (lambda environ: Request(environ)), lambda: make_environ('/hello', query='a=1&b=2')
+
+
+def case_body_form():
+    return (lambda environ: Request(environ)), lambda: make_environ('/hello', 'POST', body=FORM_BODY)
+
+
+def case_body_multipart():
+    content_type = 'multipart/form-data; boundary={}'.format(MULTIPART_BOUNDARY)
+    return (
+            lambda environ: Request(environ),
+            lambda: make_environ('/hello', 'POST', body=MULTIPART_BODY, content_type=content_type)
+            )
+
+
+def case_headers():
+    def run():
+        hdrs = headers.Headers()
+        hdrs.add('Content-Type', 'text/html', unique=True)
+        hdrs.add('Cache-Control', 'no-cache')
+        for i in range(5):
+            hdrs.add('Set-Cookie', 'cookie{}=value'.format(i))
+        hdrs.add('Content-Type', 'application/json', unique=True)
+        hdrs.items()
+    return run, None
+
+
+def case_buffer():
+    chunk_str = 'x' * 256
+    chunk_bytes = b'y' * 256
+
+    def run():
+        output = buffer.IOBuffer()
+        for _ in range(10):
+            output.write(chunk_str)
+            output.write(chunk_bytes)
+        output.read_bytes()
+    return run, None
+
+
+def case_templator():
+    from handywsgi.templator import Templator
+    templator = Templator(TEMPLATE_PATH, auto_reload=False)
+    items = ['item {}'.format(i) for i in range(20)]
+    return (lambda: templator.render('bench', title='Benchmark', items=items)), None
+
+
+def case_adapter_get():
+    adapter = Adapter(dict(APPS))
+    return (lambda environ: call(adapter, environ)), lambda: make_environ('/hello')
+
+
+def case_adapter_not_found():
+    adapter = Adapter(dict(APPS))
+    return (lambda environ: call(adapter, environ)), lambda: make_environ('/missing')
+
+
+def case_adapter_error():
+    adapter = Adapter(dict(APPS))
+    return (lambda environ: call(adapter, environ)), lambda: make_environ('/forbidden')
+
+
+CASES = {
+        'routing': case_routing,
+        'request': case_request,
+        'body_form': case_body_form,
+        'body_multipart': case_body_multipart,
+        'headers': case_headers,
+        'buffer': case_buffer,
+        'templator': case_templator,
+        'adapter_get': case_adapter_get,
+        'adapter_not_found': case_adapter_not_found,
+        'adapter_error': case_adapter_error,
+        }
+
+
+def _measure(func, factory, count):
+    """ Returns the seconds ``count`` calls of ``func`` took. """
+    if factory:
+        args = [factory() for _ in range(count)]
+        started = time.perf_counter()
+        for arg in args:
+            func(arg)
+    else:
+        started = time.perf_counter()
+        for _ in range(count):
+            func()
+    return time.perf_counter() - started
+
+
+def _peak_bytes(func, factory, count):
+    """ Returns the mean peak allocation of one call of ``func`` in bytes. """
+    args = [factory() if factory else None for _ in range(count)]
+    total = 0
+    tracemalloc.start()
+    try:
+        for arg in args:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            if factory:
+                func(arg)
+            else:
+                func()
+            total += tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return total // count
+
+
+def run(names=None, count=2000, rounds=5):
+    """ Run the benchmark cases.
+
+    Args:
+        names (list): Case names to run. Defaults to all of ``CASES``.
+        count (int): Operations per round.
+        rounds (int): Rounds per case, the best is reported.
+
+    Returns:
+        dict: ``{case: {'ops_per_sec': float, 'peak_bytes': int}}``. Cases
+            that can't run here (e.g. genshi is missing) are left out.
+
+    """
+    results = {}
+    for name in names or CASES:
+        try:
+            func, factory = CASES[name]()
+        except ImportError as error:
+            print('skipping {}: {}'.format(name, error), file=sys.stderr)
+            continue
+        _measure(func, factory, min(count, 100))
+        best = min(_measure(func, factory, count) for _ in range(rounds))
+        results[name] = {
+                'ops_per_sec': count / best,
+                'peak_bytes': _peak_bytes(func, factory, min(count, 200)),
+                }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """ Returns a list of regression descriptions of ``results`` against ``baseline``. """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        if result['ops_per_sec'] < before['ops_per_sec'] * (1 - threshold):
+            regressions.append('{}: {:.0f} ops/s, was {:.0f} ops/s'.format(
+                    name, result['ops_per_sec'], before['ops_per_sec']))
+        if result['peak_bytes'] > before['peak_bytes'] * (1 + threshold):
+            regressions.append('{}: {} peak bytes/op, was {}'.format(
+                    name, result['peak_bytes'], before['peak_bytes']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m handywsgi.benchmark', description=__doc__.split('\n')[0].strip())
+    parser.add_argument('--count', type=int, default=2000, help='operations per round')
+    parser.add_argument('--rounds', type=int, default=5, help='rounds per case')
+    parser.add_argument('--only', nargs='+', choices=sorted(CASES), help='cases to run')
+    parser.add_argument('--save', metavar='FILE', help='write the results to FILE as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='compare against a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed relative regression')
+    args = parser.parse_args(argv)
+    results = run(args.only, args.count, args.rounds)
+    print('{:<20} {:>14} {:>16}'.format('case', 'ops/sec', 'peak bytes/op'))
+    for name, result in results.items():
+        print('{:<20} {:>14,.0f} {:>16,}'.format(name, result['ops_per_sec'], result['peak_bytes']))
+    if args.save:
+        with open(args.save, 'w') as results_file:
+            json.dump(results, results_file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            return 1
+    return 0
@@ -0,0 +1,101 @@
+""" Measure how long a fresh interpreter takes to import handywsgi and build an ``Adapter``.
+
+Every run starts a new ``python -X importtime`` process so nothing is cached.
+
+Usage::
+
+    python -m handywsgi.benchmark.startup [--runs N] [--top N] [--import MODULE ...]
+                                          [--save FILE] [--compare FILE] [--threshold 0.1]
+
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+
+# Measures the wall clock time of the import and Adapter construction from
+# inside the child process, so interpreter startup isn't counted.
+_SCRIPT = '''
+import time
+started = time.perf_counter()
+{imports}
+from handywsgi.adapter import Adapter
+Adapter({{'health': lambda context: context.response.output.write('ok')}})
+print(time.perf_counter() - started)
+'''
+
+
+def parse_importtime(stderr):
+    """ Returns ``{module: (self_us, cumulative_us)}`` from ``-X importtime`` output. """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run_once(imports=()):
+    """ Returns the startup seconds and the importtime table of one fresh interpreter. """
+    script = _SCRIPT.format(imports='\n'.join('import ' + module for module in imports))
+    process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            capture_output=True, text=True, check=True
+            )
+    return float(process.stdout.strip()), parse_importtime(process.stderr)
+
+
+def run(runs=10, imports=()):
+    """ Start ``runs`` interpreters.
+
+    Returns:
+        dict: ``{'startup_ms': median, 'modules': {module: median self ms}}``.
+
+    """
+    timings = []
+    module_times = {}
+    for _ in range(runs):
+        seconds, modules = run_once(imports)
+        timings.append(seconds)
+        for name, (self_us, _) in modules.items():
+            module_times.setdefault(name, []).append(self_us)
+    return {
+            'startup_ms': statistics.median(timings) * 1000,
+            'modules': {name: statistics.median(values) / 1000 for name, values in module_times.items()},
+            }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m handywsgi.benchmark.startup', description=__doc__.split('\n')[0].strip())
+    parser.add_argument('--runs', type=int, default=10, help='interpreters to start')
+    parser.add_argument('--top', type=int, default=15, help='slowest modules to list')
+    parser.add_argument('--import', dest='imports', nargs='+', default=(), metavar='MODULE',
+                        help='extra modules to import, e.g. handywsgi.application')
+    parser.add_argument('--save', metavar='FILE', help='write the results to FILE as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='compare against a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed relative regression')
+    args = parser.parse_args(argv)
+    result = run(args.runs, args.imports)
+    print('import + Adapter(): {:.2f} ms (median of {})'.format(result['startup_ms'], args.runs))
+    print('{:>10}  {}'.format('self ms', 'module'))
+    slowest = sorted(result['modules'].items(), key=lambda item: item[1], reverse=True)
+    for name, self_ms in slowest[:args.top]:
+        print('{:>10.2f}  {}'.format(self_ms, name))
+    if args.save:
+        with open(args.save, 'w') as results_file:
+            json.dump(result, results_file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if result['startup_ms'] > baseline['startup_ms'] * (1 + args.threshold):
+            print('REGRESSION startup: {:.2f} ms, was {:.2f} ms'.format(result['startup_ms'], baseline['startup_ms']))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
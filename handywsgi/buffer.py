@@ -143,6 +143,11 @@ class IOBuffer:
     def close(self):
         self._buffer.close()
 
+    def clear(self):
+        """ Discard everything written to the buffer. """
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
     def prepend(self, other):
         """ Prepend the content of this buffer to another buffer.
 
@@ -0,0 +1,352 @@
+""" Memoization of handler data with TTL, LRU eviction and tag invalidation.
+
+``DataCache`` is given to the ``Adapter`` and reached through
+``context.cache``::
+
+    def GET(self, context):
+        profile = context.cache.get_or_compute(
+                'profile:{}'.format(user_id), lambda: load_profile(user_id),
+                ttl=300, tags=['user:{}'.format(user_id)])
+
+    # after the user changed:
+    context.cache.invalidate('user:42')
+
+or as a decorator::
+
+    data_cache = DataCache()
+
+    @data_cache.memoize(ttl=60, tags=lambda user_id: ['user:{}'.format(user_id)])
+    def load_profile(user_id):
+        ...
+
+Concurrent misses of a key in one process compute it once (see
+``handywsgi.coalesce.SingleFlight``). Entries close to expiry are recomputed
+early by a random few requests, so workers sharing a ``SQLiteBackend`` don't
+all recompute a key at the moment it expires.
+
+"""
+
+import collections
+import functools
+import math
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+
+from .coalesce import SingleFlight
+
+
+class MemoryBackend:
+    """ An in-process LRU dict.
+
+    Values are stored as is, callers must not modify them.
+
+    Args:
+        max_entries (int): Entries kept. Defaults to 10000.
+
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._tags = {}
+
+    def get(self, key):
+        """ Returns ``(value, expires, delta)`` or None. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[:3]
+
+    def set(self, key, value, expires, delta, tags):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expires, delta, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        """ Drop ``key`` and its tag references. Call with ``_lock`` held. """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[3]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def invalidate(self, tags):
+        """ Drop the entries tagged with any of ``tags``. Returns their number. """
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+
+class SQLiteBackend:
+    """ A SQLite file shared by the processes of one machine.
+
+    Values are pickled. Each thread of each process opens its own connection.
+
+    Reads don't write: the access times used for eviction are collected in
+    memory and stored in one transaction every ``touch_interval`` seconds, so
+    cache hits never wait for the database's write lock. Eviction is
+    therefore approximately least recently read.
+
+    Args:
+        path (str): The database file.
+        max_entries (int): Entries kept; the least recently read tenth is
+            evicted when there are more. Defaults to 100000.
+        touch_interval (float): Seconds between access time updates.
+            Defaults to 10.
+
+    """
+
+    def __init__(self, path, max_entries=100000, touch_interval=10.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        self._sets = 0
+        self._touch_lock = threading.Lock()
+        self._touched = {}
+        self._touched_at = time.monotonic()
+        with self._connection() as connection:
+            connection.executescript('''
+                    CREATE TABLE IF NOT EXISTS entries (
+                        key TEXT PRIMARY KEY, value BLOB, expires REAL, delta REAL, accessed REAL);
+                    CREATE TABLE IF NOT EXISTS tags (tag TEXT, key TEXT, PRIMARY KEY (tag, key));
+                    CREATE INDEX IF NOT EXISTS tags_key ON tags (key);
+                    CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+                    ''')
+
+    def _connection(self):
+        """ Returns the connection of this thread, reopened after a fork. """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute('SELECT value, expires, delta FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        with self._touch_lock:
+            self._touched[key] = time.time()
+            due = time.monotonic() - self._touched_at >= self.touch_interval
+        if due:
+            self._touch(connection)
+        return pickle.loads(row[0]), row[1], row[2]
+
+    def _touch(self, connection):
+        """ Store the collected access times. """
+        with self._touch_lock:
+            touched, self._touched = self._touched, {}
+            self._touched_at = time.monotonic()
+        if not touched:
+            return
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany(
+                    'UPDATE entries SET accessed = ? WHERE key = ?',
+                    [(accessed, key) for key, accessed in touched.items()]
+                    )
+
+    def set(self, key, value, expires, delta, tags):
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('DELETE FROM tags WHERE key = ?', (key,))
+            connection.execute(
+                    'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                    (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires, delta, time.time())
+                    )
+            connection.executemany('INSERT OR IGNORE INTO tags VALUES (?, ?)', [(tag, key) for tag in tags])
+        self._sets += 1
+        if self._sets % 100 == 0:
+            self._evict(connection)
+
+    def _evict(self, connection):
+        self._touch(connection)
+        count, = connection.execute('SELECT COUNT(*) FROM entries').fetchone()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('DELETE FROM entries WHERE expires < ?', (time.time(),))
+            if count > self.max_entries:
+                connection.execute(
+                        'DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed LIMIT ?)',
+                        (count - self.max_entries + self.max_entries // 10,)
+                        )
+            connection.execute('DELETE FROM tags WHERE key NOT IN (SELECT key FROM entries)')
+
+    def delete(self, key):
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            connection.execute('DELETE FROM tags WHERE key = ?', (key,))
+
+    def invalidate(self, tags):
+        connection = self._connection()
+        marks = ','.join('?' * len(tags))
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            removed = connection.execute(
+                    'DELETE FROM entries WHERE key IN (SELECT key FROM tags WHERE tag IN ({}))'.format(marks),
+                    tags
+                    ).rowcount
+            connection.execute('DELETE FROM tags WHERE key NOT IN (SELECT key FROM entries)')
+        return removed
+
+    def clear(self):
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('DELETE FROM entries')
+            connection.execute('DELETE FROM tags')
+
+
+class DataCache:
+    """ A data cache with TTLs, tags and stampede protection.
+
+    Args:
+        backend: ``MemoryBackend`` (the default) or ``SQLiteBackend``.
+        ttl (float): Default seconds an entry lives. Defaults to 60.
+        beta (float): How eagerly entries close to expiry are recomputed
+            early; 0 disables it. Defaults to 1.0.
+
+    """
+
+    def __init__(self, backend=None, ttl=60, beta=1.0):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self.beta = beta
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get(self, key, default=None):
+        """ Returns the live value of ``key`` or ``default``. """
+        entry = self.backend.get(key)
+        if entry is None or entry[1] <= time.time():
+            return default
+        return entry[0]
+
+    def set(self, key, value, ttl=None, tags=(), delta=0.0):
+        """ Store ``value`` for ``ttl`` seconds, tagged with ``tags``.
+
+        Args:
+            delta (float): Seconds the value took to compute, used to
+                recompute it early.
+
+        """
+        ttl = self.ttl if ttl is None else ttl
+        self.backend.set(key, value, time.time() + ttl, delta, tuple(tags))
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def invalidate(self, *tags):
+        """ Drop every entry tagged with one of ``tags``. Returns the number dropped. """
+        removed = self.backend.invalidate(list(tags)) if tags else 0
+        with self._lock:
+            self._invalidations += removed
+        return removed
+
+    def clear(self):
+        self.backend.clear()
+
+    def get_or_compute(self, key, func, ttl=None, tags=()):
+        """ Returns the value of ``key``, storing ``func()`` if it is missing or expired. """
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, expires, delta = entry
+            now = time.time()
+            # Probabilistic early expiration: the closer to ``expires`` and
+            # the slower ``func``, the likelier a request recomputes early.
+            if now - delta * self.beta * math.log(1.0 - random.random()) < expires:
+                with self._lock:
+                    self._hits += 1
+                return value
+        with self._lock:
+            self._misses += 1
+        value, _ = self._flight.do(key, self._compute, key, func, ttl, tags)
+        return value
+
+    def _compute(self, key, func, ttl, tags):
+        started = time.perf_counter()
+        value = func()
+        self.set(key, value, ttl, tags, time.perf_counter() - started)
+        return value
+
+    def memoize(self, ttl=None, tags=None, key=None):
+        """ Decorator caching a function's results by its arguments.
+
+        Args:
+            ttl (float): Defaults to ``self.ttl``.
+            tags: A list of tags or ``tags(*args, **kwargs)`` returning one.
+            key (callable): ``key(*args, **kwargs)`` returns the cache key.
+                Defaults to the function name and the ``repr`` of the arguments.
+
+        The wrapper has ``invalidate(*args, **kwargs)`` to drop one result.
+
+        """
+        def decorate(func):
+            prefix = '{}.{}'.format(func.__module__, func.__qualname__)
+
+            def cache_key(*args, **kwargs):
+                if key is not None:
+                    return key(*args, **kwargs)
+                return '{}:{!r}:{!r}'.format(prefix, args, sorted(kwargs.items()))
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                entry_tags = tags(*args, **kwargs) if callable(tags) else (tags or ())
+                return self.get_or_compute(
+                        cache_key(*args, **kwargs), lambda: func(*args, **kwargs), ttl, entry_tags
+                        )
+
+            wrapper.invalidate = lambda *args, **kwargs: self.delete(cache_key(*args, **kwargs))
+            return wrapper
+        return decorate
+
+    def collect(self):
+        """ Yield Prometheus lines for ``handywsgi.metrics.Metrics.register``. """
+        with self._lock:
+            hits, misses, invalidations = self._hits, self._misses, self._invalidations
+        yield '# HELP handywsgi_data_cache_lookups_total Data cache lookups by result.'
+        yield '# TYPE handywsgi_data_cache_lookups_total counter'
+        yield 'handywsgi_data_cache_lookups_total{{result="hit"}} {}'.format(hits)
+        yield 'handywsgi_data_cache_lookups_total{{result="miss"}} {}'.format(misses)
+        yield '# HELP handywsgi_data_cache_invalidated_total Entries dropped by tag invalidation.'
+        yield '# TYPE handywsgi_data_cache_invalidated_total counter'
+        yield 'handywsgi_data_cache_invalidated_total {}'.format(invalidations)
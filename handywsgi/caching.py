@@ -0,0 +1,168 @@
+""" Declarative HTTP caching headers.
+
+A ``CachePolicy`` becomes ``Cache-Control``, ``Expires`` and ``Vary`` headers.
+Policies are set per app and per method and applied by ``Adapter`` after the
+app ran, so they cover ``status`` errors raised by handlers too::
+
+    class Articles(Application):
+        cache_policy = CachePolicy(max_age=60, s_maxage=600, stale_while_revalidate=30,
+                                   vary=('Accept-Encoding',))
+        cache_policies = {'POST': NO_STORE}
+
+Only ``GET`` and ``HEAD`` responses get the app's ``cache_policy``; other
+methods need an entry in ``cache_policies``. A handler that sets
+``Cache-Control`` itself is left alone.
+
+"""
+
+import time
+
+
+_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def http_date(timestamp):
+    """ Returns ``timestamp`` as an HTTP date, independent of the locale. """
+    moment = time.gmtime(timestamp)
+    return '{}, {:02d} {} {:04d} {:02d}:{:02d}:{:02d} GMT'.format(
+            _DAYS[moment.tm_wday], moment.tm_mday, _MONTHS[moment.tm_mon - 1], moment.tm_year,
+            moment.tm_hour, moment.tm_min, moment.tm_sec
+            )
+
+
+class CachePolicy:
+    """ How downstream caches may store a response.
+
+    Args:
+        max_age (int): Seconds the response is fresh. Also sets ``Expires``.
+        s_maxage (int): ``max_age`` for shared caches (CDNs, proxies).
+        public (bool): True for ``public``, False for ``private`` (browser
+            only). Defaults to None (neither).
+        no_store (bool): Forbid storing the response at all.
+        no_cache (bool): Store but revalidate before every use.
+        must_revalidate (bool): Never serve the response stale.
+        stale_while_revalidate (int): Seconds a stale response may be served
+            while it is refreshed in the background.
+        stale_if_error (int): Seconds a stale response may be served when the
+            origin fails.
+        immutable (bool): The response never changes while fresh.
+        vary (tuple): Request headers the response depends on.
+        errors (CachePolicy): The policy of ``4xx`` and ``5xx`` responses.
+            Defaults to ``no-store`` with the same ``vary``.
+
+    """
+
+    def __init__(self, max_age=None, s_maxage=None, public=None, no_store=False, no_cache=False,
+                 must_revalidate=False, stale_while_revalidate=None, stale_if_error=None,
+                 immutable=False, vary=(), errors=None):
+        if public is False and s_maxage is not None:
+            raise ValueError('s_maxage applies to shared caches, which may not store private responses')
+        if no_store and (max_age is not None or s_maxage is not None):
+            raise ValueError('no_store responses have no max_age')
+        self.max_age = max_age
+        self.vary = tuple(vary)
+        directives = []
+        if public is True:
+            directives.append('public')
+        elif public is False:
+            directives.append('private')
+        if no_store:
+            directives.append('no-store')
+        if no_cache:
+            directives.append('no-cache')
+        if max_age is not None:
+            directives.append('max-age={:d}'.format(max_age))
+        if s_maxage is not None:
+            directives.append('s-maxage={:d}'.format(s_maxage))
+        if must_revalidate:
+            directives.append('must-revalidate')
+        if stale_while_revalidate is not None:
+            directives.append('stale-while-revalidate={:d}'.format(stale_while_revalidate))
+        if stale_if_error is not None:
+            directives.append('stale-if-error={:d}'.format(stale_if_error))
+        if immutable:
+            directives.append('immutable')
+        self.cache_control = ', '.join(directives)
+        if errors is None and not no_store:
+            errors = CachePolicy(no_store=True, vary=self.vary)
+        self.errors = errors
+
+    def headers(self, now=None):
+        """ Returns the ``(key, value)`` headers of this policy. """
+        headers = []
+        if self.cache_control:
+            headers.append(('Cache-Control', self.cache_control))
+        if self.max_age is not None:
+            headers.append(('Expires', http_date((time.time() if now is None else now) + self.max_age)))
+        if self.vary:
+            headers.append(('Vary', ', '.join(self.vary)))
+        return headers
+
+    def apply(self, context):
+        """ Set the headers of this policy, or of ``errors`` for an error status, on ``context.response``. """
+        policy = self
+        if self.errors is not None and int(context.response.status.status.split(' ', 1)[0]) >= 400:
+            policy = self.errors
+        headers = context.response.headers
+        if any(key.lower() == 'cache-control' for key in headers.keys()):
+            return
+        for key, value in policy.headers():
+            if key == 'Vary':
+                value = _merge_vary(headers, value)
+            context.add_header(key, value, unique=True)
+
+
+# Never store the response, e.g. for personalized pages.
+NO_STORE = CachePolicy(no_store=True)
+
+
+def _merge_vary(headers, value):
+    """ Returns ``value`` plus the names of existing ``Vary`` headers it lacks. """
+    names = [name.strip() for name in value.split(',')]
+    lowered = {name.lower() for name in names}
+    for header in headers['Vary']:
+        for name in header.value.split(','):
+            name = name.strip()
+            if name and name.lower() not in lowered:
+                names.append(name)
+                lowered.add(name.lower())
+    return ', '.join(names)
+
+
+def policy_for(app, method, default=None):
+    """ Returns the ``CachePolicy`` of ``app`` for ``method`` or None.
+
+    Looks at ``app.cache_policies[method]``, then at ``app.cache_policy`` and
+    ``default`` for ``GET`` and ``HEAD``.
+
+    """
+    policies = getattr(app, 'cache_policies', None)
+    if policies:
+        policy = policies.get(method)
+        if policy is None and method == 'HEAD':
+            policy = policies.get('GET')
+        if policy is not None:
+            return policy
+    if method in ('GET', 'HEAD'):
+        return getattr(app, 'cache_policy', None) or default
+    return None
+
+
+def cache(policy=None, **policies):
+    """ Decorator setting the policies of a function app.
+
+    Example:
+        @caching.cache(CachePolicy(max_age=300, public=True))
+        def health(context):
+            ...
+
+    Keyword Arguments:
+        ...: Policies by method, e.g. ``POST=NO_STORE``.
+
+    """
+    def decorate(app):
+        app.cache_policy = policy
+        app.cache_policies = policies
+        return app
+    return decorate
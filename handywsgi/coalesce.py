@@ -0,0 +1,166 @@
+""" Single-flight coalescing of identical concurrent requests.
+
+``SingleFlight`` runs one call per key at a time and hands its result to the
+callers that asked for the same key meanwhile. ``Coalescer`` uses it in
+``Adapter`` so concurrent identical ``GET``s run the handler once::
+
+    Adapter(apps, coalescer=Coalescer(routes={'report'}))
+
+"""
+
+import threading
+
+
+# Requests carrying these are personalized and never coalesced by default.
+PRIVATE_HEADERS = ('HTTP_AUTHORIZATION', 'HTTP_COOKIE')
+DEFAULT_VARY = ('HTTP_ACCEPT', 'HTTP_ACCEPT_ENCODING', 'HTTP_ACCEPT_LANGUAGE')
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """ Share the result of a call among concurrent callers with the same key. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, timeout=None, **kwargs):
+        """ Run ``func(*args, **kwargs)`` unless a call for ``key`` is running.
+
+        Args:
+            key: Any hashable.
+            func (callable): Computes the result.
+            timeout (float): Seconds to wait for a running call before running
+                ``func`` anyway. Defaults to None (no limit).
+
+        Returns:
+            tuple: ``(result, leader)``. ``leader`` is False when the result of
+                another caller was reused. Its exception is raised likewise.
+
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            if not call.done.wait(timeout):
+                return func(*args, **kwargs), True
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, True
+
+
+class _Captured:
+    """ The response of a leader request. """
+
+    def __init__(self, status, headers, body, data):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        # The joined body or None if the response must not be shared.
+        self.data = data
+
+
+class Coalescer:
+    """ Opt-in single-flight mode for ``Adapter``.
+
+    Concurrent ``GET``s with the same path, query string and ``vary`` headers
+    wait for the first of them and reuse its status, headers and body. Streamed
+    responses, responses that set cookies and responses that vary on headers
+    outside ``vary`` are not shared; the waiting requests then run themselves.
+
+    Args:
+        vary (tuple): Environ keys of the request headers that are part of the key.
+        routes (set): Route labels to coalesce. Defaults to None (all routes).
+        private (bool): Also coalesce requests with ``Cookie`` or
+            ``Authorization`` headers. Defaults to False.
+        timeout (float): Seconds to wait for the first request. Defaults to None.
+
+    """
+
+    def __init__(self, vary=DEFAULT_VARY, routes=None, private=False, timeout=None):
+        self.vary = tuple(vary)
+        self.routes = None if routes is None else frozenset(routes)
+        self.private = private
+        self.timeout = timeout
+        self._vary_names = frozenset(key[5:].replace('_', '-').lower() for key in self.vary)
+        self._flight = SingleFlight()
+
+    def key(self, environ, route):
+        """ Returns the coalescing key of a request or None if it is not coalesced. """
+        if environ.get('REQUEST_METHOD') != 'GET':
+            return None
+        if self.routes is not None and route not in self.routes:
+            return None
+        if not self.private:
+            for header in PRIVATE_HEADERS:
+                if environ.get(header):
+                    return None
+        return (
+                environ.get('PATH_INFO') or '/',
+                environ.get('QUERY_STRING') or '',
+                tuple(environ.get(header) for header in self.vary)
+                )
+
+    def call(self, key, environ, start_response, respond):
+        """ Respond to a request through the single flight of ``key``.
+
+        Args:
+            respond (callable): ``respond(environ, start_response)``, the WSGI
+                pipeline that computes the response.
+
+        Returns:
+            tuple: ``(body, code)``. ``code`` is the status code of a reused
+                response or None if this request ran ``respond`` itself.
+
+        """
+        captured, leader = self._flight.do(key, self._capture, environ, respond, timeout=self.timeout)
+        if leader:
+            start_response(captured.status, captured.headers)
+            return captured.body, None
+        if captured.data is None:
+            return respond(environ, start_response), None
+        start_response(captured.status, list(captured.headers))
+        return [captured.data] if captured.data else [], int(captured.status.split(' ', 1)[0])
+
+    def _capture(self, environ, respond):
+        response = []
+
+        def capture(status, headers, exc_info=None):
+            response[:] = [status, list(headers)]
+
+        body = respond(environ, capture)
+        status, headers = response
+        data = None
+        if isinstance(body, list) and self._shareable(headers):
+            data = b''.join(body)
+        return _Captured(status, headers, body, data)
+
+    def _shareable(self, headers):
+        for key, value in headers:
+            key = key.lower()
+            if key == 'set-cookie':
+                return False
+            if key == 'vary':
+                for name in value.split(','):
+                    if name.strip().lower() not in self._vary_names:
+                        return False
+        return True
@@ -1,5 +1,6 @@
 
 import io
+import time
 
 import handywsgi.buffer
 
@@ -8,11 +9,26 @@ from .response import Response, OutputContent
 
 
 class Context:
-    """ Encalsulation of request and response states. """
+    """ Encalsulation of request and response states.
 
-    def __init__(self, environment, start_response):
+    Attributes:
+        timings (dict): Seconds spent in named phases of this request (see ``timed``).
+        trace (handywsgi.tracing.Trace): The trace of this request or None if
+            it is not traced.
+        tasks (list): ``(func, args, kwargs)`` queued by ``add_task``.
+        storage (dict): ``Adapter.storage``, app-lifetime objects like pools.
+        resources (dict): Resources checked out by ``resource``, by pool name.
+
+    """
+
+    def __init__(self, environment, start_response, storage=None):
         self.request = Request(environment.copy())
         self.response = Response(start_response)
+        self.timings = {}
+        self.trace = None
+        self.tasks = []
+        self.storage = {} if storage is None else storage
+        self.resources = {}
 
     def add_header(self, key, value, unique=False):
         """ Add a header based on the passed arguments. 
@@ -22,6 +38,90 @@ class Context:
         """
         self.response.headers.add(key, value, unique)
 
+    def add_task(self, func, *args, **kwargs):
+        """ Run ``func(*args, **kwargs)`` after the response has been sent.
+
+        Tasks run on the ``Adapter``'s ``handywsgi.tasks.TaskQueue`` or, without
+        one, in the server thread once the body is written. Their errors are
+        logged and never reach the client.
+
+        Example:
+            context.add_task(mailer.send, user.email, 'Welcome!')
+
+        """
+        self.tasks.append((func, args, kwargs))
+
+    @property
+    def cache(self):
+        """ The ``handywsgi.cache.DataCache`` of the ``Adapter`` or None. """
+        return self.storage.get('cache')
+
+    def resource(self, name):
+        """ Returns a resource of the ``handywsgi.pool.Pool`` ``storage[name]``.
+
+        The resource is checked out on the first call and kept for the rest of
+        the request; the ``Adapter`` returns it when the response is finished.
+
+        Raises:
+            handywsgi.pool.PoolTimeout: The pool stayed exhausted.
+
+        """
+        resource = self.resources.get(name)
+        if resource is None:
+            with self.span('checkout', pool=name):
+                resource = self.resources[name] = self.storage[name].acquire()
+        return resource
+
+    def release_resources(self, broken=False):
+        """ Return the resources checked out by ``resource`` to their pools. """
+        resources, self.resources = self.resources, {}
+        for name, resource in resources.items():
+            self.storage[name].release(resource, broken)
+
     def set_output(self, filename):
         """ Set the output buffer to a file. """
         self.response.output = OutputContent(filename)
+
+    def timed(self, name):
+        """ Returns a context manager that adds its run time to ``timings[name]``.
+
+        The block is also recorded as a span if the request is traced.
+
+        """
+        return _Timer(self.timings, name, self.trace)
+
+    def span(self, name, **args):
+        """ Returns a context manager that records a trace span if the request is traced.
+
+        Example:
+            with context.span('load-user', user_id=user_id):
+                user = db.load_user(user_id)
+
+        Keyword Arguments:
+            ...: Shown as the span's arguments in the trace viewer.
+
+        """
+        return _Timer(None, name, self.trace, args)
+
+
+class _Timer:
+    """ Times a ``with`` block into a dict of timings and/or a trace. """
+
+    def __init__(self, timings, name, trace=None, args=None):
+        self._timings = timings
+        self._name = name
+        self._trace = trace
+        self._args = args or {}
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        finished = time.perf_counter()
+        if self._timings is not None:
+            elapsed = finished - self._started
+            self._timings[self._name] = self._timings.get(self._name, 0.0) + elapsed
+        if self._trace:
+            self._trace.add(self._name, self._started, finished, **self._args)
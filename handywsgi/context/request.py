@@ -1,6 +1,52 @@
 
-import cgi
-import urllib
+import io
+import urllib.parse
+
+
+def _field_storage(**kwargs):
+    """ Returns a ``cgi.FieldStorage``.
+
+    ``cgi`` pulls in the ``email`` package, so it is imported on first use
+    rather than when the framework is imported.
+
+    """
+    import cgi
+    environ = kwargs.get('environ')
+    if environ and not _is_form(environ.get('CONTENT_TYPE')):
+        # cgi writes other bodies of any method to a text mode file and
+        # fails, the raw body stays available in ``environment['wsgi.input']``.
+        kwargs['environ'] = dict(environ, CONTENT_LENGTH='0')
+    return cgi.FieldStorage(**kwargs)
+
+
+def _is_form(content_type):
+    """ Returns True for the content types ``cgi.FieldStorage`` parses. """
+    content_type = (content_type or 'application/x-www-form-urlencoded').lower()
+    return content_type.startswith(('application/x-www-form-urlencoded', 'multipart/'))
+
+
+def _field_values(storage):
+    """ Returns the fields of a ``cgi.FieldStorage`` as a dict. """
+    if storage.list is None:
+        # Not a form, e.g. a JSON body or a method without a body.
+        return {}
+    return {key: storage.getvalue(key) for key in storage.keys()}
+
+
+def _read_body(environment):
+    """ Returns the request body as a seekable file so it can be parsed more than once.
+
+    Reading past ``CONTENT_LENGTH`` would block on a real connection.
+
+    """
+    try:
+        length = int(environment.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    source = environment.get('wsgi.input')
+    if length <= 0 or source is None:
+        return io.BytesIO()
+    return io.BytesIO(source.read(length))
 
 
 class Request:
@@ -22,6 +68,8 @@ class Request:
     """
 
     def __init__(self, environment):
+        environment = environment.copy()
+        environment['wsgi.input'] = _read_body(environment)
         self.environment = environment.copy()
         self.wsgi = WSGIData(environment.copy())
         self._get_request_parts(environment.copy())
@@ -50,6 +98,9 @@ class Request:
             user_agent = environment.get('HTTP_USER_AGENT')
         self.http = HTTP()
 
+        environment['wsgi.input'].seek(0)
+        _params = _field_storage(fp=environment['wsgi.input'], environ=environment.copy())
+
         class Query:
             path = environment.get('PATH_INFO')
             param = environment.get('QUERY_STRING')
@@ -58,8 +109,7 @@ class Request:
                 full_path = '{}?{}'.format(path, param)
             else:
                 full_path = path
-            _params = cgi.FieldStorage(fp=environment['wsgi.input'], environ=environment.copy())
-            params = {p: _params.getvalue(p) for p in _params.keys()}
+            params = _field_values(_params)
         self.query = Query()
 
         class Client:
@@ -89,7 +139,7 @@ class WSGIData:
         self.errors = environment.get('wsgi.errors')  # <_io.TextIOWrapper name='<stderr>' mode='w' encoding='UTF-8'>,
         self.file_wrapper = environment.get('wsgi.file_wrapper')  # <class 'wsgiref.util.FileWrapper'>
         self.input_file = environment.get('wsgi.input') # <_io.BufferedReader name=5>
-        self.post_data = cgi.FieldStorage(fp=environment.get('wsgi.input'), environ=environment, keep_blank_values=True)
+        self.post_data = _field_storage(fp=environment.get('wsgi.input'), environ=environment, keep_blank_values=True)
         self.multiprocess = environment.get('wsgi.multiprocess')
         self.multithread = environment.get('wsgi.multithread')
         self.run_once = environment.get('wsgi.run_once')
@@ -4,7 +4,6 @@ import io
 import handywsgi.buffer
 import handywsgi.status
 import handywsgi.headers
-import handywsgi.content_type
 
 
 class Response:
@@ -13,6 +12,8 @@ class Response:
     Attributes:
         headers (handywsgi.headers.Headers): HTTP headers.
         output (Content): A buffer for output content.
+        body (iterable): Sent instead of ``output`` if set (see
+            ``handywsgi.responses.Stream``).
         content_type (headers.Header): Content-Type header.
         status (status.HTTPStatus): HTTP status object.
 
@@ -26,15 +27,20 @@ class Response:
     def __init__(self,
                  start_response,
                  status_header=handywsgi.status.OK,
-                 content_type=handywsgi.content_type.HTML_UTF8):
+                 content_type=None):
         self._start_response = start_response
         self._status = status_header
         self._content_type = content_type
         self.headers = handywsgi.headers.Headers()
         self.output = OutputContent()
+        self.body = None
 
     @property
     def content_type(self):
+        if self._content_type is None:
+            # The content_type module is a large table, load it on first use.
+            import handywsgi.content_type
+            self._content_type = handywsgi.content_type.HTML_UTF8
         return self._content_type
 
     @content_type.setter
@@ -0,0 +1,221 @@
+""" Pre-render ``GET`` responses to static files.
+
+Pages that are the same for every visitor can be served by a static file
+server without running Python. ``export`` requests each path from an
+``Adapter`` in-process and writes the body to a directory tree, next to a
+gzip (and, if the ``brotli`` package is installed, a brotli) copy::
+
+    out/index.html              <- /
+    out/index.html.gz
+    out/about/index.html        <- /about
+    out/about/index.html.gz
+    out/robots.txt              <- /robots.txt
+
+Serve the tree with precompressed lookups, e.g. nginx's ``gzip_static on``.
+
+Only ``200`` responses are written. Responses marked ``no-store`` or
+``private``, e.g. by a ``handywsgi.caching.CachePolicy``, are skipped because
+they are personal. Files an earlier export wrote for a path are removed when
+the path is skipped or its output changed, e.g. a ``.gz`` copy of a page that
+is now too small to compress, so a static file server never serves them stale.
+
+Usage::
+
+    python -m handywsgi.export MODULE:ATTR DIRECTORY [PATH ...] [--no-apps]
+
+"""
+
+import argparse
+import glob
+import gzip
+import mimetypes
+import os
+import sys
+import tempfile
+
+from . import loader
+from .benchmark import make_environ
+
+
+# Responses are only compressed if they are at least this large.
+MIN_COMPRESS_SIZE = 256
+
+
+def app_paths(adapter):
+    """ Returns the path of every app registered with ``adapter``. """
+    return ['/' + key for key in sorted(getattr(adapter, '_apps', {}))]
+
+
+def render(app, path):
+    """ Returns ``(status, headers, body)`` of a ``GET`` of ``path`` from ``app``. """
+    captured = []
+
+    def start_response(status, headers, exc_info=None):
+        captured[:] = [status, headers]
+
+    result = app(make_environ(path), start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return captured[0], captured[1], body
+
+
+def check_path(path):
+    """ Returns the segments of ``path``.
+
+    Raises:
+        ValueError: ``path`` has a query string or leaves the directory.
+
+    """
+    if '?' in path:
+        raise ValueError('{!r}: static files have no query string'.format(path))
+    segments = [segment for segment in path.split('/') if segment]
+    if any(segment in ('.', '..') for segment in segments):
+        raise ValueError('{!r}: path leaves the export directory'.format(path))
+    return segments
+
+
+def _has_extension(path, segments):
+    return bool(segments and os.path.splitext(segments[-1])[1] and not path.endswith('/'))
+
+
+def target_name(path, content_type):
+    """ Returns the relative file ``path`` is exported to.
+
+    Paths whose last segment has an extension keep it; others become an
+    ``index`` file with the extension of ``content_type``.
+
+    Raises:
+        ValueError: See ``check_path``.
+
+    """
+    segments = check_path(path)
+    if _has_extension(path, segments):
+        return os.path.join(*segments)
+    media_type = content_type.split(';', 1)[0].strip().lower()
+    extension = '.html' if media_type == 'text/html' else mimetypes.guess_extension(media_type) or '.html'
+    return os.path.join(*segments, 'index' + extension)
+
+
+def _previous_outputs(directory, path):
+    """ Returns the files an export may have written for ``path``. """
+    segments = check_path(path)
+    if _has_extension(path, segments):
+        filename = os.path.join(directory, *segments)
+        candidates = [filename, filename + '.gz', filename + '.br']
+    else:
+        candidates = glob.glob(os.path.join(glob.escape(os.path.join(directory, *segments)), 'index.*'))
+    return [candidate for candidate in candidates if os.path.isfile(candidate)]
+
+
+def _cacheable(headers):
+    for key, value in headers:
+        if key.lower() == 'cache-control':
+            directives = {directive.strip().split('=', 1)[0].lower() for directive in value.split(',')}
+            if directives & {'no-store', 'private'}:
+                return False
+    return True
+
+
+def _write(filename, data):
+    """ Write ``data`` to ``filename`` atomically. """
+    directory = os.path.dirname(filename)
+    os.makedirs(directory, exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=directory, prefix='.export-')
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            output.write(data)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, filename)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _compressed(data):
+    """ Yield ``(suffix, data)`` of the precompressed copies of ``data``. """
+    yield '.gz', gzip.compress(data, 9, mtime=0)
+    try:
+        import brotli
+    except ImportError:
+        return
+    yield '.br', brotli.compress(data)
+
+
+def export(app, directory, paths=None, include_apps=True):
+    """ Render ``paths`` from ``app`` and write them under ``directory``.
+
+    Args:
+        app (callable): The WSGI app, usually an ``Adapter``.
+        directory (str): The root of the exported tree.
+        paths (list): URI paths to export, e.g. ``['/', '/about']``.
+        include_apps (bool): Also export the path of every app registered
+            with an ``Adapter``. Defaults to True.
+
+    Returns:
+        list: ``(path, file or None, reason)`` per path. ``file`` is None
+            and ``reason`` says why when the path was skipped.
+
+    Raises:
+        ValueError: A path can't be exported (see ``check_path``). Nothing
+            is rendered or written then.
+
+    """
+    wanted = list(paths or ())
+    if include_apps:
+        wanted.extend(path for path in app_paths(app) if path not in wanted)
+    for path in wanted:
+        check_path(path)
+    report = []
+    written = set()
+    for path in wanted:
+        status, headers, body = render(app, path)
+        if not status.startswith('200'):
+            report.append((path, None, status))
+        elif not _cacheable(headers):
+            report.append((path, None, 'not cacheable'))
+        else:
+            content_type = next((value for key, value in headers if key.lower() == 'content-type'), 'text/html')
+            filename = os.path.join(directory, target_name(path, content_type))
+            _write(filename, body)
+            written.add(filename)
+            if len(body) >= MIN_COMPRESS_SIZE:
+                for suffix, data in _compressed(body):
+                    if len(data) < len(body):
+                        _write(filename + suffix, data)
+                        written.add(filename + suffix)
+            report.append((path, filename, None))
+        for stale in _previous_outputs(directory, path):
+            if stale not in written:
+                os.unlink(stale)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m handywsgi.export', description='Pre-render GET responses to static files.')
+    parser.add_argument('app', help='MODULE:ATTR of the WSGI app')
+    parser.add_argument('directory', help='directory to write the files to')
+    parser.add_argument('paths', nargs='*', help='URI paths to export in addition to the apps')
+    parser.add_argument('--no-apps', dest='include_apps', action='store_false',
+                        help="don't export the path of every registered app")
+    args = parser.parse_args(argv)
+    for path in args.paths:
+        try:
+            check_path(path)
+        except ValueError as error:
+            parser.error(str(error))
+    report = export(loader.load(args.app), args.directory, args.paths, args.include_apps)
+    skipped = 0
+    for path, filename, reason in report:
+        if filename is None:
+            skipped += 1
+            print('{:<30} skipped: {}'.format(path, reason))
+        else:
+            print('{:<30} {}'.format(path, filename))
+    return 1 if skipped == len(report) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
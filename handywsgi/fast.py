@@ -0,0 +1,56 @@
+""" Fast-path routes for ``Adapter``.
+
+A fast route is matched on the exact ``PATH_INFO`` before anything else runs:
+no rate limiting, routing, ``Context``, metrics or logging. It is either a
+prebuilt ``(status, headers, body)`` response or a callable that takes the raw
+environ and returns one::
+
+    Adapter(apps, fast_routes={
+        '/healthz': fast.text('ok'),
+        '/old-home': fast.redirect('/'),
+        '/ready': lambda environ: fast.text('ready') if db_ready() else NOT_READY,
+        })
+
+"""
+
+from . import status
+
+
+def response(body=b'', content_type='text/plain; charset=utf-8', code=status.OK, headers=()):
+    """ Returns a prebuilt fast-path response.
+
+    Args:
+        body (bytes or str): ``str`` is encoded as UTF-8.
+        content_type (str): The ``Content-Type`` header.
+        code (status.HTTPStatus): The status class. Defaults to ``status.OK``.
+        headers (tuple): Extra ``(key, value)`` headers.
+
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return (
+            code.status,
+            (('Content-Type', content_type), ('Content-Length', str(len(body)))) + tuple(headers),
+            body
+            )
+
+
+def text(body, code=status.OK):
+    """ Returns a prebuilt plain text response. """
+    return response(body, code=code)
+
+
+def redirect(location, code=status.Found):
+    """ Returns a prebuilt redirect to ``location``. """
+    return response(b'', code=code, headers=(('Location', location),))
+
+
+def serve(route, environ, start_response):
+    """ Answer a request with the fast route ``route``. """
+    if callable(route):
+        route = route(environ)
+    status_line, headers, body = route
+    start_response(status_line, list(headers))
+    if environ.get('REQUEST_METHOD') == 'HEAD':
+        return []
+    return [body] if body else []
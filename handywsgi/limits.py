@@ -0,0 +1,230 @@
+""" Load shedding for ``handywsgi.adapter.Adapter``.
+
+``RateLimiter`` runs before routing and ``ConcurrencyLimiter`` after routing,
+both before a ``Context`` is built, so a rejected request costs a dict lookup
+and a prebuilt response.
+
+"""
+
+import collections
+import math
+import threading
+import time
+
+from . import metrics, status
+
+
+class ConcurrencyLimiter:
+    """ Cap the number of requests in flight, globally and per route.
+
+    A request over a cap waits in a bounded queue for up to ``queue_timeout``
+    seconds. If the queue is full or the wait times out it is answered with a
+    ``503`` and a ``Retry-After`` header.
+
+    Args:
+        max_in_flight (int): Global cap. Defaults to None (no global cap).
+        per_route (dict): Caps keyed by route label (the app key, ``'/'`` for
+            the default app).
+        queue_size (int): Requests that may wait for a slot. Defaults to 0.
+        queue_timeout (float): Seconds a request may wait. Defaults to 1.0.
+        retry_after (int): The ``Retry-After`` value in seconds. Defaults to 1.
+
+    """
+
+    def __init__(self, max_in_flight=None, per_route=None, queue_size=0, queue_timeout=1.0, retry_after=1):
+        self.max_in_flight = max_in_flight
+        self.per_route = dict(per_route or {})
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition(threading.Lock())
+        self._in_flight = 0
+        self._route_in_flight = {}
+        self._waiting = 0
+        self._rejected = {}
+        body = status.ServiceUnavailable.message.encode('ascii')
+        self._rejection = (
+                status.ServiceUnavailable.status,
+                (
+                    ('Content-Type', 'text/plain'),
+                    ('Content-Length', str(len(body))),
+                    ('Retry-After', str(retry_after)),
+                    ),
+                body
+                )
+
+    def _has_slot(self, route):
+        if self.max_in_flight is not None and self._in_flight >= self.max_in_flight:
+            return False
+        limit = self.per_route.get(route)
+        return limit is None or self._route_in_flight.get(route, 0) < limit
+
+    def _take(self, route):
+        self._in_flight += 1
+        self._route_in_flight[route] = self._route_in_flight.get(route, 0) + 1
+
+    def acquire(self, route):
+        """ Take a slot for ``route``.
+
+        Returns:
+            bool: False if the request should be rejected.
+
+        """
+        with self._condition:
+            if self._has_slot(route):
+                self._take(route)
+                return True
+            if self._waiting >= self.queue_size:
+                self._rejected[route] = self._rejected.get(route, 0) + 1
+                return False
+            self._waiting += 1
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while not self._has_slot(route):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected[route] = self._rejected.get(route, 0) + 1
+                        return False
+                    self._condition.wait(remaining)
+                self._take(route)
+                return True
+            finally:
+                self._waiting -= 1
+
+    def release(self, route):
+        """ Give back the slot taken by ``acquire(route)``. """
+        with self._condition:
+            self._in_flight -= 1
+            self._route_in_flight[route] -= 1
+            if self._waiting:
+                # Waiters may be queued for different routes, wake them all.
+                self._condition.notify_all()
+
+    def reject(self, start_response):
+        """ Send the prebuilt ``503`` response. """
+        status_line, headers, body = self._rejection
+        start_response(status_line, list(headers))
+        return [body]
+
+    def collect(self):
+        """ Yield Prometheus lines for ``handywsgi.metrics.Metrics.register``. """
+        with self._condition:
+            in_flight = sorted(self._route_in_flight.items())
+            rejected = sorted(self._rejected.items())
+            waiting = self._waiting
+        yield '# HELP handywsgi_in_flight_requests Requests being handled by route.'
+        yield '# TYPE handywsgi_in_flight_requests gauge'
+        for route, count in in_flight:
+            yield 'handywsgi_in_flight_requests{} {}'.format(metrics.format_labels(route=route), count)
+        yield '# HELP handywsgi_queued_requests Requests waiting for a concurrency slot.'
+        yield '# TYPE handywsgi_queued_requests gauge'
+        yield 'handywsgi_queued_requests {}'.format(waiting)
+        yield '# HELP handywsgi_shed_requests_total Requests rejected by the concurrency limiter by route.'
+        yield '# TYPE handywsgi_shed_requests_total counter'
+        for route, count in rejected:
+            yield 'handywsgi_shed_requests_total{} {}'.format(metrics.format_labels(route=route), count)
+
+
+def client_address(environ):
+    """ The default ``RateLimiter`` key, the same as ``Request.client.address``. """
+    return environ.get('REMOTE_ADDR')
+
+
+class _Shard:
+
+    def __init__(self, capacity):
+        self.lock = threading.Lock()
+        self.capacity = capacity
+        self.buckets = collections.OrderedDict()
+
+
+class RateLimiter:
+    """ Per-client token bucket rate limiting.
+
+    Every client may make ``burst`` requests at once and ``rate`` requests per
+    second after that. Requests over the limit are answered with a ``429``
+    before routing and body parsing.
+
+    Buckets live in a fixed number of shards, each with its own lock, and each
+    shard holds at most ``max_clients / shards`` buckets. Buckets that have been
+    idle long enough to refill completely are dropped, and when a shard is full
+    the least recently seen client is evicted, so memory stays bounded.
+
+    Args:
+        rate (float): Tokens added per second.
+        burst (int): Bucket size. Defaults to ``rate`` rounded up.
+        key (callable): ``key(environ)`` returns the client key. Defaults to
+            ``client_address``. Requests with a None key are not limited.
+        max_clients (int): Buckets kept in total. Defaults to 10000.
+        shards (int): Independent lock domains. Defaults to 16.
+
+    """
+
+    def __init__(self, rate, burst=None, key=client_address, max_clients=10000, shards=16):
+        self.rate = float(rate)
+        self.burst = float(burst or math.ceil(rate))
+        self.key = key
+        # A bucket idle for this long is full again and need not be kept.
+        self._idle = self.burst / self.rate
+        self._shards = [_Shard(max(1, max_clients // shards)) for _ in range(shards)]
+        self._rejected = 0
+        body = status.TooManyRequests.message.encode('ascii')
+        self._body = body
+        self._headers = (('Content-Type', 'text/plain'), ('Content-Length', str(len(body))))
+
+    def check(self, environ):
+        """ Take a token for the client of ``environ``.
+
+        Returns:
+            float: 0 if the request is allowed or the seconds until it would be.
+
+        """
+        key = self.key(environ)
+        if key is None:
+            return 0
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        with shard.lock:
+            buckets = shard.buckets
+            bucket = buckets.get(key)
+            if bucket is None:
+                self._expire(shard, now)
+                buckets[key] = [self.burst - 1, now]
+                return 0
+            buckets.move_to_end(key)
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0
+            bucket[0] = tokens
+            self._rejected += 1
+        return (1 - tokens) / self.rate
+
+    def _expire(self, shard, now):
+        """ Make room for one bucket. Call with ``shard.lock`` held. """
+        buckets = shard.buckets
+        while buckets:
+            oldest = next(iter(buckets.values()))
+            if now - oldest[1] < self._idle and len(buckets) < shard.capacity:
+                break
+            buckets.popitem(last=False)
+
+    def reject(self, start_response, wait):
+        """ Send a ``429`` telling the client to retry in ``wait`` seconds. """
+        start_response(
+                status.TooManyRequests.status,
+                list(self._headers) + [('Retry-After', str(max(1, math.ceil(wait))))]
+                )
+        return [self._body]
+
+    def collect(self):
+        """ Yield Prometheus lines for ``handywsgi.metrics.Metrics.register``. """
+        clients = 0
+        for shard in self._shards:
+            clients += len(shard.buckets)
+        yield '# HELP handywsgi_rate_limited_requests_total Requests rejected by the rate limiter.'
+        yield '# TYPE handywsgi_rate_limited_requests_total counter'
+        yield 'handywsgi_rate_limited_requests_total {}'.format(self._rejected)
+        yield '# HELP handywsgi_rate_limiter_clients Clients tracked by the rate limiter.'
+        yield '# TYPE handywsgi_rate_limiter_clients gauge'
+        yield 'handywsgi_rate_limiter_clients {}'.format(clients)
@@ -0,0 +1,19 @@
+""" Import WSGI apps named on the command line. """
+
+import importlib
+
+
+def load(spec):
+    """ Returns the object named by ``spec``.
+
+    Args:
+        spec (str): ``'package.module:attribute'``. The attribute defaults to
+            ``application``.
+
+    """
+    module_name, _, attribute = spec.partition(':')
+    module = importlib.import_module(module_name)
+    target = module
+    for name in (attribute or 'application').split('.'):
+        target = getattr(target, name)
+    return target
@@ -0,0 +1,139 @@
+""" Per-request memory accounting with ``tracemalloc`` sampling. """
+
+import linecache
+import random
+import threading
+import tracemalloc
+
+from . import metrics
+
+
+class MemoryProfiler:
+    """ Record the peak allocation and top allocation sites of sampled requests.
+
+    ``tracemalloc`` is process wide, so only one request is sampled at a time
+    and allocations made by other threads during a sampled request are counted
+    too. Tracing is only switched on for the duration of a sample unless it was
+    already running.
+
+    Args:
+        sample_rate (float): Fraction of requests to sample (0.0 - 1.0).
+            Defaults to ``0.01``.
+        top (int): Number of allocation sites to keep per route. Defaults to 5.
+        frames (int): Traceback depth stored by ``tracemalloc``. Defaults to 1.
+
+    """
+
+    def __init__(self, sample_rate=0.01, top=5, frames=1):
+        self.sample_rate = sample_rate
+        self.top = top
+        self.frames = frames
+        self._sampling = threading.Lock()
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def start(self):
+        """ Start sampling a request.
+
+        Returns:
+            _Sample: A token for ``stop()`` or None if the request is not sampled.
+
+        """
+        if random.random() >= self.sample_rate or not self._sampling.acquire(blocking=False):
+            return None
+        owner = not tracemalloc.is_tracing()
+        if owner:
+            tracemalloc.start(self.frames)
+            before = None
+        else:
+            before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        return _Sample(owner, before, tracemalloc.get_traced_memory()[0])
+
+    def stop(self, sample, route):
+        """ Finish ``sample`` and record it for ``route``. """
+        try:
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, linecache.__file__),
+                    ))
+            if sample.before is None:
+                stats = snapshot.statistics('lineno')
+            else:
+                stats = snapshot.compare_to(sample.before, 'lineno')
+            if sample.owner:
+                tracemalloc.stop()
+        finally:
+            self._sampling.release()
+        sites = [
+                (str(stat.traceback[0]), getattr(stat, 'size_diff', stat.size))
+                for stat in stats[:self.top]
+                ]
+        self._record(route, peak - sample.baseline, sites)
+
+    def _record(self, route, peak, sites):
+        with self._lock:
+            usage = self._routes.get(route)
+            if usage is None:
+                usage = self._routes[route] = RouteMemory()
+            usage.samples += 1
+            usage.last_peak = peak
+            if peak >= usage.max_peak:
+                usage.max_peak = peak
+                usage.sites = sites
+
+    def usage(self, route):
+        """ Returns the ``RouteMemory`` of ``route`` or None if it was never sampled. """
+        return self._routes.get(route)
+
+    def collect(self):
+        """ Yield Prometheus lines for ``handywsgi.metrics.Metrics.register``. """
+        with self._lock:
+            routes = sorted(self._routes.items())
+        yield '# HELP handywsgi_memory_samples_total Requests sampled with tracemalloc by route.'
+        yield '# TYPE handywsgi_memory_samples_total counter'
+        for route, usage in routes:
+            yield 'handywsgi_memory_samples_total{} {}'.format(metrics.format_labels(route=route), usage.samples)
+        yield '# HELP handywsgi_memory_peak_bytes Largest sampled peak allocation by route.'
+        yield '# TYPE handywsgi_memory_peak_bytes gauge'
+        for route, usage in routes:
+            yield 'handywsgi_memory_peak_bytes{} {}'.format(metrics.format_labels(route=route), usage.max_peak)
+        yield '# HELP handywsgi_memory_last_peak_bytes Most recent sampled peak allocation by route.'
+        yield '# TYPE handywsgi_memory_last_peak_bytes gauge'
+        for route, usage in routes:
+            yield 'handywsgi_memory_last_peak_bytes{} {}'.format(metrics.format_labels(route=route), usage.last_peak)
+        yield '# HELP handywsgi_memory_site_bytes Bytes held per allocation site in the largest sample by route.'
+        yield '# TYPE handywsgi_memory_site_bytes gauge'
+        for route, usage in routes:
+            for site, size in usage.sites:
+                yield 'handywsgi_memory_site_bytes{} {}'.format(
+                        metrics.format_labels(route=route, site=site),
+                        size
+                        )
+
+
+class RouteMemory:
+    """ Sampled memory usage of one route.
+
+    Attributes:
+        samples (int): Number of sampled requests.
+        max_peak (int): Largest peak allocation in bytes.
+        last_peak (int): Peak allocation of the latest sample in bytes.
+        sites (list): ``(file:line, bytes)`` tuples of the largest sample.
+
+    """
+
+    def __init__(self):
+        self.samples = 0
+        self.max_peak = 0
+        self.last_peak = 0
+        self.sites = []
+
+
+class _Sample:
+
+    def __init__(self, owner, before, baseline):
+        self.owner = owner
+        self.before = before
+        self.baseline = baseline
@@ -0,0 +1,255 @@
+""" Request metrics collection and Prometheus text exposition.
+
+See https://prometheus.io/docs/instrumenting/exposition_formats/ for the
+output format.
+
+"""
+
+import bisect
+import collections
+import contextlib
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+# The parts of a request that ``Adapter`` times separately.
+PHASES = ('routing', 'context', 'handler', 'render', 'encode')
+# Latency histogram bucket upper bounds in seconds.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    """ Escape a label value for the Prometheus text format. """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(**labels):
+    """ Returns a ``{key="value",...}`` label string. """
+    if not labels:
+        return ''
+    return '{' + ','.join(
+            '{}="{}"'.format(key, _escape(value)) for key, value in labels.items()
+            ) + '}'
+
+
+class Histogram:
+    """ A fixed bucket histogram.
+
+    Args:
+        buckets (tuple): Sorted bucket upper bounds. An implicit ``+Inf``
+            bucket is always added.
+
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """ Record a single observation. """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def expose(self, name, **labels):
+        """ Yield the Prometheus sample lines of this histogram. """
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            yield '{}_bucket{} {}'.format(name, format_labels(**dict(labels, le=le)), cumulative)
+        yield '{}_sum{} {!r}'.format(name, format_labels(**labels), self.sum)
+        yield '{}_count{} {}'.format(name, format_labels(**labels), self.count)
+
+
+class Metrics:
+    """ Per-route request counters and latency histograms.
+
+    An instance is passed to ``handywsgi.adapter.Adapter`` which records every
+    request in it and serves ``render()`` at ``path``.
+
+    Recording a request takes one lock acquisition and a handful of dict
+    lookups so it is cheap enough to leave on in production. See
+    ``handywsgi.benchmark.metrics`` for a measurement.
+
+    With a ``handywsgi.shared.SharedStore`` the counts are kept in shared
+    memory, so every worker of a prefork server records into and renders the
+    totals of the whole pool. Registered collectors still report only the
+    process that renders. A key takes a store slot once a request lands in its
+    histogram bucket, so a route takes up to ``6 * (len(buckets) + 2)`` slots
+    plus one per status code (97 for a route that only answers ``200`` with the
+    default buckets), see ``shared_slots``. Requests that don't fit
+    in the store, or whose route label is too long for a store key, are not
+    recorded but counted in ``handywsgi_metrics_dropped_total`` of the process
+    that handled them; they never fail the request.
+
+    Attributes:
+        path (str): The URI path (without slashes) the metrics are served at.
+
+    Args:
+        path (str): Defaults to ``'metrics'``.
+        buckets (tuple): Histogram bucket upper bounds in seconds.
+        prefix (str): Metric name prefix. Defaults to ``'handywsgi'``.
+        store (handywsgi.shared.SharedStore): Shared storage. Defaults to None
+            (this process only).
+
+    """
+
+    def __init__(self, path='metrics', buckets=DEFAULT_BUCKETS, prefix='handywsgi', store=None):
+        self.path = path.strip('/')
+        self._buckets = tuple(buckets)
+        self._prefix = prefix
+        self._store = store
+        self._lock = threading.Lock()
+        self._requests = collections.Counter()
+        self._latency = {}
+        self._phases = {}
+        self._collectors = []
+        self._dropped = 0
+
+    def shared_slots(self, routes, codes=1):
+        """ Returns the most ``SharedStore`` slots ``routes`` routes answering ``codes`` status codes each can take. """
+        return routes * (6 * (len(self._buckets) + 2) + codes)
+
+    def register(self, collector):
+        """ Add an object with a ``collect()`` method to the exposition.
+
+        ``collect()`` must return an iterable of Prometheus text lines. Metric
+        names starting with ``handywsgi_`` are renamed to this instance's
+        ``prefix``.
+
+        """
+        self._collectors.append(collector)
+
+    def observe(self, route, code, duration, timings):
+        """ Record a finished request.
+
+        Args:
+            route (str): The route label.
+            code (int): The HTTP status code.
+            duration (float): Total time spent in the adapter in seconds.
+            timings (dict): Seconds spent per phase (see ``PHASES``).
+
+        """
+        if self._store is not None:
+            try:
+                self._store.add_many(self._shared_amounts(route, code, duration, timings))
+            except (RuntimeError, ValueError):
+                # The store is full or the route label is too long for a key.
+                with self._lock:
+                    self._dropped += 1
+                    if self._dropped == 1:
+                        logger.warning('shared metrics store exhausted, dropping requests of route %r', route, exc_info=True)
+            return
+        with self._lock:
+            self._requests[(route, code)] += 1
+            histogram = self._latency.get(route)
+            if histogram is None:
+                histogram = self._latency[route] = Histogram(self._buckets)
+            histogram.observe(duration)
+            for phase, seconds in timings.items():
+                histogram = self._phases.get((route, phase))
+                if histogram is None:
+                    histogram = self._phases[(route, phase)] = Histogram(self._buckets)
+                histogram.observe(seconds)
+
+    def _shared_amounts(self, route, code, duration, timings):
+        """ Yield the ``(key, amount)`` store updates of one request.
+
+        Keys are ``('requests', route, code)``, and ``('latency', route, i)``
+        and ``('phase', route, phase, i)`` for histogram bucket ``i``. Index
+        ``-1`` holds the sum of the observations.
+
+        """
+        buckets = self._buckets
+        yield ('requests', route, code), 1
+        yield ('latency', route, bisect.bisect_left(buckets, duration)), 1
+        yield ('latency', route, -1), duration
+        for phase, seconds in timings.items():
+            yield ('phase', route, phase, bisect.bisect_left(buckets, seconds)), 1
+            yield ('phase', route, phase, -1), seconds
+
+    def _shared_snapshot(self):
+        """ Returns the requests, latency and phases of the store like the local dicts. """
+        requests = {}
+        latency = {}
+        phases = {}
+        for key, amount in self._store.totals().items():
+            if key[0] == 'requests':
+                requests[(key[1], key[2])] = int(amount)
+                continue
+            if key[0] == 'latency':
+                histograms, name = latency, key[1]
+            else:
+                histograms, name = phases, (key[1], key[2])
+            histogram = histograms.get(name)
+            if histogram is None:
+                histogram = histograms[name] = Histogram(self._buckets)
+            if key[-1] == -1:
+                histogram.sum += amount
+            else:
+                histogram.counts[key[-1]] += int(amount)
+                histogram.count += int(amount)
+        return requests, latency, phases
+
+    def render(self):
+        """ Returns all metrics in the Prometheus text format. """
+        prefix = self._prefix
+        lines = [
+                '# HELP {}_requests_total Requests handled by route and status code.'.format(prefix),
+                '# TYPE {}_requests_total counter'.format(prefix),
+                ]
+        if self._store is not None:
+            requests, latency, phases = self._shared_snapshot()
+            lock = contextlib.nullcontext()
+        else:
+            requests, latency, phases = self._requests, self._latency, self._phases
+            lock = self._lock
+        with lock:
+            for (route, code), count in sorted(requests.items()):
+                lines.append('{}_requests_total{} {}'.format(
+                        prefix,
+                        format_labels(route=route, code=code),
+                        count
+                        ))
+            lines.append('# HELP {}_request_duration_seconds Request latency by route.'.format(prefix))
+            lines.append('# TYPE {}_request_duration_seconds histogram'.format(prefix))
+            for route, histogram in sorted(latency.items()):
+                lines.extend(histogram.expose(
+                        '{}_request_duration_seconds'.format(prefix),
+                        route=route
+                        ))
+            lines.append('# HELP {}_phase_duration_seconds Time spent per request phase by route.'.format(prefix))
+            lines.append('# TYPE {}_phase_duration_seconds histogram'.format(prefix))
+            for (route, phase), histogram in sorted(phases.items()):
+                lines.extend(histogram.expose(
+                        '{}_phase_duration_seconds'.format(prefix),
+                        route=route,
+                        phase=phase
+                        ))
+        if self._store is not None:
+            lines.append('# HELP {}_metrics_dropped_total Requests this process could not record in the shared store.'.format(prefix))
+            lines.append('# TYPE {}_metrics_dropped_total counter'.format(prefix))
+            lines.append('{}_metrics_dropped_total {}'.format(prefix, self._dropped))
+        for collector in self._collectors:
+            if prefix == 'handywsgi':
+                lines.extend(collector.collect())
+            else:
+                lines.extend(_rename(line, prefix) for line in collector.collect())
+        return '\n'.join(lines) + '\n'
+
+
+def _rename(line, prefix):
+    """ Returns an exposition ``line`` with the ``handywsgi`` name prefix replaced by ``prefix``. """
+    if line.startswith('handywsgi_'):
+        return prefix + line[9:]
+    if line.startswith(('# HELP handywsgi_', '# TYPE handywsgi_')):
+        return line[:7] + prefix + line[16:]
+    return line
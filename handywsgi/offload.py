@@ -0,0 +1,221 @@
+""" Run CPU-bound handlers in a process pool.
+
+A handler marked with ``Offloader.offload`` runs in a pool process, so it
+doesn't hold the GIL of the server threads::
+
+    pdfs = Offloader(workers=4, timeout=20)
+    metrics.register(pdfs)
+
+    class Invoice(Application):
+
+        @pdfs.offload
+        def GET(cls, request):
+            return responses.Raw(render_pdf(request.query['id'][0]), content_type='application/pdf')
+
+The handler gets the ``Application`` class instead of the instance and a
+``RequestSnapshot`` instead of the ``Context``, both of which can be pickled.
+Its return value travels back and is handled as if the handler had run in the
+server: a ``responses.TypedResponse`` is sent, other content is rendered.
+Handlers must be importable by module and qualified name.
+
+"""
+
+import concurrent.futures
+import functools
+import importlib
+import multiprocessing
+import os
+import threading
+import time
+import urllib.parse
+
+from . import metrics, status
+
+
+class RequestSnapshot:
+    """ The picklable parts of a request.
+
+    Attributes:
+        method (str): The request method.
+        path (str): ``PATH_INFO``.
+        query_string (str): ``QUERY_STRING``.
+        query (dict): The query string parsed into lists of values.
+        headers (dict): Request headers by their environ key (``HTTP_*``,
+            ``CONTENT_TYPE``, ``CONTENT_LENGTH``).
+        body (bytes): The request body.
+        remote_addr (str): The client address.
+
+    """
+
+    def __init__(self, method, path, query_string, headers, body, remote_addr=None):
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.headers = headers
+        self.body = body
+        self.remote_addr = remote_addr
+
+    @property
+    def query(self):
+        return urllib.parse.parse_qs(self.query_string, keep_blank_values=True)
+
+    @classmethod
+    def from_context(cls, context):
+        environ = context.request.environment
+        source = environ.get('wsgi.input')
+        body = source.getvalue() if hasattr(source, 'getvalue') else b''
+        return cls(
+                environ.get('REQUEST_METHOD'),
+                environ.get('PATH_INFO') or '/',
+                environ.get('QUERY_STRING') or '',
+                {
+                    key: value for key, value in environ.items()
+                    if key.startswith('HTTP_') or key in ('CONTENT_TYPE', 'CONTENT_LENGTH')
+                    },
+                body,
+                environ.get('REMOTE_ADDR')
+                )
+
+
+def _resolve(module_name, qualname):
+    """ Returns the class and the undecorated function of an offloaded handler. """
+    owner = importlib.import_module(module_name)
+    names = qualname.split('.')
+    for name in names[:-1]:
+        owner = getattr(owner, name)
+    return owner, getattr(owner, names[-1]).__wrapped__
+
+
+def _call(module_name, qualname, snapshot):
+    """ Runs in the pool process. """
+    owner, func = _resolve(module_name, qualname)
+    return func(owner, snapshot)
+
+
+class Offloader:
+    """ A process pool for offloaded handlers.
+
+    The pool is started on first use in each process, so every worker of a
+    prefork server has its own. Pool processes are started with
+    ``forkserver`` where available (``spawn`` otherwise), not forked from a
+    threaded server.
+
+    Args:
+        workers (int): Pool processes. Defaults to the number of CPUs.
+        timeout (float): Seconds a request waits for its result before a
+            ``504``. The pool process still finishes the call. Defaults to 30.
+        max_pending (int): Calls that may be queued or running at once,
+            including timed out calls still running in the pool; more are
+            answered with a ``503``. Defaults to ``4 * workers``.
+
+    Give it to the ``Adapter`` as ``offloader`` to have its metrics exposed
+    and its pool shut down by ``Adapter.close``.
+
+    """
+
+    def __init__(self, workers=None, timeout=30.0, max_pending=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.max_pending = max_pending or 4 * self.workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._duration = metrics.Histogram()
+
+    def _pool(self):
+        """ Returns the process pool of this process. Call with ``_lock`` held. """
+        if self._pid != os.getpid():
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            self._executor = concurrent.futures.ProcessPoolExecutor(self.workers, mp_context=context)
+            self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, func, *args):
+        """ Run ``func(*args)`` in the pool and return its result.
+
+        Raises:
+            status.ServiceUnavailable: ``max_pending`` calls are in flight.
+            status.GatewayTimeout: The result took longer than ``timeout``.
+
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise status.ServiceUnavailable()
+            self._pending += 1
+            try:
+                future = self._pool().submit(func, *args)
+            except BaseException:
+                self._pending -= 1
+                raise
+        # A call that timed out keeps its pool process busy, so it stays
+        # pending until it is actually done.
+        future.add_done_callback(self._done)
+        started = time.perf_counter()
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            with self._lock:
+                self._timeouts += 1
+            raise status.GatewayTimeout()
+        finally:
+            with self._lock:
+                self._duration.observe(time.perf_counter() - started)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def offload(self, func):
+        """ Decorator running an ``Application`` handler in the pool. """
+        @functools.wraps(func)
+        def handler(app, context):
+            snapshot = RequestSnapshot.from_context(context)
+            with context.span('offload'):
+                return self.submit(_call, func.__module__, func.__qualname__, snapshot)
+        return handler
+
+    def shutdown(self, timeout=None):
+        """ Stop the pool processes of this process.
+
+        Queued calls are cancelled; running ones get up to ``timeout`` seconds.
+
+        Returns:
+            bool: True if the pool stopped in time.
+
+        """
+        with self._lock:
+            executor = self._executor if self._pid == os.getpid() else None
+            self._executor = None
+            self._pid = None
+        if executor is None:
+            return True
+        waiter = threading.Thread(
+                target=executor.shutdown, kwargs={'wait': True, 'cancel_futures': True}, daemon=True
+                )
+        waiter.start()
+        waiter.join(timeout)
+        return not waiter.is_alive()
+
+    def collect(self):
+        """ Yield Prometheus lines for ``handywsgi.metrics.Metrics.register``. """
+        with self._lock:
+            pending, rejected, timeouts = self._pending, self._rejected, self._timeouts
+            duration = list(self._duration.expose('handywsgi_offload_duration_seconds'))
+        yield '# HELP handywsgi_offload_pending Offloaded calls queued or running.'
+        yield '# TYPE handywsgi_offload_pending gauge'
+        yield 'handywsgi_offload_pending {}'.format(pending)
+        yield '# HELP handywsgi_offload_rejected_total Offloaded calls rejected because the queue was full.'
+        yield '# TYPE handywsgi_offload_rejected_total counter'
+        yield 'handywsgi_offload_rejected_total {}'.format(rejected)
+        yield '# HELP handywsgi_offload_timeouts_total Offloaded calls that timed out.'
+        yield '# TYPE handywsgi_offload_timeouts_total counter'
+        yield 'handywsgi_offload_timeouts_total {}'.format(timeouts)
+        yield '# HELP handywsgi_offload_duration_seconds Time requests waited for offloaded calls.'
+        yield '# TYPE handywsgi_offload_duration_seconds histogram'
+        yield from duration
@@ -0,0 +1,222 @@
+""" Bounded pools of app-lifetime resources.
+
+Pools are given to the ``Adapter`` by name and checked out per request::
+
+    adapter = Adapter(apps, pools={'db': Pool(lambda: sqlite3.connect('app.db', check_same_thread=False))})
+
+    def GET(self, context):
+        db = context.resource('db')
+
+The resource is returned to the pool when the response is finished. Every
+worker process of a prefork server starts with an empty pool and creates its
+own resources; the ones inherited from the parent are never used or closed.
+
+"""
+
+import collections
+import contextlib
+import logging
+import os
+import threading
+import time
+import weakref
+
+from . import metrics, status
+
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(status.ServiceUnavailable):
+    """ No resource became free in time. Answered with a ``503``. """
+
+
+class Pool:
+    """ A bounded pool of resources created on demand.
+
+    Args:
+        factory (callable): ``factory()`` returns a new resource.
+        size (int): Resources that may exist at once. Defaults to 10.
+        timeout (float): Seconds to wait for a free resource before raising
+            ``PoolTimeout``. Defaults to 5.0.
+        check (callable): ``check(resource)`` returns False or raises if the
+            resource is broken. Runs on every checkout. Defaults to None.
+        close (callable): ``close(resource)``. Defaults to ``resource.close()``.
+        name (str): The metrics label. ``Adapter`` sets it to the pool's key.
+
+    """
+
+    def __init__(self, factory, size=10, timeout=5.0, check=None, close=None, name=None):
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self.check = check
+        self.close = close or _close
+        self.name = name
+        self._wait = metrics.Histogram()
+        self._created = 0
+        self._discarded = 0
+        self._timeouts = 0
+        self._orphans = []
+        self._reset()
+        after_fork = weakref.WeakMethod(self._after_fork)
+        os.register_at_fork(after_in_child=lambda: after_fork() and after_fork()())
+
+    def _reset(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._idle = collections.deque()
+        self._open = 0
+
+    def _after_fork(self):
+        # Keep the parent's resources referenced so the garbage collector
+        # doesn't close connections the parent still uses.
+        self._orphans.extend(self._idle)
+        self._reset()
+
+    def acquire(self, timeout=None):
+        """ Check out a resource, creating one if the pool isn't full.
+
+        Args:
+            timeout (float): Overrides ``self.timeout``.
+
+        Raises:
+            PoolTimeout: The pool stayed full for ``timeout`` seconds.
+
+        """
+        started = time.perf_counter()
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while True:
+            resource = None
+            with self._condition:
+                while not self._idle and self._open >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout()
+                    self._condition.wait(remaining)
+                if self._idle:
+                    resource = self._idle.pop()
+                else:
+                    self._open += 1
+            if resource is None:
+                try:
+                    resource = self.factory()
+                except BaseException:
+                    self._forget()
+                    raise
+                with self._condition:
+                    self._created += 1
+                    self._wait.observe(time.perf_counter() - started)
+                return resource
+            if self._healthy(resource):
+                with self._condition:
+                    self._wait.observe(time.perf_counter() - started)
+                return resource
+            self.release(resource, broken=True)
+
+    def _healthy(self, resource):
+        if self.check is None:
+            return True
+        try:
+            return self.check(resource) is not False
+        except Exception:
+            logger.warning('health check of a %s resource failed', self.name or 'pool', exc_info=True)
+            return False
+
+    def _forget(self):
+        with self._condition:
+            self._open -= 1
+            self._condition.notify()
+
+    def release(self, resource, broken=False):
+        """ Return a resource. A ``broken`` one is closed and replaced on demand. """
+        if broken:
+            try:
+                self.close(resource)
+            except Exception:
+                logger.warning('closing a %s resource failed', self.name or 'pool', exc_info=True)
+            with self._condition:
+                self._discarded += 1
+            self._forget()
+            return
+        with self._condition:
+            self._idle.append(resource)
+            self._condition.notify()
+
+    @contextlib.contextmanager
+    def checkout(self, timeout=None):
+        """ Returns a context manager holding a resource for a ``with`` block.
+
+        The resource is closed instead of returned if the block raises.
+
+        """
+        resource = self.acquire(timeout)
+        try:
+            yield resource
+        except BaseException:
+            self.release(resource, broken=True)
+            raise
+        self.release(resource)
+
+    def close_idle(self):
+        """ Close the resources that are not checked out. """
+        with self._condition:
+            idle, self._idle = list(self._idle), collections.deque()
+            self._open -= len(idle)
+        for resource in idle:
+            try:
+                self.close(resource)
+            except Exception:
+                logger.warning('closing a %s resource failed', self.name or 'pool', exc_info=True)
+
+    def samples(self):
+        """ Returns the metric samples of this pool keyed by metric name. """
+        name = self.name or ''
+        with self._condition:
+            idle, in_use = len(self._idle), self._open - len(self._idle)
+            return {
+                    'resources': [
+                        (metrics.format_labels(pool=name, state='in_use'), in_use),
+                        (metrics.format_labels(pool=name, state='idle'), idle),
+                        ],
+                    'created_total': [(metrics.format_labels(pool=name), self._created)],
+                    'discarded_total': [(metrics.format_labels(pool=name), self._discarded)],
+                    'timeouts_total': [(metrics.format_labels(pool=name), self._timeouts)],
+                    'wait_seconds': list(self._wait.expose('handywsgi_pool_wait_seconds', pool=name)),
+                    }
+
+
+# (name, type, help) of the pool metrics, without the handywsgi_pool_ prefix.
+_METRICS = (
+        ('resources', 'gauge', 'Pooled resources by state.'),
+        ('created_total', 'counter', 'Resources created.'),
+        ('discarded_total', 'counter', 'Resources closed after failing a health check or a request.'),
+        ('timeouts_total', 'counter', 'Checkouts that timed out.'),
+        ('wait_seconds', 'histogram', 'Time to check out a resource.'),
+        )
+
+
+class PoolCollector:
+    """ Exposes the metrics of several pools for ``handywsgi.metrics.Metrics.register``. """
+
+    def __init__(self, pools):
+        self.pools = pools
+
+    def collect(self):
+        samples = [pool.samples() for _, pool in sorted(self.pools.items())]
+        for name, kind, description in _METRICS:
+            metric = 'handywsgi_pool_' + name
+            yield '# HELP {} {}'.format(metric, description)
+            yield '# TYPE {} {}'.format(metric, kind)
+            for pool_samples in samples:
+                if kind == 'histogram':
+                    yield from pool_samples[name]
+                else:
+                    for labels, value in pool_samples[name]:
+                        yield '{}{} {}'.format(metric, labels, value)
+
+
+def _close(resource):
+    close = getattr(resource, 'close', None)
+    if close:
+        close()
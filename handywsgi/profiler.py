@@ -0,0 +1,224 @@
+""" On-demand per-request profiling and slow request logging. """
+
+import collections
+import cProfile
+import hmac
+import io
+import logging
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    """ Profile a sample of requests with ``cProfile``.
+
+    A request is profiled if it wins the ``sample_rate`` lottery or carries
+    ``trigger_header`` with the value ``trigger_secret``. Profiles are
+    aggregated per route and written to ``<output_dir>/<route>.<pid>.pstats``
+    by ``dump()``, which ``Adapter.close`` calls, never in a request. Every
+    worker of a prefork server writes its own files; load them together with
+    ``pstats.Stats(*glob.glob('<output_dir>/<route>.*.pstats'))``.
+
+    Requests that take at least ``slow_threshold`` seconds are logged with
+    their ``top`` functions: by cumulative time if the request was profiled,
+    otherwise by how often they were on the request thread's stack while a
+    background thread sampled it every ``sample_interval`` seconds after the
+    threshold had passed.
+
+    Args:
+        sample_rate (float): Fraction of requests to profile (0.0 - 1.0).
+            Defaults to ``0.0``.
+        trigger_header (str): HTTP header that forces profiling, e.g.
+            ``'X-Profile'``.
+        trigger_secret (str): The value ``trigger_header`` must have.
+        output_dir (str): Directory for the ``.pstats`` files.
+        slow_threshold (float): Latency in seconds above which requests are
+            logged. Defaults to None (disabled).
+        top (int): Number of functions to log for slow requests. Defaults to 10.
+        sample_interval (float): Seconds between stack samples of slow
+            requests. Defaults to 0.01.
+
+    """
+
+    def __init__(self, sample_rate=0.0, trigger_header=None, trigger_secret=None,
+                 output_dir=None, slow_threshold=None, top=10, sample_interval=0.01):
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.slow_threshold = slow_threshold
+        self.top = top
+        self.sample_interval = sample_interval
+        self._trigger_key = None
+        self._trigger_secret = None
+        if trigger_header and trigger_secret:
+            self._trigger_key = 'HTTP_' + trigger_header.upper().replace('-', '_')
+            self._trigger_secret = trigger_secret.encode('utf-8')
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._profiled = {}
+        self._slow = {}
+        self._dirty = set()
+        # Thread id -> [started, Counter of sampled functions] of the
+        # unprofiled requests in flight.
+        self._active = {}
+        self._busy = threading.Event()
+        self._sampler_pid = None
+
+    def should_profile(self, environ):
+        """ Returns True if the request described by ``environ`` should be profiled. """
+        if self._trigger_key:
+            value = environ.get(self._trigger_key)
+            if value and hmac.compare_digest(value.encode('utf-8'), self._trigger_secret):
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def run(self, route, environ, func, *args):
+        """ Call ``func(*args)``, profiling it if ``should_profile(environ)``. """
+        profile = cProfile.Profile() if self.should_profile(environ) else None
+        sampled = None
+        started = time.perf_counter()
+        if profile is None and self.slow_threshold is not None:
+            sampled = self._watch(started)
+        try:
+            if profile:
+                return profile.runcall(func, *args)
+            return func(*args)
+        finally:
+            if sampled is not None:
+                with self._lock:
+                    self._active.pop(threading.get_ident(), None)
+                    if not self._active:
+                        self._busy.clear()
+            self._finish(route, environ, profile, sampled, time.perf_counter() - started)
+
+    def _watch(self, started):
+        """ Register this thread's request with the stack sampler. Returns its sample counter. """
+        sampled = collections.Counter()
+        with self._lock:
+            if self._sampler_pid != os.getpid():
+                self._sampler_pid = os.getpid()
+                threading.Thread(target=self._sample, name='handywsgi-profiler', daemon=True).start()
+            self._active[threading.get_ident()] = [started, sampled]
+            self._busy.set()
+        return sampled
+
+    def _sample(self):
+        """ Count the functions on the stacks of requests past ``slow_threshold``. """
+        while True:
+            self._busy.wait()
+            time.sleep(self.sample_interval)
+            now = time.perf_counter()
+            with self._lock:
+                slow = {
+                        thread_id: sampled for thread_id, (started, sampled) in self._active.items()
+                        if now - started >= self.slow_threshold
+                        }
+            if not slow:
+                continue
+            frames = sys._current_frames()
+            stacks = {}
+            for thread_id in slow:
+                frame = frames.get(thread_id)
+                # Innermost first so ties in ``most_common`` favour callees;
+                # the frames outside the request are left out.
+                functions = {}
+                while frame is not None and frame.f_code is not _RUN_CODE:
+                    code = frame.f_code
+                    functions['{}:{}({})'.format(code.co_filename, code.co_firstlineno, code.co_name)] = 1
+                    frame = frame.f_back
+                stacks[thread_id] = functions
+            del frames, frame
+            with self._lock:
+                for thread_id, functions in stacks.items():
+                    # Skip requests that finished while their stack was read.
+                    if thread_id in self._active and self._active[thread_id][1] is slow[thread_id]:
+                        slow[thread_id].update(functions)
+                        slow[thread_id][None] += 1
+
+    def _finish(self, route, environ, profile, sampled, duration):
+        """ Aggregate ``profile`` and log the request if it was slow. """
+        slow = self.slow_threshold is not None and duration >= self.slow_threshold
+        if profile:
+            with self._lock:
+                self._profiled[route] = self._profiled.get(route, 0) + 1
+                if route in self._stats:
+                    self._stats[route].add(profile)
+                else:
+                    self._stats[route] = pstats.Stats(profile)
+                self._dirty.add(route)
+        if slow:
+            with self._lock:
+                self._slow[route] = self._slow.get(route, 0) + 1
+            self._log_slow(route, environ, profile, sampled, duration)
+
+    def _log_slow(self, route, environ, profile, sampled, duration):
+        message = 'slow request: {} {} (route {}) took {:.3f}s'.format(
+                environ.get('REQUEST_METHOD'),
+                environ.get('PATH_INFO'),
+                route,
+                duration
+                )
+        if profile:
+            output = io.StringIO()
+            pstats.Stats(profile, stream=output).sort_stats('cumulative').print_stats(self.top)
+            message = '{}\n{}'.format(message, output.getvalue())
+        elif sampled:
+            samples = sampled.pop(None, 0)
+            lines = ['{:>6} {}'.format(count, function) for function, count in sampled.most_common(self.top)]
+            message = '{}\nfunctions on the stack in {} samples after {:.3f}s:\n{}'.format(
+                    message, samples, self.slow_threshold, '\n'.join(lines))
+        logger.warning(message)
+
+    def dump(self):
+        """ Write the stats of the routes profiled since the last dump to ``output_dir``.
+
+        Returns:
+            list: The files written.
+
+        """
+        if not self.output_dir:
+            return []
+        with self._lock:
+            routes, self._dirty = self._dirty, set()
+            # marshal is what pstats.Stats.dump_stats writes, copying the
+            # stats here keeps the file I/O out of the lock.
+            data = {route: marshal.dumps(self._stats[route].stats) for route in routes}
+        os.makedirs(self.output_dir, exist_ok=True)
+        written = []
+        pid = os.getpid()
+        for route, stats in sorted(data.items()):
+            filename = os.path.join(
+                    self.output_dir,
+                    '{}.{}.pstats'.format(route.strip('/').replace('/', '_') or 'index', pid)
+                    )
+            with open(filename, 'wb') as output:
+                output.write(stats)
+            written.append(filename)
+        return written
+
+    def stats(self, route):
+        """ Returns the aggregated ``pstats.Stats`` for ``route`` or None. """
+        return self._stats.get(route)
+
+    def collect(self):
+        """ Yield Prometheus lines for ``handywsgi.metrics.Metrics.register``. """
+        yield '# HELP handywsgi_profiled_requests_total Requests profiled by route.'
+        yield '# TYPE handywsgi_profiled_requests_total counter'
+        for route, count in sorted(self._profiled.items()):
+            yield 'handywsgi_profiled_requests_total{} {}'.format(metrics.format_labels(route=route), count)
+        yield '# HELP handywsgi_slow_requests_total Requests over the slow threshold by route.'
+        yield '# TYPE handywsgi_slow_requests_total counter'
+        for route, count in sorted(self._slow.items()):
+            yield 'handywsgi_slow_requests_total{} {}'.format(metrics.format_labels(route=route), count)
+
+
+_RUN_CODE = Profiler.run.__code__
@@ -0,0 +1,263 @@
+""" Record sampled traffic and replay it for benchmarking.
+
+``Recorder`` wraps an ``Adapter`` (or any WSGI app) and appends a sample of
+requests to a file. Each record is::
+
+    >II header length, body length | JSON header | body
+
+where the header holds the arrival time and a subset of the environ.
+
+Usage::
+
+    python -m handywsgi.replay FILE (--app MODULE:ATTR | --url http://HOST:PORT)
+                               [--speed 1.0] [--concurrency 8]
+
+"""
+
+import argparse
+import concurrent.futures
+import http.client
+import io
+import json
+import random
+import struct
+import sys
+import threading
+import time
+import urllib.parse
+
+from . import loader
+from .benchmark import make_environ, call, percentile
+from .writer import QueuedWriter
+
+
+_FRAME = struct.Struct('>II')
+# Environ keys recorded in addition to HTTP_* headers.
+ENVIRON_KEYS = ('REQUEST_METHOD', 'PATH_INFO', 'QUERY_STRING', 'CONTENT_TYPE', 'CONTENT_LENGTH')
+# Headers not recorded by default because they carry credentials.
+PRIVATE_HEADERS = ('HTTP_COOKIE', 'HTTP_AUTHORIZATION', 'HTTP_PROXY_AUTHORIZATION')
+
+
+class Recorder:
+    """ WSGI middleware that records a sample of requests.
+
+    Args:
+        app (callable): The WSGI app to wrap, usually an ``Adapter``.
+        filename (str): The record file. Records are appended.
+        sample_rate (float): Fraction of requests to record (0.0 - 1.0).
+            Defaults to ``1.0``.
+        max_body (int): Requests with larger bodies are not recorded.
+            Defaults to 1 MiB.
+        exclude (tuple): Environ keys never recorded. Defaults to ``PRIVATE_HEADERS``.
+        max_queue (int): Records that may wait for the background writer;
+            more are dropped. Defaults to 10000.
+
+    """
+
+    def __init__(self, app, filename, sample_rate=1.0, max_body=1024 * 1024, exclude=PRIVATE_HEADERS,
+                 max_queue=10000):
+        self.app = app
+        self.filename = filename
+        self.sample_rate = sample_rate
+        self.max_body = max_body
+        self.exclude = frozenset(exclude)
+        self._writer = QueuedWriter(filename, max_queue, name='handywsgi-recorder')
+
+    def __call__(self, environ, start_response):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return self.app(environ, start_response)
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > self.max_body:
+            return self.app(environ, start_response)
+        body = environ['wsgi.input'].read(length) if length > 0 else b''
+        environ['wsgi.input'] = io.BytesIO(body)
+        self.record(environ, body)
+        return self.app(environ, start_response)
+
+    def record(self, environ, body):
+        """ Queue one request to be appended to the record file. """
+        header = {
+                key: value for key, value in environ.items()
+                if (key in ENVIRON_KEYS or key.startswith('HTTP_')) and key not in self.exclude
+                }
+        header = json.dumps({'time': time.time(), 'environ': header}, separators=(',', ':')).encode('utf-8')
+        self._writer.put(_FRAME.pack(len(header), len(body)) + header + body)
+
+    def close(self, timeout=None):
+        """ Write the queued records, then close the wrapped app if it has ``close``.
+
+        Returns:
+            bool: True if both finished within ``timeout`` seconds.
+
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        written = self._writer.close(timeout)
+        close = getattr(self.app, 'close', None)
+        if close is None:
+            return written
+        return close(None if deadline is None else max(0, deadline - time.monotonic())) and written
+
+
+def read_records(filename):
+    """ Yield ``(time, environ, body)`` tuples from a record file. """
+    with open(filename, 'rb') as records:
+        while True:
+            frame = records.read(_FRAME.size)
+            if len(frame) < _FRAME.size:
+                return
+            header_length, body_length = _FRAME.unpack(frame)
+            header = records.read(header_length)
+            body = records.read(body_length)
+            if len(header) < header_length or len(body) < body_length:
+                # A record cut short by a crash while it was written.
+                return
+            try:
+                header = json.loads(header.decode('utf-8'))
+            except ValueError:
+                return
+            yield header['time'], header['environ'], body
+
+
+def route_of(environ):
+    """ Returns the report label of a recorded request (the first path segment). """
+    return (environ.get('PATH_INFO') or '/').strip('/').split('/', 1)[0] or '/'
+
+
+class InProcessTarget:
+    """ Replay requests directly into a WSGI app. """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, body):
+        request_environ = make_environ(body=body)
+        request_environ.update(environ)
+        request_environ['wsgi.input'] = io.BytesIO(body)
+        call(self.app, request_environ)
+
+
+class HTTPTarget:
+    """ Replay requests against a server at ``url``. """
+
+    def __init__(self, url):
+        parts = urllib.parse.urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self._local = threading.local()
+
+    def __call__(self, environ, body):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        path = self.prefix + (environ.get('PATH_INFO') or '/')
+        if environ.get('QUERY_STRING'):
+            path = '{}?{}'.format(path, environ['QUERY_STRING'])
+        headers = {
+                key[5:].replace('_', '-').title(): value
+                for key, value in environ.items() if key.startswith('HTTP_')
+                }
+        if environ.get('CONTENT_TYPE'):
+            headers['Content-Type'] = environ['CONTENT_TYPE']
+        try:
+            connection.request(environ.get('REQUEST_METHOD', 'GET'), path, body=body or None, headers=headers)
+            connection.getresponse().read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            raise
+
+
+def replay(records, target, speed=1.0, concurrency=1):
+    """ Replay ``records`` into ``target`` and measure per-route latency.
+
+    Args:
+        records (iterable): ``(time, environ, body)`` tuples from ``read_records``.
+        target (callable): ``target(environ, body)``, e.g. ``InProcessTarget``.
+        speed (float): Time scale of the original arrival times. ``2.0`` replays
+            twice as fast and ``0`` as fast as possible.
+        concurrency (int): Requests that may be in flight at once.
+
+    Latency is measured from the time a request was scheduled to be sent, not
+    from when a thread got to send it, so a slow target that delays later
+    requests shows up in their latency (no coordinated omission). With
+    ``speed=0`` there is no schedule and latency is the target's response time.
+
+    Returns:
+        dict: ``{route: {'requests', 'errors', 'p50', 'p95', 'p99'}}``.
+
+    """
+    latencies = {}
+    errors = {}
+    lock = threading.Lock()
+
+    def send(environ, body, scheduled):
+        route = route_of(environ)
+        started = time.monotonic() if scheduled is None else scheduled
+        try:
+            target(environ, body)
+        except Exception:
+            with lock:
+                errors[route] = errors.get(route, 0) + 1
+            return
+        elapsed = time.monotonic() - started
+        with lock:
+            latencies.setdefault(route, []).append(elapsed)
+
+    first = None
+    clock_started = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        for recorded_at, environ, body in records:
+            if first is None:
+                first = recorded_at
+            scheduled = None
+            if speed:
+                scheduled = clock_started + (recorded_at - first) / speed
+                delay = scheduled - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            if concurrency > 1:
+                executor.submit(send, environ, body, scheduled)
+            else:
+                send(environ, body, scheduled)
+    report = {}
+    for route in set(latencies) | set(errors):
+        values = sorted(latencies.get(route, []))
+        report[route] = {
+                'requests': len(values),
+                'errors': errors.get(route, 0),
+                'p50': percentile(values, 0.50),
+                'p95': percentile(values, 0.95),
+                'p99': percentile(values, 0.99),
+                }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m handywsgi.replay', description='Replay recorded traffic.')
+    parser.add_argument('filename', help='a file written by Recorder')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--app', help='replay in-process into MODULE:ATTR')
+    target.add_argument('--url', help='replay over HTTP against URL')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='speed up factor of the original timing, 0 for as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=1, help='requests in flight at once')
+    args = parser.parse_args(argv)
+    if args.app:
+        replay_target = InProcessTarget(loader.load(args.app))
+    else:
+        replay_target = HTTPTarget(args.url)
+    report = replay(read_records(args.filename), replay_target, args.speed, args.concurrency)
+    print('{:<20} {:>10} {:>8} {:>10} {:>10} {:>10}'.format('route', 'requests', 'errors', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for route, stats in sorted(report.items()):
+        print('{:<20} {:>10} {:>8} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+                route, stats['requests'], stats['errors'],
+                stats['p50'] * 1000, stats['p95'] * 1000, stats['p99'] * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
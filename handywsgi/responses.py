@@ -0,0 +1,136 @@
+""" Typed responses that skip templating.
+
+An ``Application`` handler that returns one of these has it written straight
+to the response instead of rendering ``config.default_template``::
+
+    def GET(self, context):
+        return responses.JSON({'status': 'ok'})
+
+"""
+
+import abc
+import json
+
+
+class TypedResponse(abc.ABC):
+    """ Base class of responses that write themselves.
+
+    Subclasses implement ``write``.
+
+    Args:
+        status (int or status.HTTPStatus): Defaults to the current response status.
+        headers (dict): Extra headers.
+        content_type (str): Overrides the class ``content_type``.
+
+    """
+
+    content_type = None
+
+    def __init__(self, status=None, headers=None, content_type=None):
+        self.status = status
+        self.headers = headers or {}
+        if content_type:
+            self.content_type = content_type
+
+    def send(self, context):
+        """ Set the status and headers and write the body to ``context.response``. """
+        if self.status is not None:
+            context.response.status = self.status
+        if self.content_type:
+            context.add_header('Content-Type', self.content_type, unique=True)
+        for key, value in self.headers.items():
+            context.add_header(key, value, unique=True)
+        self.write(context)
+
+    @abc.abstractmethod
+    def write(self, context):
+        """ Write the body to ``context.response``. """
+
+
+class JSON(TypedResponse):
+    """ Serialize ``data`` as JSON into the output buffer.
+
+    Args:
+        data: Anything ``json.dumps`` accepts.
+
+    Keyword Arguments:
+        ...: See ``TypedResponse``.
+
+    """
+
+    content_type = 'application/json; charset=utf-8'
+
+    def __init__(self, data, **kwargs):
+        super().__init__(**kwargs)
+        self.data = data
+
+    def write(self, context):
+        context.response.output.write(
+                json.dumps(self.data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+                )
+
+
+class Raw(TypedResponse):
+    """ Send ``body`` as is.
+
+    Args:
+        body (bytes or str): ``str`` is encoded as UTF-8.
+
+    Keyword Arguments:
+        ...: See ``TypedResponse``.
+
+    """
+
+    content_type = 'application/octet-stream'
+
+    def __init__(self, body, **kwargs):
+        super().__init__(**kwargs)
+        self.body = body
+
+    def write(self, context):
+        context.response.output.write(self.body)
+
+
+class Stream(TypedResponse):
+    """ Send the chunks of ``iterable`` as they are produced.
+
+    The iterable is handed to the WSGI server instead of the output buffer, so
+    nothing is buffered. ``str`` chunks are encoded as UTF-8.
+
+    Args:
+        iterable: Yields ``bytes`` or ``str`` chunks.
+
+    Keyword Arguments:
+        ...: See ``TypedResponse``.
+
+    """
+
+    content_type = 'application/octet-stream'
+
+    def __init__(self, iterable, **kwargs):
+        super().__init__(**kwargs)
+        self.iterable = iterable
+
+    def write(self, context):
+        context.response.body = _Encoded(self.iterable)
+
+
+class _Encoded:
+    """ Encode ``str`` chunks of an iterable and pass ``close()`` through. """
+
+    def __init__(self, iterable):
+        self._iterable = iterable
+        self._iterator = iter(iterable)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = next(self._iterator)
+        if isinstance(chunk, str):
+            return chunk.encode('utf-8')
+        return chunk
+
+    def close(self):
+        if hasattr(self._iterable, 'close'):
+            self._iterable.close()
@@ -0,0 +1,564 @@
+""" A prefork, multi-threaded HTTP/1.1 WSGI server.
+
+The master process loads the app once, binds the listening socket and forks
+``workers`` processes that share it (or bind their own with ``SO_REUSEPORT``).
+Every worker serves connections from a pool of ``threads`` threads with
+HTTP/1.1 keep-alive. Workers that die are restarted.
+
+Signals to the master:
+    SIGTERM, SIGINT: Stop accepting, let in-flight requests finish and exit.
+    SIGHUP: Reload the app module and gracefully replace all workers.
+    SIGQUIT: Exit immediately.
+
+Usage::
+
+    python -m handywsgi.server MODULE:ATTR [--bind HOST:PORT] [--workers N]
+                               [--threads N] [--reuse-port] [--graceful-timeout SECONDS]
+                               [--max-body BYTES]
+
+"""
+
+import argparse
+import concurrent.futures
+import http.server
+import importlib
+import io
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import urllib.parse
+
+from . import loader
+
+
+logger = logging.getLogger(__name__)
+
+# Default largest request body, chunked or not.
+MAX_BODY = 100 * 1024 * 1024
+
+
+class _Input:
+    """ ``wsgi.input`` that stops at the end of the request body. """
+
+    def __init__(self, rfile, length):
+        self._rfile = rfile
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._rfile.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        line = self._rfile.readline(size)
+        self._remaining -= len(line)
+        return line
+
+    def readlines(self, hint=-1):
+        return list(iter(self.readline, b''))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def drain(self):
+        """ Discard the unread rest of the body so the connection can be reused. """
+        while self.read(65536):
+            pass
+
+
+class BodyTooLarge(Exception):
+    """ The request body is larger than the server's ``max_body``. """
+
+
+def _read_chunked(rfile, max_body):
+    """ Returns a chunked request body decoded into a ``BytesIO``.
+
+    Raises:
+        BodyTooLarge: The decoded body exceeds ``max_body`` bytes.
+
+    """
+    body = io.BytesIO()
+    while True:
+        size = int(rfile.readline(65537).split(b';', 1)[0], 16)
+        if body.tell() + size > max_body:
+            raise BodyTooLarge()
+        if size == 0:
+            # Skip trailers.
+            while rfile.readline(65537) not in (b'\r\n', b'\n', b''):
+                pass
+            break
+        body.write(rfile.read(size))
+        rfile.readline(65537)
+    body.seek(0)
+    return body
+
+
+class WSGIRequestHandler(http.server.BaseHTTPRequestHandler):
+    """ Serve WSGI requests over an HTTP/1.1 keep-alive connection. """
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, Nagle would delay the body.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        self.timeout = self.server.keepalive
+        super().setup()
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except socket.timeout:
+            self.close_connection = True
+            return
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > 65536:
+            self.send_error(414)
+            return
+        if not self.parse_request():
+            return
+        try:
+            environ = self.make_environ()
+        except BodyTooLarge:
+            self.close_connection = True
+            self.send_error(413)
+            return
+        except ValueError:
+            self.close_connection = True
+            self.send_error(400)
+            return
+        self.run_wsgi(environ)
+        self.wfile.flush()
+
+    def make_environ(self):
+        path, _, query = self.path.partition('?')
+        environ = {
+                'REQUEST_METHOD': self.command,
+                'SCRIPT_NAME': '',
+                'PATH_INFO': urllib.parse.unquote(path, 'iso-8859-1'),
+                'QUERY_STRING': query,
+                'SERVER_NAME': self.server.server_name,
+                'SERVER_PORT': str(self.server.server_port),
+                'SERVER_PROTOCOL': self.request_version,
+                'SERVER_SOFTWARE': 'handywsgi',
+                'REMOTE_ADDR': self.client_address[0],
+                'wsgi.version': (1, 0),
+                'wsgi.url_scheme': 'http',
+                'wsgi.errors': sys.stderr,
+                'wsgi.multithread': True,
+                'wsgi.multiprocess': self.server.multiprocess,
+                'wsgi.run_once': False,
+                # Lets apps size per-process limits, e.g. sse.EventStream.max_streams.
+                'handywsgi.threads': self.server.threads,
+                }
+        for key, value in self.headers.items():
+            key = key.upper().replace('-', '_')
+            if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[key] = value
+            elif key != 'TRANSFER_ENCODING':
+                key = 'HTTP_' + key
+                environ[key] = '{},{}'.format(environ[key], value) if key in environ else value
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = _read_chunked(self.rfile, self.server.max_body)
+            environ['CONTENT_LENGTH'] = str(len(body.getvalue()))
+            environ['wsgi.input'] = _Input(body, len(body.getvalue()))
+        else:
+            try:
+                length = int(environ.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                length = 0
+            if length > self.server.max_body:
+                raise BodyTooLarge()
+            environ['wsgi.input'] = _Input(self.rfile, length)
+        return environ
+
+    def run_wsgi(self, environ):
+        self._response = None
+        self._headers_sent = False
+        self._chunked = False
+        try:
+            result = self.server.app(environ, self.start_response)
+            try:
+                if isinstance(result, (list, tuple)) and self.command != 'HEAD':
+                    self._set_length(sum(len(data) for data in result))
+                for data in result:
+                    if data:
+                        self.write(data)
+                if not self._headers_sent:
+                    self.write(b'')
+                if self._chunked:
+                    self.wfile.write(b'0\r\n\r\n')
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        except (ConnectionError, socket.timeout):
+            self.close_connection = True
+            return
+        except Exception:
+            logger.exception('error serving %s %s', self.command, self.path)
+            self.close_connection = True
+            if not self._headers_sent:
+                self.send_error(500)
+            return
+        environ['wsgi.input'].drain()
+
+    def start_response(self, status, headers, exc_info=None):
+        if exc_info:
+            try:
+                if self._headers_sent:
+                    raise exc_info[1].with_traceback(exc_info[2])
+            finally:
+                exc_info = None
+        self._response = (status, list(headers))
+        return self.write
+
+    def _set_length(self, length):
+        status, headers = self._response
+        if not any(key.lower() == 'content-length' for key, _ in headers):
+            headers.append(('Content-Length', str(length)))
+
+    def _send_headers(self):
+        status, headers = self._response
+        code, _, reason = status.partition(' ')
+        code = int(code)
+        self.send_response(code, reason)
+        names = set()
+        for key, value in headers:
+            names.add(key.lower())
+            self.send_header(key, value)
+        bodyless = self.command == 'HEAD' or code in (204, 304) or code < 200
+        if 'content-length' not in names and not bodyless:
+            if self.request_version == 'HTTP/1.1':
+                self._chunked = True
+                self.send_header('Transfer-Encoding', 'chunked')
+            else:
+                self.close_connection = True
+        if self.server.should_close():
+            self.close_connection = True
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self._headers_sent = True
+
+    def write(self, data):
+        if self._response is None:
+            raise AssertionError('write() before start_response()')
+        if not self._headers_sent:
+            self._send_headers()
+        if not data or self.command == 'HEAD':
+            return
+        if self._chunked:
+            self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+        else:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class ThreadPoolServer(socketserver.TCPServer):
+    """ Serve connections from an already listening socket with a thread pool.
+
+    Args:
+        sock (socket.socket): A bound and listening socket.
+        app (callable): The WSGI app.
+        threads (int): Size of the thread pool. Given to apps as the
+            ``handywsgi.threads`` environ key.
+        keepalive (float): Seconds an idle keep-alive connection is kept open.
+        multiprocess (bool): The ``wsgi.multiprocess`` value.
+        max_body (int): Larger request bodies are refused with a ``413``.
+            Defaults to ``MAX_BODY``.
+
+    """
+
+    def __init__(self, sock, app, threads=8, keepalive=5.0, multiprocess=True, max_body=None):
+        super().__init__(sock.getsockname(), WSGIRequestHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        self.app = app
+        self.keepalive = keepalive
+        self.multiprocess = multiprocess
+        self.max_body = MAX_BODY if max_body is None else max_body
+        host, port = sock.getsockname()[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.threads = threads
+        self._executor = concurrent.futures.ThreadPoolExecutor(threads)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._draining = False
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self._waiting += 1
+        self._executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        with self._lock:
+            self._waiting -= 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def should_close(self):
+        """ Returns True if keep-alive connections should be closed.
+
+        That is when draining or when accepted connections are waiting for a
+        thread, so idle keep-alive connections don't starve new clients.
+
+        """
+        return self._draining or self._waiting > 0
+
+    def drain(self, timeout):
+        """ Stop accepting and wait up to ``timeout`` seconds for in-flight requests.
+
+        Then the app's ``close(timeout)`` (see ``Adapter.close``) gets the rest
+        of the time to finish its background tasks.
+
+        """
+        deadline = time.monotonic() + timeout
+        self._draining = True
+        self.shutdown()
+        waiter = threading.Thread(target=self._executor.shutdown, kwargs={'wait': True}, daemon=True)
+        waiter.start()
+        waiter.join(timeout)
+        if waiter.is_alive():
+            return False
+        close = getattr(self.app, 'close', None)
+        if close:
+            return close(max(0, deadline - time.monotonic()))
+        return True
+
+    def handle_error(self, request, client_address):
+        logger.exception('error handling connection from %s', client_address)
+
+
+def bind(address, reuse_port=False, backlog=2048, listen=True):
+    """ Returns a listening TCP socket for ``address`` (a ``(host, port)`` tuple).
+
+    With ``listen=False`` the socket is only bound, which reserves the port
+    without receiving connections.
+
+    """
+    family = socket.AF_INET6 if ':' in address[0] else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(address)
+    if listen:
+        sock.listen(backlog)
+    return sock
+
+
+class PreforkServer:
+    """ Fork and supervise worker processes.
+
+    Args:
+        app (callable or str): The WSGI app or a ``MODULE:ATTR`` spec. Only a
+            spec can be reloaded with SIGHUP.
+        address (tuple): ``(host, port)`` to listen on.
+        workers (int): Number of worker processes. Defaults to the CPU count.
+        threads (int): Threads per worker. Defaults to 8.
+        reuse_port (bool): Let every worker bind its own socket with
+            ``SO_REUSEPORT`` instead of sharing the master's.
+        graceful_timeout (float): Seconds workers get to finish in-flight
+            requests when stopping. Defaults to 30.
+        keepalive (float): Seconds idle keep-alive connections are kept.
+        max_body (int): Largest request body accepted. Defaults to ``MAX_BODY``.
+
+    """
+
+    def __init__(self, app, address=('127.0.0.1', 8000), workers=None, threads=8,
+                 reuse_port=False, graceful_timeout=30.0, keepalive=5.0, max_body=None):
+        self.spec = app if isinstance(app, str) else None
+        self.app = loader.load(app) if self.spec else app
+        self.address = address
+        self.workers = workers or os.cpu_count() or 1
+        self.threads = threads
+        self.reuse_port = reuse_port
+        self.graceful_timeout = graceful_timeout
+        self.keepalive = keepalive
+        self.max_body = max_body
+        self.socket = None
+        self._children = {}
+        self._stopping = False
+        self._reload = False
+
+    def bind(self):
+        """ Bind the listening socket. Returns the bound ``(host, port)``.
+
+        With ``reuse_port`` the master's socket only holds the port and never
+        listens; otherwise the kernel would queue connections on it that no
+        worker accepts.
+
+        """
+        if self.socket is None:
+            self.socket = bind(self.address, self.reuse_port, listen=not self.reuse_port)
+            # With port 0 the workers must bind the port the master got.
+            self.address = self.socket.getsockname()[:2]
+        return self.address
+
+    def run(self):
+        """ Run until stopped by a signal. """
+        self.bind()
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGQUIT, self._on_quit)
+        logger.info('listening on %s:%s with %d workers', self.address[0], self.address[1], self.workers)
+        generation = 0
+        for _ in range(self.workers):
+            self._spawn(generation)
+        while not self._stopping:
+            if self._reload:
+                self._reload = False
+                generation += 1
+                self._replace_workers(generation)
+            self._reap(generation)
+            time.sleep(0.2)
+        self._signal_all(signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self._children and time.monotonic() < deadline:
+            self._reap(generation)
+            time.sleep(0.1)
+        self._signal_all(signal.SIGKILL)
+        self.socket.close()
+
+    def _spawn(self, generation):
+        pid = os.fork()
+        if pid:
+            self._children[pid] = (generation, time.monotonic())
+            return
+        status = 0
+        try:
+            self._run_worker()
+        except BaseException:
+            logger.exception('worker %d failed', os.getpid())
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _run_worker(self):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGQUIT, signal.SIG_DFL)
+        if self.reuse_port:
+            self.socket.close()
+            sock = bind(self.address, reuse_port=True)
+        else:
+            sock = self.socket
+        server = ThreadPoolServer(sock, self.app, self.threads, self.keepalive, max_body=self.max_body)
+        done = threading.Event()
+
+        def stop(signum, frame):
+            threading.Thread(target=lambda: (server.drain(self.graceful_timeout), done.set())).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        server.serve_forever()
+        done.wait(self.graceful_timeout + 1)
+
+    def _reap(self, generation):
+        """ Collect dead workers and restart current ones that died. """
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._children.clear()
+                return
+            if not pid:
+                return
+            worker_generation, started = self._children.pop(pid, (None, 0))
+            if self._stopping or worker_generation != generation:
+                continue
+            logger.warning('worker %d exited with status %d, restarting', pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < 1.0:
+                # Don't spin if workers die on startup.
+                time.sleep(1.0)
+            self._spawn(generation)
+
+    def _replace_workers(self, generation):
+        """ Start a new generation of workers then drain the old one. """
+        if self.spec:
+            module_name = self.spec.partition(':')[0]
+            try:
+                importlib.reload(sys.modules[module_name])
+                self.app = loader.load(self.spec)
+            except Exception:
+                logger.exception('reloading %s failed, keeping the running app', self.spec)
+        old = [pid for pid, (worker_generation, _) in self._children.items() if worker_generation < generation]
+        for _ in range(self.workers):
+            self._spawn(generation)
+        for pid in old:
+            self._kill(pid, signal.SIGTERM)
+
+    def _signal_all(self, signum):
+        for pid in list(self._children):
+            self._kill(pid, signum)
+
+    @staticmethod
+    def _kill(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def _on_reload(self, signum, frame):
+        self._reload = True
+
+    def _on_quit(self, signum, frame):
+        self._signal_all(signal.SIGKILL)
+        os._exit(1)
+
+
+def serve(app, host='127.0.0.1', port=8000, **kwargs):
+    """ Serve ``app`` with a ``PreforkServer``. See it for the keyword arguments. """
+    PreforkServer(app, (host, port), **kwargs).run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m handywsgi.server', description='Serve a WSGI app.')
+    parser.add_argument('app', help='MODULE:ATTR of the WSGI app')
+    parser.add_argument('--bind', default='127.0.0.1:8000', help='HOST:PORT to listen on')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to the CPU count')
+    parser.add_argument('--threads', type=int, default=8, help='threads per worker')
+    parser.add_argument('--reuse-port', action='store_true', help='bind a socket per worker with SO_REUSEPORT')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0, help='seconds to drain on stop')
+    parser.add_argument('--keepalive', type=float, default=5.0, help='idle keep-alive timeout in seconds')
+    parser.add_argument('--max-body', type=int, default=MAX_BODY, help='largest request body in bytes')
+    args = parser.parse_args(argv)
+    host, _, port = args.bind.rpartition(':')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(levelname)s %(message)s')
+    sys.path.insert(0, os.getcwd())
+    serve(args.app, host.strip('[]') or '127.0.0.1', int(port),
+          workers=args.workers,
+          threads=args.threads,
+          reuse_port=args.reuse_port,
+          graceful_timeout=args.graceful_timeout,
+          keepalive=args.keepalive,
+          max_body=args.max_body)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+""" Counters shared by forked worker processes.
+
+``SharedStore`` keeps float counters in an anonymous shared ``mmap`` created
+before the workers fork. Every process writes only its own column of values,
+so increments need no cross-process lock; readers add up all columns::
+
+    store = SharedStore()
+    metrics = Metrics(store=store)
+    PreforkServer(Adapter(apps, metrics=metrics), workers=8).run()
+
+A lock is taken only to add a new key or claim a column. It is an ``fcntl``
+lock on an unlinked temporary file, which the kernel releases when its owner
+dies, so a worker killed while holding it doesn't block the others. Columns
+are owned the same way: each process holds a lock on one byte of the file for
+its column, and a column whose lock can be taken is free, even if the pid of
+its last owner was reused.
+
+"""
+
+import contextlib
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import weakref
+
+
+_HEADER = struct.Struct('=q')
+_KEY_LENGTH = struct.Struct('=H')
+_VALUE = struct.Struct('=d')
+
+
+class SharedStore:
+    """ Float counters keyed by tuples of strings and numbers, shared across processes.
+
+    Args:
+        slots (int): Distinct keys the store can hold. Defaults to 4096, which
+            fits the metrics of about 40 routes (see
+            ``handywsgi.metrics.Metrics.shared_slots``).
+        workers (int): Processes that can write at once. A column of a dead
+            process is taken over with its values, so totals never go
+            backwards. Defaults to 64.
+        key_size (int): Bytes available for a JSON encoded key. Defaults to 128.
+
+    """
+
+    def __init__(self, slots=4096, workers=64, key_size=128):
+        self.slots = slots
+        self.workers = workers
+        self.key_size = key_size
+        self._keys_offset = _HEADER.size
+        self._values_offset = self._keys_offset + slots * key_size
+        self._map = mmap.mmap(-1, self._values_offset + workers * slots * _VALUE.size)
+        # Byte 0 is the store lock, byte 1 + i the ownership of column i.
+        self._lock_file = tempfile.TemporaryFile()
+        self._local = None
+        self._pid = None
+        self._reset()
+        after_fork = weakref.WeakMethod(self._reset)
+        os.register_at_fork(after_in_child=lambda: after_fork() and after_fork()())
+
+    def _reset(self):
+        # A fork can copy these locks while another thread holds them.
+        self._thread_lock = threading.Lock()
+        self._attach_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _shared_lock(self):
+        """ Hold the store lock against the other threads and processes. """
+        with self._thread_lock:
+            fcntl.lockf(self._lock_file, fcntl.LOCK_EX, 1, 0)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_file, fcntl.LOCK_UN, 1, 0)
+
+    def _attach(self):
+        """ Claim a value column for this process. """
+        with self._attach_lock:
+            if self._pid != os.getpid():
+                self._claim()
+
+    def _claim(self):
+        column = None
+        with self._shared_lock():
+            for index in range(self.workers):
+                try:
+                    fcntl.lockf(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, 1 + index)
+                except OSError:
+                    continue
+                column = index
+                break
+        if column is None:
+            raise RuntimeError('all {} SharedStore columns are taken'.format(self.workers))
+        self._local = _Local(self._values_offset + column * self.slots * _VALUE.size)
+        self._pid = os.getpid()
+
+    def _slot(self, key):
+        """ Returns the slot index of ``key``, adding it if it is new. """
+        local = self._local
+        slot = local.slots.get(key)
+        if slot is None:
+            with self._shared_lock():
+                self._refresh(local)
+                slot = local.slots.get(key)
+                if slot is None:
+                    slot = self._add_key(local, key)
+        return slot
+
+    def _refresh(self, local):
+        """ Read keys added by other processes. Call with ``_shared_lock`` held. """
+        count, = _HEADER.unpack_from(self._map, 0)
+        for slot in range(local.known, count):
+            offset = self._keys_offset + slot * self.key_size
+            length, = _KEY_LENGTH.unpack_from(self._map, offset)
+            start = offset + _KEY_LENGTH.size
+            key = tuple(json.loads(self._map[start:start + length].decode('utf-8')))
+            local.slots[key] = slot
+        local.known = count
+
+    def _add_key(self, local, key):
+        """ Store a new key. Call with ``_shared_lock`` held. """
+        encoded = json.dumps(key, separators=(',', ':')).encode('utf-8')
+        if len(encoded) > self.key_size - _KEY_LENGTH.size:
+            raise ValueError('key too long for SharedStore: {!r}'.format(key))
+        slot = local.known
+        if slot >= self.slots:
+            raise RuntimeError('all {} SharedStore slots are taken'.format(self.slots))
+        offset = self._keys_offset + slot * self.key_size
+        _KEY_LENGTH.pack_into(self._map, offset, len(encoded))
+        start = offset + _KEY_LENGTH.size
+        self._map[start:start + len(encoded)] = encoded
+        _HEADER.pack_into(self._map, 0, slot + 1)
+        local.slots[key] = slot
+        local.known = slot + 1
+        return slot
+
+    def add_many(self, amounts):
+        """ Add ``amount`` to ``key`` for every ``(key, amount)`` pair.
+
+        Raises:
+            RuntimeError: A new key doesn't fit in ``slots``, or every column is
+                taken. Nothing is added.
+            ValueError: A key is too long for ``key_size``. Nothing is added.
+
+        """
+        if self._pid != os.getpid():
+            self._attach()
+        local = self._local
+        with local.lock:
+            # Find every slot first so a full store adds none of the amounts.
+            updates = [(local.column + self._slot(key) * _VALUE.size, amount) for key, amount in amounts]
+            for offset, amount in updates:
+                value, = _VALUE.unpack_from(self._map, offset)
+                _VALUE.pack_into(self._map, offset, value + amount)
+
+    def add(self, key, amount=1):
+        """ Add ``amount`` to ``key``. """
+        self.add_many(((key, amount),))
+
+    def totals(self):
+        """ Returns ``{key: total over all processes}``. """
+        if self._pid != os.getpid():
+            self._attach()
+        local = self._local
+        with self._shared_lock():
+            self._refresh(local)
+        totals = {}
+        columns = [self._values_offset + index * self.slots * _VALUE.size for index in range(self.workers)]
+        for key, slot in local.slots.items():
+            total = 0.0
+            for column in columns:
+                total += _VALUE.unpack_from(self._map, column + slot * _VALUE.size)[0]
+            totals[key] = total
+        return totals
+
+
+class _Local:
+    """ The per-process state of a ``SharedStore``. """
+
+    def __init__(self, column):
+        self.column = column
+        # Threads of one process share its column.
+        self.lock = threading.Lock()
+        self.slots = {}
+        self.known = 0
+
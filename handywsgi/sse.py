@@ -0,0 +1,281 @@
+""" Server-Sent Events.
+
+A handler returns an ``EventStream`` over a generator of events::
+
+    def GET(self, context):
+        def events():
+            while True:
+                yield sse.Event(json.dumps(status.current()), event='status')
+                status.wait_for_change()
+        return sse.EventStream(events())
+
+Each event is encoded and handed to the WSGI server as its own chunk. While the
+generator is idle a comment line is sent every ``heartbeat`` seconds, which
+keeps proxies from timing out the connection and finds clients that went away:
+the failed write makes the server close the body, and the generator is closed
+after its next event.
+
+A generator that blocks between events can't be interrupted by closing it. Pass
+a function instead, it is called with a ``threading.Event`` that is set when
+the stream is closed, and can wait on it::
+
+    def events(stopped):
+        while not stopped.wait(5):
+            yield sse.Event(json.dumps(status.current()))
+
+    return sse.EventStream(events, max_duration=300)
+
+"""
+
+import queue
+import threading
+import time
+
+from . import responses, status
+
+
+class Event:
+    """ One event.
+
+    Args:
+        data (str): The payload. Multi-line data is split over ``data:`` fields.
+        event (str): The event type, ``message`` when not set.
+        id (str): Sets the client's ``Last-Event-ID``.
+        retry (int): Reconnection delay in milliseconds.
+
+    """
+
+    def __init__(self, data, event=None, id=None, retry=None):
+        self.data = data
+        self.event = event
+        self.id = id
+        self.retry = retry
+
+    def encode(self):
+        """ Returns the wire format of the event. """
+        lines = []
+        if self.event is not None:
+            lines.append('event: {}'.format(self.event))
+        if self.id is not None:
+            lines.append('id: {}'.format(self.id))
+        if self.retry is not None:
+            lines.append('retry: {}'.format(int(self.retry)))
+        for line in str(self.data).splitlines() or ['']:
+            lines.append('data: {}'.format(line))
+        return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+def encode(event):
+    """ Encode an ``Event``, or a ``str`` or ``bytes`` as the data of a message. """
+    if isinstance(event, Event):
+        return event.encode()
+    if isinstance(event, bytes):
+        event = event.decode('utf-8')
+    return Event(event).encode()
+
+
+HEARTBEAT = b': heartbeat\n\n'
+# Marks the end of the generator on the queue of a ``_HeartbeatStream``.
+_END = object()
+
+
+class EventStream(responses.TypedResponse):
+    """ Stream the events of a generator as ``text/event-stream``.
+
+    At most ``max_streams`` streams are open per process; more raise
+    ``status.ServiceUnavailable``. Every open stream holds a server thread, so
+    the cap must leave threads for other requests: by default it is half the
+    threads the ``handywsgi.server`` worker serves with.
+
+    Args:
+        events: Yields ``Event``, ``str`` or ``bytes``, or a function that
+            takes the stream's stop ``threading.Event`` and returns such an
+            iterable.
+        heartbeat (float): Seconds of silence before a heartbeat is sent.
+            Defaults to 15. None sends no heartbeats and iterates ``events``
+            in the server thread; otherwise a thread started on the first
+            read of the body runs the generator.
+        max_duration (float): Seconds after which the stream ends, the client
+            reconnects with its ``Last-Event-ID``. Defaults to None (never).
+
+    Keyword Arguments:
+        ...: See ``responses.TypedResponse``.
+
+    Attributes:
+        max_streams (int): Class-wide cap on open streams. Defaults to None,
+            half the ``handywsgi.threads`` of the environ, or 100 under other
+            servers, which must be sized to match.
+
+    """
+
+    content_type = 'text/event-stream; charset=utf-8'
+    max_streams = None
+    _lock = threading.Lock()
+    _open = 0
+
+    def __init__(self, events, heartbeat=15.0, max_duration=None, **kwargs):
+        super().__init__(**kwargs)
+        self.headers = dict(self.headers)
+        self.headers.setdefault('Cache-Control', 'no-cache')
+        # Tells nginx not to buffer the stream.
+        self.headers.setdefault('X-Accel-Buffering', 'no')
+        self.events = events
+        self.heartbeat = heartbeat
+        self.max_duration = max_duration
+
+    @classmethod
+    def open_streams(cls):
+        """ Returns the number of open streams. """
+        return EventStream._open
+
+    def _max_streams(self, context):
+        if self.max_streams is not None:
+            return self.max_streams
+        threads = context.request.environment.get('handywsgi.threads')
+        return max(1, threads // 2) if threads else 100
+
+    def write(self, context):
+        with EventStream._lock:
+            if EventStream._open >= self._max_streams(context):
+                if hasattr(self.events, 'close'):
+                    self.events.close()
+                raise status.ServiceUnavailable()
+            EventStream._open += 1
+        try:
+            stopped = threading.Event()
+            events = self.events(stopped) if callable(self.events) else self.events
+            if self.heartbeat is None:
+                context.response.body = _Stream(events, stopped, self.max_duration)
+            else:
+                context.response.body = _HeartbeatStream(events, stopped, self.max_duration, self.heartbeat)
+        except BaseException:
+            _release()
+            raise
+
+
+def _release():
+    with EventStream._lock:
+        EventStream._open -= 1
+
+
+class _Stream:
+    """ Encode the events of a generator in the server thread. """
+
+    def __init__(self, events, stopped, max_duration):
+        self._events = events
+        self._iterator = iter(events)
+        self._stopped = stopped
+        self._max_duration = max_duration
+        self._deadline = None
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def _expired(self):
+        """ Returns True once ``max_duration`` has passed since the first read. """
+        if self._max_duration is None:
+            return False
+        if self._deadline is None:
+            self._deadline = time.monotonic() + self._max_duration
+        return time.monotonic() >= self._deadline
+
+    def __next__(self):
+        if self._expired():
+            raise StopIteration
+        return encode(next(self._iterator))
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stopped.set()
+        try:
+            if hasattr(self._events, 'close'):
+                self._events.close()
+        finally:
+            _release()
+
+
+class _HeartbeatStream(_Stream):
+    """ Run the generator in a thread and send heartbeats while it is idle. """
+
+    def __init__(self, events, stopped, max_duration, heartbeat):
+        self._events = events
+        self._stopped = stopped
+        self._max_duration = max_duration
+        self._deadline = None
+        self._heartbeat = heartbeat
+        # One encoded event is buffered, a slow client holds the generator back.
+        self._queue = queue.Queue(1)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def _produce(self, events):
+        try:
+            for event in events:
+                chunk = encode(event)
+                while not self._stopped.is_set():
+                    try:
+                        self._queue.put(chunk, timeout=self._heartbeat)
+                        break
+                    except queue.Full:
+                        pass
+                if self._stopped.is_set():
+                    return
+        except Exception as error:
+            self._put_end(error)
+            return
+        finally:
+            if hasattr(events, 'close'):
+                events.close()
+        self._put_end(_END)
+
+    def _put_end(self, value):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(value, timeout=self._heartbeat)
+                return
+            except queue.Full:
+                pass
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._produce, args=(self._events,), daemon=True)
+                self._thread.start()
+        timeout = self._heartbeat
+        if self._expired():
+            raise StopIteration
+        if self._deadline is not None:
+            timeout = min(timeout, max(0, self._deadline - time.monotonic()))
+        try:
+            chunk = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            if self._expired():
+                raise StopIteration
+            return HEARTBEAT
+        if chunk is _END:
+            raise StopIteration
+        if isinstance(chunk, Exception):
+            raise chunk
+        return chunk
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            started = self._thread is not None
+        self._stopped.set()
+        try:
+            # A running producer closes the generator itself after its next
+            # event; one that never ran is closed here.
+            if not started and hasattr(self._events, 'close'):
+                self._events.close()
+        finally:
+            _release()
@@ -87,11 +87,13 @@ class NoMethod(HTTPError):
 
     def __init__(self, app):
         super().__init__()
-        self.headers = {'Content-Type': 'text/html'}
-        methods = HTTP_REQUEST_METHODS
-        if app:
-            methods = [method for method in methods if hasattr(app, method)]
-        self.headers['Allow'] = ', '.join(methods)
+        allow = getattr(app, 'allowed_methods', None)
+        if allow is None:
+            methods = HTTP_REQUEST_METHODS
+            if app:
+                methods = [method for method in methods if hasattr(app, method)]
+            allow = ', '.join(methods)
+        self.headers = {'Content-Type': 'text/html', 'Allow': allow}
 
 
 class NotAcceptable(HTTPError):
@@ -130,6 +132,13 @@ class UnsupportedMediaType(HTTPError):
     status = '415 Unsupported Media Type'
 
 
+class TooManyRequests(HTTPError):
+    """`429 Too Many Requests` error."""
+
+    message = 'too many requests'
+    status = '429 Too Many Requests'
+
+
 class InternalError(HTTPError):
     """`500 Internal Server Error`."""
 
@@ -137,6 +146,20 @@ class InternalError(HTTPError):
     status = '500 Internal Server Error'
 
 
+class ServiceUnavailable(HTTPError):
+    """`503 Service Unavailable` error."""
+
+    message = 'service unavailable'
+    status = '503 Service Unavailable'
+
+
+class GatewayTimeout(HTTPError):
+    """`504 Gateway Timeout` error."""
+
+    message = 'gateway timeout'
+    status = '504 Gateway Timeout'
+
+
 class HTTPRedirect(HTTPError):
     """Abstract redirect.
 
@@ -202,7 +225,10 @@ CODE_TO_STATS_MAP = {200: OK,
                      410: Gone,
                      412: PreconditionFailed,
                      415: UnsupportedMediaType,
-                     500: InternalError}
+                     429: TooManyRequests,
+                     500: InternalError,
+                     503: ServiceUnavailable,
+                     504: GatewayTimeout}
 
 
 def from_code(code):
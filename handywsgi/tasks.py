@@ -0,0 +1,194 @@
+""" Background tasks that run after the response is sent.
+
+Handlers queue work with ``context.add_task(func, *args, **kwargs)``. The
+``Adapter`` hands the tasks to its ``TaskQueue`` when the WSGI server closes the
+response body, that is after the last byte was written to the client.
+
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Tells a worker thread to exit.
+_STOP = None
+
+
+class TaskQueue:
+    """ A bounded queue served by a fixed number of worker threads.
+
+    Workers are started on the first ``submit`` in each process, so a queue
+    built before a prefork server forks works in every worker. A task that
+    raises is logged and counted; it never reaches the client.
+
+    Args:
+        workers (int): Worker threads. Defaults to 4.
+        max_queue (int): Tasks that may wait. ``submit`` drops tasks while the
+            queue is full. Defaults to 1000.
+
+    """
+
+    def __init__(self, workers=4, max_queue=1000):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._queue = None
+        self._threads = []
+        self._pid = None
+        self._closed = False
+        self._completed = 0
+        self._failed = 0
+        self._dropped = 0
+
+    def _start(self):
+        """ Start the workers of this process. Call with ``_lock`` held. """
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.max_queue)
+        self._threads = [
+                threading.Thread(target=self._work, args=(self._queue,), name='handywsgi-task-{}'.format(index), daemon=True)
+                for index in range(self.workers)
+                ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        """ Queue ``func(*args, **kwargs)``.
+
+        Returns:
+            bool: False if the task was dropped because the queue is full or closed.
+
+        """
+        with self._lock:
+            if self._closed:
+                self._dropped += 1
+                return False
+            if self._pid != os.getpid():
+                self._start()
+            try:
+                self._queue.put_nowait((func, args, kwargs))
+            except queue.Full:
+                self._dropped += 1
+                logger.warning('task queue full, dropped %r', func)
+                return False
+        return True
+
+    def _work(self, tasks):
+        while True:
+            task = tasks.get()
+            if task is _STOP:
+                return
+            func, args, kwargs = task
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                logger.exception('background task %r failed', func)
+                with self._lock:
+                    self._failed += 1
+            else:
+                with self._lock:
+                    self._completed += 1
+
+    def depth(self):
+        """ Returns the number of tasks waiting. """
+        return self._queue.qsize() if self._queue and self._pid == os.getpid() else 0
+
+    def shutdown(self, timeout=None):
+        """ Stop accepting tasks and wait for the queued ones to finish.
+
+        Args:
+            timeout (float): Seconds to wait. Defaults to None (no limit).
+
+        Returns:
+            bool: True if every queued task ran.
+
+        """
+        with self._lock:
+            self._closed = True
+            if self._pid != os.getpid():
+                return True
+            threads = self._threads
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def remaining():
+            return None if deadline is None else max(0, deadline - time.monotonic())
+
+        try:
+            for _ in threads:
+                # Waits while the queue is full, the workers are still taking tasks.
+                self._queue.put(_STOP, timeout=remaining())
+        except queue.Full:
+            return False
+        for thread in threads:
+            thread.join(remaining())
+        return not any(thread.is_alive() for thread in threads)
+
+    def collect(self):
+        """ Yield Prometheus lines for ``handywsgi.metrics.Metrics.register``. """
+        with self._lock:
+            completed, failed, dropped = self._completed, self._failed, self._dropped
+        yield '# HELP handywsgi_task_queue_depth Background tasks waiting for a worker.'
+        yield '# TYPE handywsgi_task_queue_depth gauge'
+        yield 'handywsgi_task_queue_depth {}'.format(self.depth())
+        yield '# HELP handywsgi_tasks_total Background tasks by outcome.'
+        yield '# TYPE handywsgi_tasks_total counter'
+        yield 'handywsgi_tasks_total{{outcome="completed"}} {}'.format(completed)
+        yield 'handywsgi_tasks_total{{outcome="failed"}} {}'.format(failed)
+        yield 'handywsgi_tasks_total{{outcome="dropped"}} {}'.format(dropped)
+
+
+def run_all(tasks):
+    """ Run ``(func, args, kwargs)`` tasks in this thread, logging failures. """
+    for func, args, kwargs in tasks:
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            logger.exception('background task %r failed', func)
+
+
+def after_response(body, callback):
+    """ Wrap a response body so ``callback`` runs once the server closes it.
+
+    WSGI servers call ``close()`` after the body was sent, even when the client
+    went away, so ``callback`` runs exactly once per response. A list body stays
+    a list so servers can still set ``Content-Length`` from it.
+
+    """
+    if isinstance(body, list):
+        return _ListAfterResponse(body, callback)
+    return _AfterResponse(body, callback)
+
+
+class _ListAfterResponse(list):
+
+    def __init__(self, body, callback):
+        super().__init__(body)
+        self._callback = callback
+
+    def close(self):
+        callback, self._callback = self._callback, None
+        if callback:
+            callback()
+
+
+class _AfterResponse:
+
+    def __init__(self, body, callback):
+        self._body = body
+        self._callback = callback
+
+    def __iter__(self):
+        return iter(self._body)
+
+    def close(self):
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            callback, self._callback = self._callback, None
+            if callback:
+                callback()
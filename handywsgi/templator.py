@@ -57,7 +57,7 @@ class Templator:
 
     def __init__(self, base_path='templates', file_extension='html', auto_reload=True):
         self._base_path = base_path
-        self._loader = TemplateLoader(self.base_path, auto_reload=auto_reload)
+        self._loader = TemplateLoader(self._base_path, auto_reload=auto_reload)
         self._file_extension = file_extension
 
     def load(self, name, file_extension=None):
@@ -0,0 +1,101 @@
+""" Request tracing with spans exported as Chrome trace-event JSON.
+
+The output file uses the JSON array format of the trace-event spec and can be
+opened with https://ui.perfetto.dev or ``chrome://tracing``. The closing
+``]`` is optional in that format so events are simply appended.
+
+See https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+
+"""
+
+import json
+import os
+import random
+import threading
+
+from .writer import QueuedWriter
+
+
+class Tracer:
+    """ Write the spans of sampled requests to ``filename``.
+
+    Events are written by a background thread (see
+    ``handywsgi.writer.QueuedWriter``); when it falls behind by ``max_queue``
+    traces, further traces are dropped.
+
+    Args:
+        filename (str): The trace file. Events are appended if it exists.
+        sample_rate (float): Fraction of requests to trace (0.0 - 1.0).
+            Defaults to ``0.01``.
+        max_queue (int): Traces that may wait for the writer. Defaults to 1000.
+
+    """
+
+    def __init__(self, filename, sample_rate=0.01, max_queue=1000):
+        self.filename = filename
+        self.sample_rate = sample_rate
+        self._writer = QueuedWriter(filename, max_queue, header=b'[\n', name='handywsgi-tracer')
+
+    def start(self):
+        """ Returns a new ``Trace`` or None if this request is not sampled. """
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return None
+        return Trace(self)
+
+    def write(self, events):
+        """ Queue trace events to be appended to ``filename``.
+
+        Span arguments that aren't JSON types are written as their ``str``.
+
+        """
+        lines = ''.join(json.dumps(event, separators=(',', ':'), default=str) + ',\n' for event in events)
+        self._writer.put(lines.encode('utf-8'))
+
+    def close(self, timeout=None):
+        """ Write the queued traces. Returns True if done within ``timeout`` seconds. """
+        return self._writer.close(timeout)
+
+
+class Trace:
+    """ The spans of one request.
+
+    Args:
+        tracer (Tracer): Where ``finish()`` sends the spans.
+
+    """
+
+    def __init__(self, tracer):
+        self._tracer = tracer
+        self._pid = os.getpid()
+        self._tid = threading.get_ident()
+        self.events = []
+
+    def add(self, name, started, finished, **args):
+        """ Add a span.
+
+        Args:
+            name (str): The span name.
+            started (float): ``time.perf_counter()`` at the start of the span.
+            finished (float): ``time.perf_counter()`` at the end of the span.
+
+        Keyword Arguments:
+            ...: Shown as the span's arguments in the trace viewer.
+
+        """
+        event = {
+                'name': name,
+                'cat': 'handywsgi',
+                'ph': 'X',
+                'ts': round(started * 1e6, 3),
+                'dur': round((finished - started) * 1e6, 3),
+                'pid': self._pid,
+                'tid': self._tid,
+                }
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def finish(self, name, started, finished, **args):
+        """ Add the root span and write all spans to the tracer. """
+        self.add(name, started, finished, **args)
+        self._tracer.write(self.events)
@@ -0,0 +1,137 @@
+""" Append to a file from a background thread.
+
+Used by the tracer and the traffic recorder so requests only put bytes on an
+in-memory queue and never wait for disk I/O. ``handywsgi.access_log`` has its
+own writer because it rotates and samples.
+
+"""
+
+import logging
+import os
+import queue
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+# Tells the writer thread to flush and exit.
+_STOP = object()
+
+
+class QueuedWriter:
+    """ Append byte strings to ``filename`` in batches.
+
+    The writer thread is started on the first ``put`` in each process, so every
+    worker of a prefork server has its own.
+
+    Args:
+        filename (str): The file. Data is appended if it exists.
+        max_queue (int): Byte strings that may wait for the writer; more are
+            dropped. Defaults to 10000.
+        flush_interval (float): Seconds the writer waits for more data
+            before it checks for ``close``. Defaults to 1.0.
+        header (bytes): Written first when the file is empty.
+        name (str): The writer thread's name.
+
+    Attributes:
+        written (int): Byte strings written.
+        dropped (int): Byte strings dropped because the queue was full, the
+            writer was closed or writing failed.
+
+    """
+
+    def __init__(self, filename, max_queue=10000, flush_interval=1.0, header=b'', name='handywsgi-writer'):
+        self.filename = filename
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        self.header = header
+        self.name = name
+        self.written = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._closed = False
+
+    def put(self, data):
+        """ Queue ``data``. Never blocks.
+
+        Returns:
+            bool: False if ``data`` was dropped.
+
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._closed:
+                    self.dropped += 1
+                    return False
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._queue = queue.Queue(self.max_queue)
+                    self._thread = threading.Thread(target=self._write, args=(self._queue,), name=self.name, daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def depth(self):
+        """ Returns the number of byte strings waiting for the writer. """
+        with self._lock:
+            return self._queue.qsize() if self._queue and self._pid == os.getpid() else 0
+
+    def _write(self, items):
+        with open(self.filename, 'ab') as output:
+            if self.header and output.tell() == 0:
+                output.write(self.header)
+            stopping = False
+            while not stopping:
+                try:
+                    item = items.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                batch = []
+                while True:
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                    try:
+                        item = items.get_nowait()
+                    except queue.Empty:
+                        break
+                if not batch:
+                    continue
+                try:
+                    output.write(b''.join(batch))
+                    output.flush()
+                except OSError:
+                    logger.exception('failed writing to %s', self.filename)
+                    with self._lock:
+                        self.dropped += len(batch)
+                    continue
+                with self._lock:
+                    self.written += len(batch)
+
+    def close(self, timeout=None):
+        """ Write the queued data and stop the writer.
+
+        Returns:
+            bool: True if everything was written within ``timeout`` seconds.
+
+        """
+        with self._lock:
+            self._closed = True
+            if self._pid != os.getpid():
+                return True
+            thread, self._pid = self._thread, None
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return False
+        thread.join(timeout)
+        return not thread.is_alive()
@@ -31,5 +31,6 @@ setup(
         author='haxwithaxe',
         author_email='spam@haxwithaxe.net',
         url='https://github.com/haxwithaxe/handywsgi',
-        packages=find_packages()
+        packages=find_packages(),
+        package_data={'handywsgi.benchmark': ['templates/*.html']}
         )
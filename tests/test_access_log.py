@@ -0,0 +1,85 @@
+import json
+import os
+import queue
+
+import pytest
+
+from handywsgi.access_log import AccessLog
+from handywsgi.adapter import Adapter
+from handywsgi.benchmark import call, make_environ
+
+
+def read(path):
+    with open(path) as lines:
+        return [json.loads(line) for line in lines]
+
+
+def stalled(access_log):
+    """ Give ``access_log`` a queue that no writer drains. """
+    access_log._pid = os.getpid()
+    access_log._queue = queue.Queue(access_log.max_queue)
+    return access_log
+
+
+def test_adapter_logs_every_request(tmp_path):
+    path = tmp_path / 'access-{pid}.log'
+    access_log = AccessLog(str(path))
+    adapter = Adapter({'page': lambda context: context.response.output.write('hello')}, access_log=access_log)
+    call(adapter, make_environ('/page'))
+    call(adapter, make_environ('/missing/page'))
+    assert access_log.close(5)
+    records = read(str(path).format(pid=os.getpid()))
+    assert [(record['route'], record['status']) for record in records] == [('page', 200), ('not_found', 404)]
+    assert records[0]['bytes'] == 5
+    assert records[0]['method'] == 'GET' and records[0]['client'] == '127.0.0.1'
+
+
+def test_rotation_keeps_backups(tmp_path):
+    path = str(tmp_path / 'access.log')
+    access_log = AccessLog(path, max_bytes=200, backups=2, batch_size=1)
+    for number in range(20):
+        access_log.log(number=number)
+    assert access_log.close(5)
+    assert sorted(os.listdir(str(tmp_path))) == ['access.log', 'access.log.1', 'access.log.2']
+    assert read(path)[-1]['number'] == 19
+
+
+def test_full_queue_drops():
+    access_log = stalled(AccessLog(os.devnull, max_queue=2))
+    for number in range(5):
+        access_log.log(number=number)
+    assert 'handywsgi_access_log_records_total{outcome="dropped"} 3' in list(access_log.collect())
+
+
+def test_half_full_queue_samples():
+    access_log = stalled(AccessLog(os.devnull, max_queue=4, overflow='sample', sample_rate=0.0))
+    for number in range(5):
+        access_log.log(number=number)
+    assert access_log._queue.qsize() == 2
+    assert 'handywsgi_access_log_records_total{outcome="sampled_out"} 3' in list(access_log.collect())
+
+
+def test_unknown_overflow():
+    with pytest.raises(ValueError):
+        AccessLog(os.devnull, overflow='block')
+
+
+def test_unopenable_file_counts_failed_records(tmp_path):
+    access_log = AccessLog(str(tmp_path / 'missing' / 'access.log'))
+    access_log.log(number=1)
+    access_log.log(number=2)
+    assert access_log.close(5)
+    assert 'handywsgi_access_log_records_total{outcome="failed"} 2' in list(access_log.collect())
+
+
+def test_forked_workers_do_not_rotate_a_shared_file(tmp_path):
+    path = str(tmp_path / 'access.log')
+    access_log = AccessLog(path, max_bytes=100, batch_size=1)
+    pid = os.fork()
+    if pid == 0:
+        for number in range(10):
+            access_log.log(number=number)
+        os._exit(0 if access_log.close(5) else 1)
+    assert os.waitpid(pid, 0)[1] == 0
+    assert os.listdir(str(tmp_path)) == ['access.log']
+    assert len(read(path)) == 10
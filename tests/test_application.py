@@ -0,0 +1,81 @@
+from handywsgi.adapter import Adapter
+from handywsgi.application import Application
+from handywsgi.benchmark import make_environ
+
+
+class Config:
+    default_template = 'page'
+    template_path = '.'
+    template_extension = 'html'
+
+
+class Template:
+
+    def render(self, app):
+        return 'rendered {}'.format(app.content)
+
+
+class Templator:
+
+    def __init__(self):
+        self.loaded = []
+
+    def load(self, name):
+        self.loaded.append(name)
+        return Template()
+
+
+class Page(Application):
+
+    def GET(self, context):
+        return 'page'
+
+    def POST(self, context):
+        return 'posted'
+
+
+def request(app, method):
+    captured = []
+    body = Adapter({'page': app})(
+            make_environ('/page', method),
+            lambda status_line, headers, exc_info=None: captured.append((status_line, dict(headers)))
+            )
+    status_line, headers = captured[0]
+    return status_line, headers, b''.join(body)
+
+
+def make_page():
+    page = Page(Config())
+    page.templator = Templator()
+    return page
+
+
+def test_allowed_methods_are_computed_per_class():
+    assert Page.allowed_methods == 'GET, HEAD, POST, OPTIONS'
+    assert set(Page._methods) == {'GET', 'POST'}
+
+
+def test_get_renders_the_default_template():
+    page = make_page()
+    assert request(page, 'GET')[2] == b'rendered page'
+    assert page.templator.loaded == ['page']
+
+
+def test_head_runs_get_without_rendering():
+    page = make_page()
+    status_line, headers, body = request(page, 'HEAD')
+    assert status_line.startswith('200')
+    assert body == b''
+    assert page.templator.loaded == []
+
+
+def test_options_answers_with_allow():
+    status_line, headers, body = request(make_page(), 'OPTIONS')
+    assert status_line.startswith('200')
+    assert headers['Allow'] == 'GET, HEAD, POST, OPTIONS'
+
+
+def test_unknown_method_is_405_with_allow():
+    status_line, headers, body = request(make_page(), 'DELETE')
+    assert status_line.startswith('405')
+    assert headers['Allow'] == 'GET, HEAD, POST, OPTIONS'
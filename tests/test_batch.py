@@ -0,0 +1,83 @@
+import json
+
+from handywsgi import responses, sse, status
+from handywsgi.adapter import Adapter
+from handywsgi.batch import BatchEndpoint
+from handywsgi.benchmark import make_environ
+from handywsgi.limits import RateLimiter
+
+
+def echo(context):
+    environ = context.request.environment
+    context.response.output.write('{} {}'.format(environ['REQUEST_METHOD'], environ['wsgi.input'].read().decode()))
+
+
+def run(adapter, items):
+    body = json.dumps(items).encode()
+    captured = []
+    result = adapter(
+            make_environ('/batch', 'POST', body=body, content_type='application/json'),
+            lambda status_line, headers, exc_info=None: captured.append(status_line)
+            )
+    assert captured == [status.OK.status]
+    return json.loads(b''.join(result))
+
+
+def test_sub_requests_in_order():
+    adapter = Adapter({'echo': echo}, batch=BatchEndpoint())
+    results = run(adapter, [{'path': '/echo'}, {'path': '/missing/page'}])
+    assert [result['status'] for result in results] == [200, 404]
+    assert results[0]['body'] == 'GET '
+
+
+def test_string_body_reaches_handler():
+    adapter = Adapter({'echo': echo}, batch=BatchEndpoint())
+    results = run(adapter, [{'method': 'POST', 'path': '/echo', 'body': 'a=1&b=2'}])
+    assert results[0]['body'] == 'POST a=1&b=2'
+
+
+def test_json_put_body():
+    adapter = Adapter({'echo': echo}, batch=BatchEndpoint())
+    results = run(adapter, [{'method': 'PUT', 'path': '/echo', 'body': {'a': 1}}])
+    assert results[0] == {'status': 200, 'headers': results[0]['headers'], 'body': 'PUT {"a":1}'}
+
+
+def test_sub_requests_are_rate_limited():
+    adapter = Adapter({'echo': echo}, batch=BatchEndpoint(), rate_limiter=RateLimiter(0.001, burst=5))
+    results = run(adapter, [{'path': '/echo'}] * 6)
+    # The batch itself took the first token.
+    assert [result['status'] for result in results] == [200] * 4 + [429] * 2
+
+
+def test_json_put_outside_batch():
+    adapter = Adapter({'echo': echo})
+    captured = []
+    environ = make_environ('/echo', 'PATCH', body=b'{"a": 1}', content_type='application/json')
+    body = adapter(environ, lambda status_line, headers, exc_info=None: captured.append(status_line))
+    assert captured == [status.OK.status]
+    assert b''.join(body) == b'PATCH {"a": 1}'
+
+
+def test_streaming_sub_responses_are_rejected():
+    closed = []
+
+    class Endless:
+
+        def __iter__(self):
+            while True:
+                yield b'more'
+
+        def close(self):
+            closed.append(1)
+
+    def stream(context):
+        responses.Stream(Endless()).send(context)
+
+    def events(context):
+        sse.EventStream(iter(['one']), heartbeat=None).send(context)
+
+    adapter = Adapter({'stream': stream, 'events': events, 'echo': echo}, batch=BatchEndpoint())
+    results = run(adapter, [{'path': '/stream'}, {'path': '/events'}, {'path': '/echo'}])
+    assert [result['status'] for result in results] == [400, 400, 200]
+    assert closed == [1]
+    assert sse.EventStream.open_streams() == 0
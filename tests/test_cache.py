@@ -0,0 +1,82 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from handywsgi.adapter import Adapter
+from handywsgi.cache import DataCache, MemoryBackend, SQLiteBackend
+from handywsgi.pool import Pool
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def cache(request, tmp_path):
+    if request.param == 'memory':
+        return DataCache(MemoryBackend(max_entries=3))
+    return DataCache(SQLiteBackend(str(tmp_path / 'cache.db')))
+
+
+def test_get_or_compute_and_ttl(cache):
+    calls = []
+    assert cache.get_or_compute('a', lambda: calls.append(1) or 'x', ttl=60) == 'x'
+    assert cache.get_or_compute('a', lambda: calls.append(1) or 'y', ttl=60) == 'x'
+    assert calls == [1]
+    cache.set('b', 'old', ttl=-1)
+    assert cache.get('b', 'missing') == 'missing'
+
+
+def test_invalidate_by_tag(cache):
+    cache.set('u1', 1, tags=['user:1'])
+    cache.set('u2', 2, tags=['user:2'])
+    assert cache.invalidate('user:1') == 1
+    assert cache.get('u1') is None
+    assert cache.get('u2') == 2
+
+
+def test_memory_backend_evicts_least_recently_used():
+    cache = DataCache(MemoryBackend(max_entries=2))
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+
+
+def test_concurrent_misses_compute_once():
+    cache = DataCache()
+    calls = []
+    started = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return 'value'
+
+    threads = [threading.Thread(target=cache.get_or_compute, args=('k', slow)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+
+
+def test_sqlite_hits_do_not_write(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'cache.db'))
+    cache = DataCache(backend)
+    cache.set('a', 1)
+    # Hold the write lock from another connection; reads must not wait for it.
+    writer = sqlite3.connect(str(tmp_path / 'cache.db'), isolation_level=None)
+    writer.execute('BEGIN IMMEDIATE')
+    try:
+        backend._local.connection.execute('PRAGMA busy_timeout = 0')
+        assert cache.get('a') == 1
+    finally:
+        writer.execute('ROLLBACK')
+        writer.close()
+
+
+def test_pool_named_cache_collides_with_data_cache():
+    with pytest.raises(ValueError):
+        Adapter({}, pools={'cache': Pool(object)}, data_cache=DataCache())
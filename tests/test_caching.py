@@ -0,0 +1,71 @@
+import pytest
+
+from handywsgi import status
+from handywsgi.adapter import Adapter
+from handywsgi.benchmark import make_environ
+from handywsgi.caching import NO_STORE, CachePolicy, cache, http_date, policy_for
+
+
+def request(adapter, path, method='GET'):
+    captured = []
+    adapter(make_environ(path, method), lambda status_line, headers, exc_info=None: captured.append((status_line, headers)))
+    status_line, headers = captured[0]
+    return status_line, dict(headers)
+
+
+def test_policy_headers():
+    policy = CachePolicy(max_age=60, s_maxage=600, public=True, stale_while_revalidate=30, vary=('Accept-Encoding',))
+    assert policy.headers(now=0) == [
+            ('Cache-Control', 'public, max-age=60, s-maxage=600, stale-while-revalidate=30'),
+            ('Expires', 'Thu, 01 Jan 1970 00:01:00 GMT'),
+            ('Vary', 'Accept-Encoding'),
+            ]
+    assert http_date(0) == 'Thu, 01 Jan 1970 00:00:00 GMT'
+
+
+def test_contradictory_policies():
+    with pytest.raises(ValueError):
+        CachePolicy(public=False, s_maxage=60)
+    with pytest.raises(ValueError):
+        CachePolicy(no_store=True, max_age=60)
+
+
+def test_policy_for_methods():
+    @cache(CachePolicy(max_age=60), POST=NO_STORE)
+    def app(context):
+        pass
+
+    default = CachePolicy(max_age=1)
+    assert policy_for(app, 'GET') is app.cache_policy
+    assert policy_for(app, 'HEAD') is app.cache_policy
+    assert policy_for(app, 'POST') is NO_STORE
+    assert policy_for(app, 'PUT') is None
+    assert policy_for(lambda context: None, 'GET', default) is default
+
+
+def test_adapter_applies_policy_and_merges_vary():
+    @cache(CachePolicy(max_age=60, vary=('Accept-Encoding',)))
+    def page(context):
+        context.add_header('Vary', 'Accept-Language')
+
+    status_line, headers = request(Adapter({'page': page}), '/page')
+    assert headers['Cache-Control'] == 'max-age=60'
+    assert headers['Vary'] == 'Accept-Encoding, Accept-Language'
+
+
+def test_errors_are_not_stored():
+    @cache(CachePolicy(max_age=60, public=True))
+    def missing(context):
+        raise status.NotFound(context.request.query.path)
+
+    status_line, headers = request(Adapter({'missing': missing}), '/missing')
+    assert status_line.startswith('404')
+    assert headers['Cache-Control'] == 'no-store'
+
+
+def test_handler_cache_control_wins():
+    @cache(CachePolicy(max_age=60))
+    def page(context):
+        context.add_header('Cache-Control', 'no-cache')
+
+    assert request(Adapter({'page': page}), '/page')[1]['Cache-Control'] == 'no-cache'
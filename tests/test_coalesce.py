@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from handywsgi.adapter import Adapter
+from handywsgi.benchmark import call, make_environ
+from handywsgi.coalesce import Coalescer, SingleFlight
+
+
+def run_concurrently(leader, follower):
+    """ Start ``follower`` while ``leader`` is running and return both results. """
+    results = {}
+    thread = threading.Thread(target=lambda: results.setdefault('leader', leader()))
+    thread.start()
+    results['follower'] = follower()
+    thread.join(5)
+    return results['leader'], results['follower']
+
+
+def test_single_flight_shares_results_and_errors():
+    flight = SingleFlight()
+    entered = threading.Event()
+    release = threading.Event()
+
+    def slow(value):
+        entered.set()
+        release.wait(5)
+        return value
+
+    def follower():
+        entered.wait(5)
+        timer = threading.Timer(0.2, release.set)
+        timer.start()
+        return flight.do('key', slow, 'follower')
+
+    assert run_concurrently(lambda: flight.do('key', slow, 'leader'), follower) == (('leader', True), ('leader', False))
+    assert flight.do('key', lambda: 'again') == ('again', True)
+
+    def fail():
+        raise KeyError('boom')
+
+    with pytest.raises(KeyError):
+        flight.do('key', fail)
+
+
+def test_single_flight_timeout_runs_func():
+    flight = SingleFlight()
+    release = threading.Event()
+    thread = threading.Thread(target=flight.do, args=('key', release.wait, 5))
+    thread.start()
+    while 'key' not in flight._calls:
+        time.sleep(0.001)
+    assert flight.do('key', lambda: 'own', timeout=0.01) == ('own', True)
+    release.set()
+    thread.join(5)
+
+
+def test_key_skips_private_and_other_methods():
+    coalescer = Coalescer(routes={'report'})
+    environ = make_environ('/report', query='a=1', HTTP_ACCEPT='text/html')
+    assert coalescer.key(environ, 'report') == ('/report', 'a=1', ('text/html', None, None))
+    assert coalescer.key(environ, 'other') is None
+    assert coalescer.key(make_environ('/report', 'POST'), 'report') is None
+    assert coalescer.key(make_environ('/report', HTTP_COOKIE='session=1'), 'report') is None
+    assert Coalescer(private=True).key(make_environ('/report', HTTP_COOKIE='session=1'), 'report') is not None
+
+
+def test_adapter_runs_identical_gets_once():
+    calls = []
+    entered = threading.Event()
+    release = threading.Event()
+
+    def report(context):
+        calls.append(1)
+        entered.set()
+        release.wait(5)
+        context.response.output.write('report')
+
+    adapter = Adapter({'report': report}, coalescer=Coalescer())
+
+    def follower():
+        entered.wait(5)
+        threading.Timer(0.2, release.set).start()
+        return call(adapter, make_environ('/report'))
+
+    assert run_concurrently(lambda: call(adapter, make_environ('/report')), follower) == (b'report', b'report')
+    assert calls == [1]
+
+
+def test_responses_with_cookies_are_not_shared():
+    coalescer = Coalescer()
+
+    def respond(environ, start_response):
+        start_response('200 OK', [('Set-Cookie', 'a=1')])
+        return [b'private']
+
+    assert coalescer._capture(make_environ('/'), respond).data is None
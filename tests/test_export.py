@@ -0,0 +1,63 @@
+import gzip
+import os
+
+import pytest
+
+from handywsgi import caching, export
+from handywsgi.adapter import Adapter
+
+
+PAGE = {'about': '<p>about</p>' * 50}
+
+
+def about(context):
+    context.response.output.write(PAGE['about'])
+
+
+@caching.cache(caching.NO_STORE)
+def me(context):
+    context.response.output.write('me')
+
+
+@pytest.fixture
+def adapter():
+    PAGE['about'] = '<p>about</p>' * 50
+    return Adapter({'about': about, 'me': me})
+
+
+def files(directory):
+    return sorted(
+            os.path.relpath(os.path.join(root, name), directory)
+            for root, _, names in os.walk(directory) for name in names
+            )
+
+
+def test_export_writes_pages_and_compressed_copies(adapter, tmp_path):
+    report = export.export(adapter, str(tmp_path), ['/robots.txt'])
+    assert {path: reason for path, _, reason in report} == {
+            '/robots.txt': None, '/': None, '/about': None, '/me': 'not cacheable'}
+    assert 'about/index.html.gz' in files(tmp_path)
+    with gzip.open(str(tmp_path / 'about' / 'index.html.gz')) as compressed:
+        assert compressed.read() == PAGE['about'].encode()
+
+
+def test_stale_files_are_removed(adapter, tmp_path):
+    export.export(adapter, str(tmp_path))
+    (tmp_path / 'me').mkdir()
+    (tmp_path / 'me' / 'index.html').write_text('old')
+    PAGE['about'] = 'short'
+    export.export(adapter, str(tmp_path))
+    assert files(tmp_path) == ['about/index.html', 'index.html']
+
+
+def test_query_strings_are_rejected_before_rendering(adapter, tmp_path):
+    with pytest.raises(ValueError):
+        export.export(adapter, str(tmp_path), ['/about?page=2'])
+    assert files(tmp_path) == []
+
+
+def test_cli_reports_bad_paths(capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        export.main(['nonexistent.module:app', 'out', '/x?y=1'])
+    assert exit_info.value.code == 2
+    assert 'query string' in capsys.readouterr().err
@@ -0,0 +1,48 @@
+from handywsgi import fast, status
+from handywsgi.adapter import Adapter
+from handywsgi.benchmark import make_environ
+from handywsgi.limits import RateLimiter
+from handywsgi.metrics import Metrics
+
+
+def request(adapter, path, method='GET'):
+    captured = []
+    body = adapter(make_environ(path, method), lambda status_line, headers, exc_info=None: captured.append((status_line, dict(headers))))
+    status_line, headers = captured[0]
+    return status_line, headers, b''.join(body)
+
+
+def test_text_and_redirect():
+    assert fast.text('ok') == ('200 OK', (('Content-Type', 'text/plain; charset=utf-8'), ('Content-Length', '2')), b'ok')
+    status_line, headers, body = fast.redirect('/')
+    assert status_line == status.Found.status
+    assert ('Location', '/') in headers and body == b''
+
+
+def test_fast_routes_skip_the_pipeline():
+    ready = [False]
+    metrics = Metrics()
+    adapter = Adapter(
+            {'healthz': lambda context: context.response.output.write('slow path')},
+            metrics=metrics,
+            rate_limiter=RateLimiter(rate=0.001, burst=1),
+            fast_routes={
+                '/healthz': fast.text('ok'),
+                '/ready': lambda environ: fast.text('ready') if ready[0] else fast.text('wait', code=status.ServiceUnavailable),
+                },
+            )
+    for _ in range(3):
+        assert request(adapter, '/healthz') == ('200 OK', {'Content-Type': 'text/plain; charset=utf-8', 'Content-Length': '2'}, b'ok')
+    assert request(adapter, '/ready')[0] == status.ServiceUnavailable.status
+    ready[0] = True
+    assert request(adapter, '/ready')[2] == b'ready'
+    assert 'route="healthz"' not in metrics.render()
+    # Only the exact path is a fast route.
+    assert request(adapter, '/healthz/')[2] == b'slow path'
+
+
+def test_head_gets_headers_without_body():
+    adapter = Adapter({}, fast_routes={'/healthz': fast.text('ok')})
+    status_line, headers, body = request(adapter, '/healthz', 'HEAD')
+    assert headers['Content-Length'] == '2'
+    assert body == b''
@@ -0,0 +1,95 @@
+import threading
+import time
+
+from handywsgi import status
+from handywsgi.adapter import Adapter
+from handywsgi.benchmark import make_environ
+from handywsgi.limits import ConcurrencyLimiter, RateLimiter
+
+
+def test_global_and_per_route_caps():
+    limiter = ConcurrencyLimiter(max_in_flight=2, per_route={'slow': 1})
+    assert limiter.acquire('slow')
+    assert not limiter.acquire('slow')
+    assert limiter.acquire('fast')
+    assert not limiter.acquire('fast')
+    limiter.release('slow')
+    assert limiter.acquire('fast')
+    assert 'handywsgi_shed_requests_total{route="fast"} 1' in list(limiter.collect())
+
+
+def test_queued_request_gets_released_slot():
+    limiter = ConcurrencyLimiter(max_in_flight=1, queue_size=1, queue_timeout=5.0)
+    assert limiter.acquire('a')
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(limiter.acquire('a')))
+    waiter.start()
+    while limiter._waiting == 0:
+        time.sleep(0.001)
+    # The queue is full, a third request is rejected at once.
+    assert not limiter.acquire('a')
+    limiter.release('a')
+    waiter.join(5)
+    assert acquired == [True]
+
+
+def test_queue_timeout_rejects():
+    limiter = ConcurrencyLimiter(max_in_flight=1, queue_size=1, queue_timeout=0.01)
+    assert limiter.acquire('a')
+    assert not limiter.acquire('a')
+
+
+def test_adapter_sheds_with_retry_after():
+    limiter = ConcurrencyLimiter(max_in_flight=1, retry_after=7)
+    captured = []
+
+    def nested(context):
+        # A second request while this one holds the only slot.
+        captured.append(b''.join(adapter(
+                make_environ('/nested'),
+                lambda status_line, headers, exc_info=None: captured.append((status_line, dict(headers)))
+                )))
+
+    adapter = Adapter({'nested': nested}, limiter=limiter)
+    adapter(make_environ('/nested'), lambda status_line, headers, exc_info=None: None)
+    (status_line, headers), body = captured
+    assert status_line == status.ServiceUnavailable.status
+    assert headers['Retry-After'] == '7'
+    assert limiter.acquire('nested')
+
+
+def test_rate_limiter_burst_then_refill(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    limiter = RateLimiter(rate=2, burst=3)
+    environ = make_environ('/')
+    assert [limiter.check(environ) for _ in range(3)] == [0, 0, 0]
+    assert limiter.check(environ) == 0.5
+    now[0] += 0.5
+    assert limiter.check(environ) == 0
+    # Other clients have their own bucket.
+    assert limiter.check(make_environ('/', REMOTE_ADDR='10.0.0.2')) == 0
+
+
+def test_rate_limiter_ignores_requests_without_key():
+    limiter = RateLimiter(rate=1, burst=1, key=lambda environ: environ.get('HTTP_X_API_KEY'))
+    environ = make_environ('/')
+    assert limiter.check(environ) == limiter.check(environ) == 0
+
+
+def test_rate_limiter_bounds_tracked_clients():
+    limiter = RateLimiter(rate=1, max_clients=8, shards=2)
+    for number in range(100):
+        limiter.check(make_environ('/', REMOTE_ADDR='10.0.0.{}'.format(number)))
+    assert sum(len(shard.buckets) for shard in limiter._shards) <= 8
+
+
+def test_adapter_answers_429_before_routing():
+    called = []
+    adapter = Adapter({'page': lambda context: called.append(1)}, rate_limiter=RateLimiter(rate=0.001, burst=1))
+    captured = []
+    for _ in range(2):
+        adapter(make_environ('/page'), lambda status_line, headers, exc_info=None: captured.append((status_line, dict(headers))))
+    assert captured[1][0] == status.TooManyRequests.status
+    assert int(captured[1][1]['Retry-After']) >= 1
+    assert called == [1]
@@ -0,0 +1,29 @@
+from handywsgi.benchmark import load
+
+
+def test_parse_mix():
+    assert load._parse_mix('static=5, upload') == {'static': 5, 'upload': 1}
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert load.percentile(values, 0.5) == 50.0
+    assert load.percentile(values, 0.99) == 99.0
+    assert load.percentile(values, 1.0) == 100.0
+    assert load.percentile(values, 0.0) == 1.0
+
+
+def test_run_against_threaded_server():
+    process, port = load.start_server('threaded')
+    try:
+        report = load.run('127.0.0.1', port, clients=2, duration=0.3, mix={'static': 2, 'upload': 1, 'missing/page': 1})
+    finally:
+        process.terminate()
+        process.join()
+    missing = report['missing/page']
+    assert missing['requests'] == 0 and missing['p50'] is None
+    assert missing['errors'] == report['all']['errors'] > 0
+    assert report['static']['requests'] > report['upload']['requests'] > 0
+    assert report['all']['requests'] == report['static']['requests'] + report['upload']['requests']
+    assert report['all']['throughput'] > 0
+    assert report['static']['p50'] <= report['static']['p99']
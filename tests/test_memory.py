@@ -0,0 +1,39 @@
+import tracemalloc
+
+from handywsgi.adapter import Adapter
+from handywsgi.benchmark import call, make_environ
+from handywsgi.memory import MemoryProfiler
+
+
+def allocate(context):
+    context.held = bytearray(1024 * 1024)
+    context.response.output.write('done')
+
+
+def test_sampled_request_records_peak():
+    memory = MemoryProfiler(sample_rate=1.0)
+    adapter = Adapter({'allocate': allocate}, memory=memory)
+    assert call(adapter, make_environ('/allocate')) == b'done'
+    usage = memory.usage('allocate')
+    assert usage.samples == 1
+    assert usage.max_peak >= 1024 * 1024
+    assert usage.sites
+    assert not tracemalloc.is_tracing()
+
+
+def test_unsampled_requests_are_not_traced():
+    memory = MemoryProfiler(sample_rate=0.0)
+    assert memory.start() is None
+    adapter = Adapter({'allocate': allocate}, memory=memory)
+    call(adapter, make_environ('/allocate'))
+    assert memory.usage('allocate') is None
+
+
+def test_one_sample_at_a_time():
+    memory = MemoryProfiler(sample_rate=1.0)
+    sample = memory.start()
+    try:
+        assert memory.start() is None
+    finally:
+        memory.stop(sample, 'a')
+    assert 'handywsgi_memory_samples_total{route="a"} 1' in list(memory.collect())
@@ -0,0 +1,53 @@
+from handywsgi.adapter import Adapter
+from handywsgi.benchmark import make_environ
+from handywsgi.metrics import Histogram, Metrics
+
+
+def hello(context):
+    context.response.output.write('hello')
+
+
+def get(adapter, path):
+    captured = []
+    body = adapter(make_environ(path), lambda status_line, headers, exc_info=None: captured.append((status_line, headers)))
+    return captured[0], b''.join(body).decode()
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value)
+    lines = list(histogram.expose('latency', route='a'))
+    assert lines == [
+            'latency_bucket{route="a",le="0.1"} 1',
+            'latency_bucket{route="a",le="1.0"} 2',
+            'latency_bucket{route="a",le="+Inf"} 3',
+            'latency_sum{route="a"} 5.55',
+            'latency_count{route="a"} 3',
+            ]
+
+
+def test_adapter_counts_requests_by_route_and_code():
+    adapter = Adapter({'hello': hello}, metrics=Metrics())
+    get(adapter, '/hello')
+    get(adapter, '/hello')
+    get(adapter, '/missing/page')
+    (status_line, headers), body = get(adapter, '/metrics')
+    assert status_line.startswith('200')
+    assert dict(headers)['Content-Type'].startswith('text/plain; version=0.0.4')
+    assert 'handywsgi_requests_total{route="hello",code="200"} 2' in body
+    assert 'handywsgi_requests_total{route="not_found",code="404"} 1' in body
+    assert 'handywsgi_phase_duration_seconds_count{route="hello",phase="handler"} 2' in body
+
+
+def test_prefix_applies_to_collectors():
+    class Collector:
+        def collect(self):
+            return ['# TYPE handywsgi_things gauge', 'handywsgi_things 3']
+
+    metrics = Metrics(prefix='app')
+    metrics.register(Collector())
+    body = metrics.render()
+    assert 'app_requests_total' in body
+    assert '# TYPE app_things gauge\napp_things 3\n' in body
+    assert 'handywsgi_' not in body
@@ -0,0 +1,39 @@
+import json
+
+from handywsgi.benchmark import micro
+
+
+def test_run_reports_every_case():
+    results = micro.run(['routing', 'adapter_get'], count=20, rounds=1)
+    assert sorted(results) == ['adapter_get', 'routing']
+    for result in results.values():
+        assert result['ops_per_sec'] > 0
+        assert result['peak_bytes'] >= 0
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    baseline = {
+            'fast': {'ops_per_sec': 1000, 'peak_bytes': 100},
+            'slow': {'ops_per_sec': 1000, 'peak_bytes': 100},
+            'fat': {'ops_per_sec': 1000, 'peak_bytes': 100},
+            }
+    results = {
+            'fast': {'ops_per_sec': 950, 'peak_bytes': 105},
+            'slow': {'ops_per_sec': 800, 'peak_bytes': 100},
+            'fat': {'ops_per_sec': 1000, 'peak_bytes': 200},
+            'new': {'ops_per_sec': 1, 'peak_bytes': 1},
+            }
+    regressions = micro.compare(results, baseline, 0.1)
+    assert len(regressions) == 2
+    assert regressions[0].startswith('fat:')
+    assert regressions[1].startswith('slow:')
+
+
+def test_main_fails_against_a_faster_baseline(tmp_path, capsys):
+    saved = tmp_path / 'baseline.json'
+    assert micro.main(['--only', 'routing', '--count', '20', '--rounds', '1', '--save', str(saved)]) == 0
+    baseline = json.loads(saved.read_text())
+    baseline['routing']['ops_per_sec'] *= 100
+    saved.write_text(json.dumps(baseline))
+    assert micro.main(['--only', 'routing', '--count', '20', '--rounds', '1', '--compare', str(saved)]) == 1
+    assert 'REGRESSION routing' in capsys.readouterr().out
@@ -0,0 +1,80 @@
+import operator
+import os
+import time
+
+import pytest
+
+from handywsgi import responses, status
+from handywsgi.adapter import Adapter
+from handywsgi.application import Application
+from handywsgi.benchmark import make_environ
+from handywsgi.offload import Offloader
+
+
+# Offloaded handlers are imported by the pool processes, so they live at module level.
+pool = Offloader(workers=1, timeout=30)
+
+
+class Echo(Application):
+
+    @pool.offload
+    def POST(cls, request):
+        body = '{} {} {} {}'.format(cls.__name__, request.query['name'][0], request.body.decode(), os.getpid())
+        return responses.Raw(body, content_type='text/plain', headers={'X-Method': request.method})
+
+
+@pytest.fixture
+def offloader():
+    offloader = Offloader(workers=1, timeout=0.2, max_pending=1)
+    yield offloader
+    offloader.shutdown(5)
+
+
+def pending(offloader):
+    line, = [line for line in offloader.collect() if line.startswith('handywsgi_offload_pending ')]
+    return int(line.split()[1])
+
+
+def test_submit_returns_result(offloader):
+    offloader.timeout = 30
+    assert offloader.submit(operator.add, 2, 3) == 5
+    assert pending(offloader) == 0
+
+
+def test_timed_out_call_stays_pending(offloader):
+    offloader.submit(operator.add, 0, 0)
+    with pytest.raises(status.GatewayTimeout):
+        offloader.submit(time.sleep, 1.0)
+    assert pending(offloader) == 1
+    with pytest.raises(status.ServiceUnavailable):
+        offloader.submit(operator.add, 1, 1)
+    deadline = time.monotonic() + 5
+    while pending(offloader) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert pending(offloader) == 0
+
+
+def test_adapter_close_shuts_the_pool_down(offloader):
+    offloader.timeout = 30
+    offloader.submit(operator.add, 1, 1)
+    assert Adapter({}, offloader=offloader).close(5)
+    assert offloader._executor is None
+
+
+def test_offloaded_handler_runs_in_another_process():
+    adapter = Adapter({'echo': Echo(None)}, offloader=pool)
+    captured = []
+    try:
+        body = adapter(
+                make_environ('/echo', 'POST', query='name=pdf', body=b'payload', content_type='application/octet-stream'),
+                lambda status_line, headers, exc_info=None: captured.append((status_line, dict(headers)))
+                )
+        status_line, headers = captured[0]
+        assert status_line == status.OK.status
+        assert headers['Content-Type'] == 'text/plain'
+        assert headers['X-Method'] == 'POST'
+        name, query, payload, pid = b''.join(body).decode().split()
+        assert (name, query, payload) == ('Echo', 'pdf', 'payload')
+        assert int(pid) != os.getpid()
+    finally:
+        assert adapter.close(10)
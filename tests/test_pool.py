@@ -0,0 +1,96 @@
+import os
+import threading
+
+import pytest
+
+from handywsgi.adapter import Adapter
+from handywsgi.benchmark import make_environ
+from handywsgi.pool import Pool, PoolCollector, PoolTimeout
+
+
+class Resource:
+
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    created = []
+
+    def factory():
+        created.append(Resource(len(created)))
+        return created[-1]
+
+    return Pool(factory, **kwargs), created
+
+
+def test_resources_are_reused():
+    pool, created = make_pool(size=2)
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    assert len(created) == 1
+
+
+def test_full_pool_times_out_then_hands_over():
+    pool, created = make_pool(size=1, timeout=0.01)
+    resource = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    threading.Timer(0.05, pool.release, args=(resource,)).start()
+    assert pool.acquire(timeout=5) is resource
+
+
+def test_broken_resources_are_closed_and_replaced():
+    pool, created = make_pool(size=1, check=lambda resource: resource.number > 0)
+    with pytest.raises(KeyError):
+        with pool.checkout():
+            raise KeyError('boom')
+    assert created[0].closed
+    resource = pool.acquire()
+    pool.release(resource)
+    # The first resource fails its check on checkout and is replaced.
+    assert pool.acquire() is resource
+    assert 'handywsgi_pool_discarded_total{pool=""} 1' in list(PoolCollector({'': pool}).collect())
+
+
+def test_close_idle():
+    pool, created = make_pool()
+    held = pool.acquire()
+    pool.release(pool.acquire())
+    pool.close_idle()
+    assert [resource.closed for resource in created] == [False, True]
+    pool.release(held)
+
+
+def test_forked_child_starts_empty():
+    pool, created = make_pool()
+    pool.release(pool.acquire())
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if pool.acquire() is not created[0] else 1)
+    assert os.waitpid(pid, 0)[1] == 0
+
+
+def test_context_resource_is_returned_after_the_response():
+    pool, created = make_pool(size=1)
+    seen = []
+
+    def handler(context):
+        seen.append(context.resource('db'))
+        assert context.resource('db') is seen[0]
+        if context.request.query.path == '/page/fail':
+            raise RuntimeError('boom')
+
+    adapter = Adapter({'page': handler}, pools={'db': pool})
+    body = adapter(make_environ('/page'), lambda status_line, headers, exc_info=None: None)
+    assert pool.samples()['resources'][0][1] == 1
+    body.close()
+    assert pool.samples()['resources'][0][1] == 0
+    with pytest.raises(RuntimeError):
+        adapter(make_environ('/page/fail'), lambda status_line, headers, exc_info=None: None)
+    assert created[0].closed
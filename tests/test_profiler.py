@@ -0,0 +1,63 @@
+import logging
+import os
+import pstats
+import time
+
+from handywsgi.adapter import Adapter
+from handywsgi.benchmark import call, make_environ
+from handywsgi.metrics import Metrics
+from handywsgi.profiler import Profiler
+
+
+def busy_wait(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def slow(context):
+    busy_wait(0.2)
+    context.response.output.write('done')
+
+
+def test_triggered_profiles_are_dumped_on_close(tmp_path):
+    profiler = Profiler(trigger_header='X-Profile', trigger_secret='s3cret', output_dir=str(tmp_path))
+    adapter = Adapter({'slow': slow}, profiler=profiler)
+    call(adapter, make_environ('/slow', HTTP_X_PROFILE='s3cret'))
+    call(adapter, make_environ('/slow', HTTP_X_PROFILE='wrong'))
+    assert os.listdir(str(tmp_path)) == []
+    adapter.close(5)
+    stats = pstats.Stats(str(tmp_path / 'slow.{}.pstats'.format(os.getpid())))
+    assert stats.total_calls > 0
+    assert profiler.dump() == []
+
+
+def test_forked_workers_dump_their_own_files(tmp_path):
+    profiler = Profiler(sample_rate=1.0, output_dir=str(tmp_path))
+    adapter = Adapter({'fast': lambda context: None}, profiler=profiler)
+    pid = os.fork()
+    if pid == 0:
+        call(adapter, make_environ('/fast'))
+        os._exit(0 if adapter.close(5) else 1)
+    call(adapter, make_environ('/fast'))
+    adapter.close(5)
+    assert os.waitpid(pid, 0)[1] == 0
+    assert sorted(os.listdir(str(tmp_path))) == sorted('fast.{}.pstats'.format(number) for number in (pid, os.getpid()))
+
+
+def test_unsampled_slow_requests_log_their_stack(caplog):
+    adapter = Adapter({'slow': slow}, profiler=Profiler(slow_threshold=0.05))
+    with caplog.at_level(logging.WARNING, logger='handywsgi.profiler'):
+        call(adapter, make_environ('/slow'))
+    message, = [record.getMessage() for record in caplog.records]
+    assert 'slow request: GET /slow' in message
+    assert '(busy_wait)' in message
+
+
+def test_collector_metrics_use_the_prefix():
+    metrics = Metrics(prefix='shop')
+    adapter = Adapter({'slow': slow}, metrics=metrics, profiler=Profiler(slow_threshold=0.05))
+    call(adapter, make_environ('/slow'))
+    exposition = metrics.render()
+    assert 'shop_slow_requests_total{route="slow"} 1' in exposition
+    assert 'handywsgi_' not in exposition
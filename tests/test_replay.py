@@ -0,0 +1,46 @@
+import time
+
+from handywsgi import replay
+from handywsgi.benchmark import call, make_environ
+
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [environ['wsgi.input'].read()]
+
+
+def test_record_and_read_back(tmp_path):
+    filename = str(tmp_path / 'traffic.rec')
+    recorder = replay.Recorder(app, filename)
+    assert call(recorder, make_environ('/a', 'POST', body=b'hello', HTTP_COOKIE='secret')) == b'hello'
+    call(recorder, make_environ('/b'))
+    assert recorder.close(5)
+    records = list(replay.read_records(filename))
+    assert [(environ['PATH_INFO'], body) for _, environ, body in records] == [('/a', b'hello'), ('/b', b'')]
+    assert 'HTTP_COOKIE' not in records[0][1]
+
+
+def test_truncated_tail_is_ignored(tmp_path):
+    filename = str(tmp_path / 'traffic.rec')
+    recorder = replay.Recorder(app, filename)
+    call(recorder, make_environ('/a'))
+    call(recorder, make_environ('/b'))
+    recorder.close(5)
+    with open(filename, 'rb') as records:
+        data = records.read()
+    for cut in range(1, 40):
+        with open(filename, 'wb') as records:
+            records.write(data[:-cut])
+        assert [environ['PATH_INFO'] for _, environ, _ in replay.read_records(filename)] == ['/a']
+
+
+def test_latency_is_measured_from_the_schedule():
+    def target(environ, body):
+        time.sleep(0.2)
+
+    # Two requests scheduled at once on one connection: the second one waits
+    # for the first, and that wait is part of its latency.
+    records = [(0.0, {'PATH_INFO': '/a'}, b''), (0.0, {'PATH_INFO': '/a'}, b'')]
+    report = replay.replay(records, target, speed=1.0, concurrency=1)
+    assert report['a']['requests'] == 2
+    assert report['a']['p99'] >= 0.39
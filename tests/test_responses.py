@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from handywsgi import responses, status
+from handywsgi.adapter import Adapter
+from handywsgi.application import Application
+from handywsgi.benchmark import make_environ
+
+
+def test_typed_response_is_abstract():
+    with pytest.raises(TypeError):
+        responses.TypedResponse()
+
+    class Empty(responses.TypedResponse):
+        pass
+
+    with pytest.raises(TypeError):
+        Empty()
+
+
+def test_json_sets_status_and_headers():
+    def app(context):
+        responses.JSON({'ok': True}, status=201, headers={'X-Id': '7'}).send(context)
+
+    captured = []
+    body = Adapter({'items': app})(make_environ('/items'), lambda *args: captured.append(args))
+    status_line, headers = captured[0][:2]
+    assert status_line == status.Created.status
+    assert ('X-Id', '7') in headers
+    assert ('Content-Type', 'application/json; charset=utf-8') in headers
+    assert json.loads(b''.join(body)) == {'ok': True}
+
+
+class Config:
+    default_template = 'page'
+    template_path = '.'
+    template_extension = 'html'
+
+
+class NoTemplates:
+
+    def load(self, name):
+        raise AssertionError('template {} loaded'.format(name))
+
+    render = load
+
+
+class Chunks:
+    """ An iterable that records how far it was read and whether it was closed. """
+
+    def __init__(self):
+        self.produced = []
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in ('one ', b'two'):
+            self.produced.append(chunk)
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+def serve(handler, method='GET'):
+    """ Run ``handler`` as the ``GET`` of an ``Application`` and return the status, headers and body. """
+    class Typed(Application):
+        GET = handler
+
+    app = Typed(Config())
+    app.templator = NoTemplates()
+    captured = []
+    body = Adapter({'typed': app})(
+            make_environ('/typed', method),
+            lambda status_line, headers, exc_info=None: captured.append((status_line, dict(headers)))
+            )
+    return captured[0][0], captured[0][1], body
+
+
+def test_application_sends_json_and_raw_without_rendering():
+    status_line, headers, body = serve(lambda self, context: responses.JSON({'a': [1]}, status=201))
+    assert status_line == status.Created.status
+    assert headers['Content-Type'] == 'application/json; charset=utf-8'
+    assert b''.join(body) == b'{"a":[1]}'
+    status_line, headers, body = serve(lambda self, context: responses.Raw('raw ✓', content_type='text/plain'))
+    assert headers['Content-Type'] == 'text/plain'
+    assert b''.join(body) == 'raw ✓'.encode('utf-8')
+
+
+def test_application_head_sends_headers_only():
+    status_line, headers, body = serve(lambda self, context: responses.JSON({'a': 1}), 'HEAD')
+    assert headers['Content-Type'] == 'application/json; charset=utf-8'
+    assert b''.join(body) == b''
+
+
+def test_application_stream_is_lazy_and_closed():
+    chunks = Chunks()
+    status_line, headers, body = serve(lambda self, context: responses.Stream(chunks))
+    assert headers['Content-Type'] == 'application/octet-stream'
+    assert chunks.produced == []
+    assert next(iter(body)) == b'one '
+    assert chunks.produced == ['one ']
+    assert list(body) == [b'two']
+    body.close()
+    assert chunks.closed
@@ -0,0 +1,65 @@
+import http.client
+import socket
+import threading
+
+import pytest
+
+from handywsgi import server
+
+
+def echo_length(environ, start_response):
+    body = environ['wsgi.input'].read()
+    start_response('200 OK', [('Content-Type', 'text/plain'), ('X-Threads', str(environ['handywsgi.threads']))])
+    return [str(len(body)).encode()]
+
+
+@pytest.fixture
+def address():
+    sock = server.bind(('127.0.0.1', 0))
+    httpd = server.ThreadPoolServer(sock, echo_length, threads=2, multiprocess=False, max_body=1000)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield sock.getsockname()[:2]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def post(address, body, chunked=False):
+    connection = http.client.HTTPConnection(*address, timeout=5)
+    try:
+        if chunked:
+            connection.putrequest('POST', '/')
+            connection.putheader('Transfer-Encoding', 'chunked')
+            connection.endheaders()
+            connection.send(b'%x\r\n%s\r\n0\r\n\r\n' % (len(body), body))
+        else:
+            connection.request('POST', '/', body=body)
+        response = connection.getresponse()
+        if response.status == 200:
+            assert response.getheader('X-Threads') == '2'
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def test_body_within_limit(address):
+    assert post(address, b'x' * 1000) == (200, b'1000')
+    assert post(address, b'x' * 1000, chunked=True) == (200, b'1000')
+
+
+def test_content_length_over_limit(address):
+    assert post(address, b'x' * 1001)[0] == 413
+
+
+def test_chunked_over_limit(address):
+    assert post(address, b'x' * 1001, chunked=True)[0] == 413
+
+
+def test_reuse_port_master_does_not_listen():
+    prefork = server.PreforkServer(echo_length, ('127.0.0.1', 0), workers=1, reuse_port=True)
+    try:
+        prefork.bind()
+        assert prefork.address[1]
+        assert not prefork.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ACCEPTCONN)
+    finally:
+        prefork.socket.close()
@@ -0,0 +1,70 @@
+import os
+import signal
+
+from handywsgi.adapter import Adapter
+from handywsgi.benchmark import call, make_environ
+from handywsgi.metrics import Metrics
+from handywsgi.shared import SharedStore
+
+
+def in_child(func):
+    """ Run ``func`` in a forked child and return its exit status. """
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            func()
+        except BaseException:
+            code = 1
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    return status
+
+
+def test_totals_add_up_across_processes():
+    store = SharedStore(slots=16, workers=4)
+    for _ in range(3):
+        assert in_child(lambda: store.add_many([(('requests', 'a'), 1), (('seconds', 'a'), 0.5)])) == 0
+    store.add(('requests', 'a'), 2)
+    assert store.totals() == {('requests', 'a'): 5, ('seconds', 'a'): 1.5}
+
+
+def test_columns_of_dead_processes_are_reused():
+    store = SharedStore(slots=4, workers=1)
+    for _ in range(3):
+        assert in_child(lambda: store.add(('n',))) == 0
+    assert store.totals() == {('n',): 3}
+    # The parent holds the only column now, a child finds none.
+    assert in_child(lambda: store.add(('n',))) != 0
+
+
+def test_killed_lock_holder_does_not_block_others():
+    store = SharedStore(slots=4, workers=4)
+
+    def die_holding_the_lock():
+        with store._shared_lock():
+            os.kill(os.getpid(), signal.SIGKILL)
+
+    assert os.WIFSIGNALED(in_child(die_holding_the_lock))
+    signal.alarm(5)
+    try:
+        store.add(('after',))
+    finally:
+        signal.alarm(0)
+    assert store.totals() == {('after',): 1}
+
+
+def test_full_store_drops_metrics_but_not_requests():
+    metrics = Metrics(store=SharedStore(slots=30, workers=2))
+    assert metrics.shared_slots(1) == 97
+    # A fast route fills 11 slots: two routes fit, the others and the one
+    # with a label too long for a key don't.
+    routes = ['route{}'.format(number) for number in range(5)] + ['x' * 200]
+    adapter = Adapter({route: (lambda context: context.response.output.write('ok')) for route in routes}, metrics=metrics)
+    for route in routes:
+        assert call(adapter, make_environ('/' + route)) == b'ok'
+    body = metrics.render()
+    assert 'handywsgi_requests_total{route="route1",code="200"} 1' in body
+    assert 'handywsgi_requests_total{route="route2",code="200"} 1' not in body
+    assert 'handywsgi_metrics_dropped_total 4' in body
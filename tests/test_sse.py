@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from handywsgi import sse
+from handywsgi.adapter import Adapter
+from handywsgi.benchmark import make_environ
+
+
+@pytest.fixture(autouse=True)
+def no_open_streams():
+    assert sse.EventStream.open_streams() == 0
+    yield
+    assert sse.EventStream.open_streams() == 0
+
+
+def start(adapter, method='GET'):
+    captured = []
+    body = adapter(make_environ('/events', method), lambda status_line, headers, exc_info=None: captured.append(status_line))
+    return captured[0], body
+
+
+def test_events_are_encoded():
+    def events(context):
+        sse.EventStream(iter(['one', sse.Event('two', event='note', id='2')]), heartbeat=None).send(context)
+
+    status_line, body = start(Adapter({'events': events}))
+    assert status_line.startswith('200')
+    assert b''.join(body) == b'data: one\n\nevent: note\nid: 2\ndata: two\n\n'
+    body.close()
+
+
+def test_head_starts_no_producer():
+    started = threading.Event()
+
+    def generate():
+        started.set()
+        yield 'never sent'
+
+    def events(context):
+        sse.EventStream(generate()).send(context)
+
+    threads = threading.active_count()
+    status_line, body = start(Adapter({'events': events}), 'HEAD')
+    assert list(body) == []
+    time.sleep(0.05)
+    assert not started.is_set()
+    assert threading.active_count() == threads
+
+
+def test_stop_event_ends_a_blocking_generator():
+    finished = threading.Event()
+
+    def generate(stopped):
+        try:
+            while not stopped.wait(10):
+                yield 'tick'
+        finally:
+            finished.set()
+
+    def events(context):
+        sse.EventStream(generate, heartbeat=0.05).send(context)
+
+    status_line, body = start(Adapter({'events': events}))
+    assert next(body) == sse.HEARTBEAT
+    body.close()
+    assert finished.wait(2)
+
+
+def test_max_duration_ends_the_stream():
+    def generate(stopped):
+        while not stopped.wait(0.01):
+            yield 'tick'
+
+    def events(context):
+        sse.EventStream(generate, heartbeat=0.05, max_duration=0.2).send(context)
+
+    status_line, body = start(Adapter({'events': events}))
+    started = time.monotonic()
+    chunks = list(body)
+    assert 0.15 < time.monotonic() - started < 1
+    assert chunks and all(chunk == b'data: tick\n\n' for chunk in chunks)
+    body.close()
+
+
+def test_stream_is_released_when_the_adapter_fails_after_send():
+    def events(context):
+        sse.EventStream(iter(['one']), heartbeat=None).send(context)
+
+    def broken_start_response(status_line, headers, exc_info=None):
+        raise RuntimeError('broken')
+
+    adapter = Adapter({'events': events})
+    with pytest.raises(RuntimeError):
+        adapter(make_environ('/events', **{'handywsgi.threads': 2}), broken_start_response)
+    body = adapter(
+            make_environ('/events', **{'handywsgi.threads': 2}),
+            lambda status_line, headers, exc_info=None: None
+            )
+    assert list(body) == [b'data: one\n\n']
+    body.close()
+
+
+def test_default_cap_is_half_the_server_threads():
+    def events(context):
+        sse.EventStream(iter(['one']), heartbeat=None).send(context)
+
+    adapter = Adapter({'events': events})
+    bodies = []
+    statuses = []
+    for _ in range(3):
+        bodies.append(adapter(
+                make_environ('/events', **{'handywsgi.threads': 4}),
+                lambda status_line, headers, exc_info=None: statuses.append(status_line)
+                ))
+    assert [status_line[:3] for status_line in statuses] == ['200', '200', '503']
+    for body in bodies:
+        if hasattr(body, 'close'):
+            body.close()
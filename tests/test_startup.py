@@ -0,0 +1,39 @@
+import subprocess
+import sys
+
+from handywsgi.adapter import Adapter
+from handywsgi.benchmark import call, make_environ, startup
+
+
+def test_adapter_import_defers_heavy_modules():
+    script = (
+            'import sys\n'
+            'import handywsgi.adapter, handywsgi.application\n'
+            'print(sorted(m for m in ("cgi", "email", "genshi", "handywsgi.content_type") if m in sys.modules))\n'
+            )
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == '[]'
+
+
+def test_lazy_imports_still_parse_forms():
+    def form(context):
+        context.response.output.write(context.request.wsgi.post_data.getvalue('name'))
+        context.response.output.write(' ' + context.response.content_type.value)
+
+    assert call(Adapter({'form': form}), make_environ('/form', 'POST', body=b'name=handy')) == \
+        b'handy text/html;charset=utf-8'
+
+
+def test_parse_importtime():
+    stderr = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   _io\n'
+            'import time:      1500 |       2000 | handywsgi.adapter\n'
+            )
+    assert startup.parse_importtime(stderr) == {'_io': (120, 120), 'handywsgi.adapter': (1500, 2000)}
+
+
+def test_run_once_times_a_fresh_interpreter():
+    seconds, modules = startup.run_once()
+    assert seconds > 0
+    assert 'handywsgi.adapter' in modules
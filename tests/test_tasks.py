@@ -0,0 +1,62 @@
+import threading
+
+from handywsgi.adapter import Adapter
+from handywsgi.benchmark import make_environ
+from handywsgi.tasks import TaskQueue, after_response
+
+
+def test_failed_task_is_counted_and_others_run():
+    tasks = TaskQueue(workers=2)
+    done = []
+
+    def fail():
+        raise RuntimeError('boom')
+
+    assert tasks.submit(fail)
+    assert tasks.submit(done.append, 1)
+    assert tasks.shutdown(5)
+    assert done == [1]
+    lines = list(tasks.collect())
+    assert 'handywsgi_tasks_total{outcome="completed"} 1' in lines
+    assert 'handywsgi_tasks_total{outcome="failed"} 1' in lines
+
+
+def test_full_or_closed_queue_drops():
+    tasks = TaskQueue(workers=1, max_queue=1)
+    release = threading.Event()
+    started = threading.Event()
+    assert tasks.submit(lambda: (started.set(), release.wait(5)))
+    started.wait(5)
+    assert tasks.submit(lambda: None)
+    assert not tasks.submit(lambda: None)
+    release.set()
+    assert tasks.shutdown(5)
+    assert not tasks.submit(lambda: None)
+    assert 'handywsgi_tasks_total{outcome="dropped"} 2' in list(tasks.collect())
+
+
+def test_callback_runs_once_on_close():
+    calls = []
+    body = after_response([b'a'], lambda: calls.append(1))
+    assert isinstance(body, list)
+    body.close()
+    body.close()
+    assert calls == [1]
+
+
+def test_add_task_runs_after_the_body_is_closed():
+    events = []
+
+    def handler(context):
+        context.add_task(events.append, 'task')
+        context.response.output.write('body')
+
+    for tasks in (None, TaskQueue(workers=1)):
+        del events[:]
+        adapter = Adapter({'page': handler}, tasks=tasks)
+        body = adapter(make_environ('/page'), lambda status_line, headers, exc_info=None: None)
+        events.append(b''.join(body))
+        body.close()
+        if tasks:
+            assert tasks.shutdown(5)
+        assert events == [b'body', 'task']
@@ -0,0 +1,33 @@
+import json
+
+from handywsgi.adapter import Adapter
+from handywsgi.benchmark import call, make_environ
+from handywsgi.tracing import Tracer
+
+
+def page(context):
+    with context.span('query', table=object()):
+        context.response.output.write('ok')
+
+
+def read_events(filename):
+    with open(filename) as trace_file:
+        text = trace_file.read()
+    return json.loads(text.rstrip().rstrip(',') + ']')
+
+
+def test_spans_are_written_by_close(tmp_path):
+    filename = str(tmp_path / 'trace.json')
+    tracer = Tracer(filename, sample_rate=1.0)
+    adapter = Adapter({'page': page}, tracer=tracer)
+    assert call(adapter, make_environ('/page')) == b'ok'
+    assert adapter.close(5)
+    names = [event['name'] for event in read_events(filename)]
+    assert 'request' in names and 'query' in names
+    query, = [event for event in read_events(filename) if event['name'] == 'query']
+    assert query['args']['table'].startswith('<object object')
+
+
+def test_default_samples_few_requests(tmp_path):
+    tracer = Tracer(str(tmp_path / 'trace.json'))
+    assert sum(tracer.start() is not None for _ in range(1000)) < 100